@@ -18,15 +18,49 @@ SRC_PATH = "spatial_access/src/"
 MATRIX_INTERFACE_SOURCES = ["Serializer.cpp",
                             "threadUtilities.cpp",
                             "tmxParser.cpp",
-                            "csvParser.cpp"]
+                            "csvParser.cpp",
+                            "mappedFile.cpp",
+                            "compressedChunks.cpp"]
+
+
+def has_zlib():
+    """
+    Returns True if a program using zlib compiles and links here.
+    Without it the extension is built unable to compress tmx or csv files.
+    """
+    import tempfile
+    from distutils.ccompiler import new_compiler
+    from distutils.errors import CompileError, LinkError
+    from distutils.sysconfig import customize_compiler
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'has_zlib.c')
+        with open(source, 'w') as source_file:
+            source_file.write('#include <zlib.h>\nint main(void) { return zlibVersion() == 0; }\n')
+        try:
+            objects = compiler.compile([source], output_dir=tmp_dir)
+            compiler.link_executable(objects, 'has_zlib', output_dir=tmp_dir, libraries=['z'])
+        except (CompileError, LinkError):
+            return False
+    return True
 
 
 def build_extension(extension_name, sources):
     full_path_sources = [SRC_PATH + src for src in sources]
+    define_macros = []
+    libraries = []
+    if has_zlib():
+        define_macros.append(('SPATIAL_ACCESS_HAS_ZLIB', None))
+        libraries.append('z')
+    else:
+        print('zlib not found: building spatial_access without tmx and csv compression')
     return Extension(name=extension_name, language='c++',
                      sources=full_path_sources,
                      extra_compile_args=['--std=c++11', '-O2', '-fomit-frame-pointer', "-g0"] + ouff_mac,
+                     define_macros=define_macros,
                      undef_macros=["NDEBUG"],
+                     libraries=libraries,
                      extra_link_args=ouff_mac)
 
 EXTENSION_SOURCES = [('_p2pExtension', ['_p2pExtension.cpp'] + MATRIX_INTERFACE_SOURCES)]
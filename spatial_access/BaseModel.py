@@ -2,7 +2,9 @@
 #
 # ©2017-2019, Center for Spatial Data Science
 
+import numpy as np
 import pandas as pd
+import scipy.sparse
 import geopandas as gpd
 from shapely.geometry import Point
 import matplotlib as mpl
@@ -198,6 +200,123 @@ class ModelData:
         """
         return set(self.get_all_dest_ids()) & set(self.get_transit_dest_ids())
 
+    def _get_common_source_locs(self):
+        """
+        Returns: (source_locs, source_ids), numpy array of the rows
+            of the transit matrix whose source id is also in the
+            source data, and the list of those ids.
+        """
+        common_source_ids = self.get_common_source_ids()
+        source_locs = []
+        source_ids = []
+        for source_loc, source_id in enumerate(self.get_transit_source_ids()):
+            if source_id in common_source_ids:
+                source_locs.append(source_loc)
+                source_ids.append(source_id)
+        return np.array(source_locs, dtype=np.int64), source_ids
+
+    def _get_dest_category_codes(self, categories):
+        """
+        Args:
+            categories: list of categories.
+        Returns: numpy array of the position in categories of the
+            category of each dest in the transit matrix, or -1 for
+            dests of other categories or without dest data.
+        """
+        category_codes = {category: code for code, category in enumerate(categories)}
+        dest_codes = self.dests['category'].map(category_codes).reindex(self.get_transit_dest_ids())
+        return dest_codes.fillna(-1).to_numpy(dtype=np.int64)
+
+    def _get_dest_capacities(self):
+        """
+        Returns: numpy array of the capacity of each dest in the
+            transit matrix, or 0 for dests without dest data.
+        """
+        dest_capacities = self.dests['capacity'].reindex(self.get_transit_dest_ids())
+        return dest_capacities.fillna(0).to_numpy(dtype=np.float64)
+
+    def _get_source_populations(self):
+        """
+        Returns: numpy array of the population of each source in
+            the transit matrix, or 0 for sources without source
+            data or with a negative population.
+        """
+        source_populations = self.sources['population'].reindex(self.get_transit_source_ids())
+        return source_populations.fillna(0).clip(lower=0).to_numpy(dtype=np.float64)
+
+    def _get_catchment_matrix(self, upper_threshold, decay=None):
+        """
+        Args:
+            upper_threshold: numeric, upper limit of what is
+                considered to be in range.
+            decay: optional function of a numpy array of times,
+                returning the weight of each.
+        Returns: scipy.sparse.csr_matrix of the sources x dests of
+            the transit matrix, with an entry for each pair in range:
+            1, or the decayed time of the pair.
+        """
+        matrix_interface = self.transit_matrix.matrix_interface
+        row_starts, dest_locs, times = matrix_interface.get_values_in_range(upper_threshold)
+        if decay is None:
+            weights = np.ones(len(times))
+        else:
+            weights = decay(times)
+        shape = (len(row_starts) - 1, len(self.get_transit_dest_ids()))
+        return scipy.sparse.csr_matrix((weights, dest_locs.astype(np.int64), row_starts.astype(np.int64)),
+                                       shape=shape)
+
+    def _get_dest_supply_ratios(self, catchment):
+        """
+        The first step of the two step floating catchment
+        area method.
+        Args:
+            catchment: sparse matrix from _get_catchment_matrix.
+        Returns: (population_in_range, supply_ratios), numpy arrays of
+            the (weighted) population in range of each dest in the
+            transit matrix, and the capacity of each dest over that
+            population, or 0 where there is no population in range.
+        """
+        population_in_range = catchment.T @ self._get_source_populations()
+        supply_ratios = np.zeros(len(population_in_range))
+        np.divide(self._get_dest_capacities(), population_in_range,
+                  out=supply_ratios, where=population_in_range > 0)
+        return population_in_range, supply_ratios
+
+    @staticmethod
+    def _cast_zero_columns_to_int(data_frame, columns=None):
+        """
+        Cast the columns of data_frame that are 0 throughout to int64,
+        the dtype results summed pair by pair had when nothing was
+        added to them.
+        Args:
+            data_frame: DataFrame, cast in place.
+            columns: list of numeric columns to consider, defaults
+                to all of them.
+        """
+        if columns is None:
+            columns = data_frame.columns
+        for column in columns:
+            if not data_frame[column].any():
+                data_frame[column] = data_frame[column].astype(np.int64)
+
+    @staticmethod
+    def _tidy_threshold_results(ids, thresholds, values, column_names):
+        """
+        Args:
+            ids: list of ids.
+            thresholds: list of thresholds.
+            values: numpy array of ids x columns x thresholds.
+            column_names: list of the name of each column.
+        Returns: DataFrame with a row for each id and threshold,
+            of the id, the threshold and the value of each column.
+        """
+        num_thresholds = len(thresholds)
+        tidy_values = values.transpose(0, 2, 1).reshape(len(ids) * num_thresholds, len(column_names))
+        results = pd.DataFrame(tidy_values, columns=column_names)
+        results.insert(0, 'id', pd.Index(ids).repeat(num_thresholds))
+        results.insert(1, 'threshold', np.tile(thresholds, len(ids)))
+        return results
+
     def _missing_transit_data_warning(self, id_type):
         """
         Throws an error to the log if there are source or destination IDs in your data
@@ -58,7 +58,10 @@ class Configs:
                  use_meters=False,
                  disable_area_threshold=False,
                  require_extended_range=False,
-                 epsilon=0.05
+                 epsilon=0.05,
+                 use_sparse_storage=False,
+                 search_batch_size=1,
+                 use_contraction_hierarchy=False
                  ):
         """
         Args:
@@ -77,6 +80,19 @@ class Configs:
             epsilon: numeric, factor by which to increase the requested bounding box.
                 Increasing epsilon may result in increased accuracy for points
                 at the edge of the bounding box, but will increase computation times.
+            use_sparse_storage: boolean, store only the defined values of the
+                transit matrix. Saves memory when most values are undefined, as
+                when computing with a max_impedance.
+            search_batch_size: integer between 1 and 32, number of sources
+                searched together by each worker. Batches share scans of
+                the network, which only pays off when the sources of a
+                batch are close together on it; for scattered sources,
+                the usual layout, batching is slower. Leave at 1 unless
+                measured otherwise.
+            use_contraction_hierarchy: boolean, preprocess the network into
+                a contraction hierarchy (cached in data/osm_query_cache) and
+                answer queries on it. Much faster when the same network is
+                processed repeatedly.
         """
         self.ONE_HOUR = 3600  # seconds
         self.ONE_KM = 1000  # meters
@@ -93,6 +109,9 @@ class Configs:
         self.disable_area_threshold = disable_area_threshold
         self.require_extended_range = require_extended_range
         self.epsilon = epsilon
+        self.use_sparse_storage = use_sparse_storage
+        self.search_batch_size = search_batch_size
+        self.use_contraction_hierarchy = use_contraction_hierarchy
 
         if speed_limit_dict is None:
             self.speed_limit_dict = Configs.DEFAULT_SPEED_LIMITS
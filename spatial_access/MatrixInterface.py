@@ -6,6 +6,7 @@ import multiprocessing
 import time
 import os
 import csv
+import numpy as np
 
 from spatial_access.SpatialAccessExceptions import WriteCSVFailedException
 from spatial_access.SpatialAccessExceptions import WriteTMXFailedException
@@ -17,6 +18,7 @@ from spatial_access.SpatialAccessExceptions import IndecesNotFoundException
 from spatial_access.SpatialAccessExceptions import SourceNotBuiltException
 from spatial_access.SpatialAccessExceptions import UnableToBuildMatrixException
 from spatial_access.SpatialAccessExceptions import UnexpectedShapeException
+from spatial_access.SpatialAccessExceptions import MatrixNotDenseException
 from spatial_access._parsers import BaseParser, IntStringParser, StringIntParser, StringStringParser
 
 try:
@@ -24,6 +26,9 @@ try:
 except ImportError:
     raise SourceNotBuiltException()
 
+# blocks of rows a lazy tmx reader keeps in memory by default
+DEFAULT_LAZY_CACHE_BLOCKS = 64
+
 
 class MatrixInterface:
     """
@@ -43,6 +48,7 @@ class MatrixInterface:
         self.primary_ids_are_string = False
         self.secondary_ids_are_string = False
         self.is_extended = require_extended_range
+        self.is_lazy = False
         self._parser = None
         self._map_id_type_enum_to_is_string_boolean = {
             0: False,
@@ -53,13 +59,18 @@ class MatrixInterface:
             1: True
         }
 
-    def _read_tmx(self, filename):
+    def _read_tmx(self, filename, memory_map=False, lazy=False, cache_blocks=DEFAULT_LAZY_CACHE_BLOCKS):
         """
         Read the transit matrix from binary format.
         (suitable for quickly saving/reloading for
         extended computations).
         Args:
             filename: filename with .tmx extension
+            memory_map: if True, serve values from a read-only
+                memory mapping of the file instead of loading it.
+            lazy: if True, read only the ids, and read values
+                from the file as they are requested.
+            cache_blocks: blocks of rows a lazy reader keeps in memory.
         Raises:
             ReadTMXFailedException: file does not exist or is corrupted.
         """
@@ -75,18 +86,26 @@ class MatrixInterface:
             tmx_type_reader.get_value_type_enum()]
 
         self._load_parser()
+        if lazy:
+            try:
+                self.transit_matrix = self._get_lazy_extension()(self._parser.encode_filename(filename),
+                                                                 cache_blocks)
+            except BaseException:
+                raise ReadTMXFailedException("Unable to lazily read tmx from {}".format(filename))
+            self.is_lazy = True
+            return
         self._load_extension()
 
         try:
-            self.transit_matrix.readTMX(self._parser.encode_filename(filename))
+            self.transit_matrix.readTMX(self._parser.encode_filename(filename), memory_map)
         except BaseException:
             raise ReadTMXFailedException("Unable to read tmx from {}".format(filename))
 
     def _read_csv(self, filename):
         """
-        Read the transit matrix from MxN csv. Warning:
-        you shouldn't use this method! It can be up to 1000x slower
-        than the tmx format.
+        Read the transit matrix from MxN csv. Rows are parsed
+        in parallel, but tmx files are still smaller and faster
+        to read.
         Args:
             filename: filename with .csv extension
         Raises:
@@ -116,13 +135,23 @@ class MatrixInterface:
         except BaseException:
             raise ReadCSVFailedException(filename)
 
-    def read_file(self, filename):
+    def read_file(self, filename, memory_map=False, lazy=False, cache_blocks=DEFAULT_LAZY_CACHE_BLOCKS):
         """
         Read the transit matrix from binary format.
         (suitable for quickly saving/reloading for
         extended computations).
         Args:
             filename: filename with .tmx or .csv extension
+            memory_map: if True, a tmx written with the contiguous
+                layout is memory mapped (read-only) instead of being
+                loaded. Concurrent readers share the mapped pages.
+            lazy: if True, a tmx written with the contiguous or
+                compressed layout is not loaded: only its ids are read,
+                and get_values_by_source/get_values_by_dest read blocks
+                of rows from the file on demand. The matrix is then
+                read only, and cannot be viewed as an array.
+            cache_blocks: number of most recently used blocks of rows
+                a lazy reader keeps in memory.
         Raises:
             UnrecognizedFileTypeException: filename without .tmx or .csv
                 extension.
@@ -131,7 +160,7 @@ class MatrixInterface:
             raise FileNotFoundError(filename)
         extension = filename.split('.')[-1]
         if extension == 'tmx':
-            self._read_tmx(filename)
+            self._read_tmx(filename, memory_map, lazy, cache_blocks)
         elif extension == 'csv':
             self._read_csv(filename)
         else:
@@ -141,31 +170,106 @@ class MatrixInterface:
         """
         Returns: all source IDs from transit matrix
         """
-        return self.transit_matrix.getRowIds()
+        return self._parser.decode_vector_source_ids(self.transit_matrix.getRowIds())
 
     def get_dest_ids(self):
         """
         Returns: all destination IDs from transit matrix
         """
-        return self.transit_matrix.getColIds()
+        return self._parser.decode_vector_dest_ids(self.transit_matrix.getColIds())
+
+    def get_value_array(self):
+        """
+        Returns: a numpy.ndarray view of the matrix values, without
+            copying. Rows follow get_source_ids() and columns follow
+            get_dest_ids(). For a compressible matrix the view is the
+            1-D upper triangle; use get_compressed_index to locate
+            values in it. Undefined values are the maximum of the
+            dtype. The view is read-only if the matrix is memory mapped.
+        Raises:
+            MatrixNotDenseException: the matrix uses sparse storage,
+                or is read lazily.
+        """
+        if self.is_lazy:
+            raise MatrixNotDenseException("lazily read matrices cannot be viewed as an array")
+        if self.transit_matrix.getIsSparse():
+            raise MatrixNotDenseException("sparse matrices cannot be viewed as an array")
+        return np.asarray(self.transit_matrix)
 
-    def write_tmx(self, filename):
+    def get_compressed_index(self, source_locs, dest_locs):
+        """
+        Args:
+            source_locs: int or array of positions in get_source_ids().
+            dest_locs: int or array of positions in get_dest_ids().
+        Returns: the positions of the given (source, dest) pairs in
+            the array returned by get_value_array() for a compressible
+            matrix. Pairs below the diagonal map to their mirror.
+        """
+        source_locs = np.asarray(source_locs, dtype=np.int64)
+        dest_locs = np.asarray(dest_locs, dtype=np.int64)
+        row_locs = np.minimum(source_locs, dest_locs)
+        col_locs = np.maximum(source_locs, dest_locs)
+        rows = self.transit_matrix.getNumRows()
+        row_deltas = rows - row_locs
+        return rows * (rows + 1) // 2 - row_deltas * (row_deltas + 1) // 2 + col_locs - row_locs
+
+    def get_value_rows(self, source_locs):
+        """
+        Args:
+            source_locs: array of positions in get_source_ids().
+        Returns: a 2-D numpy.ndarray copy of the given rows, with
+            columns following get_dest_ids(), whatever the storage
+            of the matrix. Undefined values are the maximum of the
+            dtype.
+        """
+        source_locs = np.ascontiguousarray(source_locs, dtype=np.int64)
+        if self.is_lazy or self.transit_matrix.getIsSparse():
+            return self.transit_matrix.getValueRows(source_locs)
+        num_cols = self.transit_matrix.getNumCols()
+        values = self.get_value_array()
+        if self.transit_matrix.getIsCompressible():
+            return values[self.get_compressed_index(source_locs[:, np.newaxis],
+                                                    np.arange(num_cols)[np.newaxis, :])]
+        return values[source_locs]
+
+    def write_tmx(self, filename, compression_level=None):
         """
         Write the transit matrix to binary format.
         (suitable for quickly saving/reloading for
         extended computations).
         Args:
             filename: tmx filename.
+            compression_level: optional integer from 1 (fastest) to
+                9 (smallest). If given, dense values are written as
+                zlib compressed chunks of rows, compressed in parallel.
+                Sparse matrices are always written uncompressed.
         Raises:
-            WriteTMXFailedException: unable to write tmx.
+            WriteTMXFailedException: unable to write tmx, or
+                compression_level is given but the extension was
+                built without zlib.
         """
+        if compression_level is not None and not _p2pExtension.compressionAvailable():
+            raise WriteTMXFailedException('spatial_access was built without zlib, '
+                                          'so compression_level is not supported')
         start = time.time()
         try:
-            self.transit_matrix.writeTMX(self._parser.encode_filename(filename))
+            if compression_level is None:
+                self.transit_matrix.writeTMX(self._parser.encode_filename(filename))
+            else:
+                self.transit_matrix.writeCompressedTMX(self._parser.encode_filename(filename),
+                                                       compression_level, self._get_thread_limit())
         except BaseException:
             raise WriteTMXFailedException(filename)
         if self.logger:
-            self.logger.info('Wrote to {} in {:,.2f} seconds'.format(filename, time.time() - start))
+            elapsed = time.time() - start
+            if self.transit_matrix.getIsSparse():
+                self.logger.info('Wrote to {} in {:,.2f} seconds'.format(filename, elapsed))
+            else:
+                value_bytes = self.get_value_array().nbytes
+                file_bytes = os.path.getsize(filename)
+                self.logger.info('Wrote to {} in {:,.2f} seconds ({:,.1f} MB/s, compression ratio {:,.2f})'
+                                 .format(filename, elapsed, value_bytes / max(elapsed, 1e-9) / 1e6,
+                                         value_bytes / max(file_bytes, 1)))
 
     def add_edges_to_graph(self, from_column, to_column, edge_weight_column,
                            is_bidirectional_column):
@@ -175,8 +279,13 @@ class MatrixInterface:
             to_column: array of integers, network node ids.
             edge_weight_column: array of integers, edge weights.
             is_bidirectional_column:, array of booleans, is the edge bidirectional.
+        Contiguous uint64 node columns and a bool bidirectional column are
+        read by the extension without being copied.
         """
-        self.transit_matrix.addEdgesToGraph(from_column, to_column, edge_weight_column, is_bidirectional_column)
+        self.transit_matrix.addEdgesToGraph(from_column,
+                                            to_column,
+                                            self._as_value_array(edge_weight_column),
+                                            is_bidirectional_column)
 
     def read_otp(self, filename):
         """
@@ -268,6 +377,63 @@ class MatrixInterface:
                                                        self._parser.encode_dest_id(user_id),
                                                        weight)
 
+    def add_user_source_data_bulk(self, network_ids, user_ids, weights, is_also_dest):
+        """
+        Add many of the user's source data points to the pyTransitMatrix
+        in one call. Arrays are passed to the extension without per-point
+        conversion.
+        Args:
+            network_ids: array of int, osm node locs
+            user_ids: array of string or int
+            weights: array of int, edge weights
+            is_also_dest: boolean, true for symmetric matrices
+        """
+        network_ids = np.ascontiguousarray(network_ids, dtype=np.uint64)
+        weights = self._as_value_array(weights)
+        if self.primary_ids_are_string:
+            source_ids = self._parser.encode_vector_source_ids(user_ids)
+        else:
+            source_ids = np.ascontiguousarray(user_ids, dtype=np.uint64)
+        self.transit_matrix.addToUserSourceDataContainerBulk(network_ids, source_ids, weights)
+        if is_also_dest:
+            if self.secondary_ids_are_string:
+                dest_ids = self._parser.encode_vector_dest_ids(user_ids)
+            else:
+                dest_ids = np.ascontiguousarray(user_ids, dtype=np.uint64)
+            self.transit_matrix.addToUserDestDataContainerBulk(network_ids, dest_ids, weights)
+
+    def add_user_dest_data_bulk(self, network_ids, user_ids, weights):
+        """
+        Add many of the user's dest data points to the pyTransitMatrix
+        in one call. Arrays are passed to the extension without per-point
+        conversion.
+        Args:
+            network_ids: array of int, osm node locs
+            user_ids: array of string or int
+            weights: array of int, edge weights
+        """
+        network_ids = np.ascontiguousarray(network_ids, dtype=np.uint64)
+        weights = self._as_value_array(weights)
+        if self.secondary_ids_are_string:
+            dest_ids = self._parser.encode_vector_dest_ids(user_ids)
+        else:
+            dest_ids = np.ascontiguousarray(user_ids, dtype=np.uint64)
+        self.transit_matrix.addToUserDestDataContainerBulk(network_ids, dest_ids, weights)
+
+    def _as_value_array(self, values):
+        """
+        Args:
+            values: array of int.
+        Returns: values as a contiguous array of the matrix value type.
+        Raises:
+            OverflowError: a value does not fit in the matrix value type.
+        """
+        dtype = np.uint32 if self.is_extended else np.uint16
+        values = np.asarray(values)
+        if len(values) > 0 and (values.min() < 0 or values.max() > np.iinfo(dtype).max):
+            raise OverflowError("value out of range for {}".format(np.dtype(dtype).name))
+        return np.ascontiguousarray(values, dtype=dtype)
+
     def _load_parser(self):
         """
         Load the relevant variant of parser.
@@ -304,13 +470,38 @@ class MatrixInterface:
             elif not self.primary_ids_are_string and not self.secondary_ids_are_string:
                 return _p2pExtension.pyTransitMatrixIxIxUS
 
+    def _get_lazy_extension(self):
+        """
+        Returns: class of lazy tmx reader.
+        """
+        if self.is_extended:
+            if self.primary_ids_are_string and self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderSxSxUI
+            elif self.primary_ids_are_string and not self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderSxIxUI
+            elif not self.primary_ids_are_string and self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderIxSxUI
+            elif not self.primary_ids_are_string and not self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderIxIxUI
+        else:
+            if self.primary_ids_are_string and self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderSxSxUS
+            elif self.primary_ids_are_string and not self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderSxIxUS
+            elif not self.primary_ids_are_string and self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderIxSxUS
+            elif not self.primary_ids_are_string and not self.secondary_ids_are_string:
+                return _p2pExtension.pyLazyTMXReaderIxIxUS
+
     def _load_extension(self):
         """
         Load the relevant variant of extension.
         """
         self.transit_matrix = self._get_extension()()
+        self.is_lazy = False
 
-    def prepare_matrix(self, is_symmetric, is_compressible, rows, columns, network_vertices):
+    def prepare_matrix(self, is_symmetric, is_compressible, rows, columns, network_vertices,
+                       is_sparse=False):
         """
         Instantiate a pyTransitMatrix.
         Args:
@@ -321,42 +512,70 @@ class MatrixInterface:
             rows: number of user rows.
             columns: number of user columns.
             network_vertices: number of vertices in osm network.
+            is_sparse: boolean, if true only the defined values of each row
+                are stored. Use with build_matrix(max_impedance) when most
+                cells will be beyond the threshold. Sparse matrices
+                can't also be is_compressible.
 
         Raises:
             UnexpectedShapeException: if a matrix is symmetric but has mismatched rows and
-                columns, or if matrix is marked is_compressible but not is_symmetric.
+                columns, if matrix is marked is_compressible but not is_symmetric, or if
+                matrix is marked both is_compressible and is_sparse.
         """
         if is_symmetric and rows != columns:
             raise UnexpectedShapeException("Symmetric matrices should be nxn, not {}x{}".format(rows, columns))
         if is_compressible and not is_symmetric:
             raise UnexpectedShapeException("If matrix is compressible, it is also symmetric")
+        if is_compressible and is_sparse:
+            raise UnexpectedShapeException("Sparse matrices are not compressible")
         if is_symmetric:
             self.secondary_ids_are_string = self.primary_ids_are_string
 
         self._load_parser()
 
-        self.transit_matrix = self._get_extension()(is_compressible, is_symmetric, rows, columns)
+        self.transit_matrix = self._get_extension()(is_compressible, is_symmetric, rows, columns, is_sparse)
 
         self.transit_matrix.prepareGraphWithVertices(network_vertices)
 
-    def write_csv(self, filename):
+    def write_csv(self, filename, compression_level=None):
         """
         Args:
             filename: file to write the transit matrix to.
+            compression_level: optional integer from 1 (fastest) to
+                9 (smallest). If given, the csv is written gzipped,
+                as blocks of rows compressed in parallel.
         Raises:
             WriteCSVFailedException: transit matrix encountered an
-                internal error.
+                internal error, or compression_level is given but the
+                extension was built without zlib.
         """
+        if compression_level is not None and not _p2pExtension.compressionAvailable():
+            raise WriteCSVFailedException('spatial_access was built without zlib, '
+                                          'so compression_level is not supported')
         start = time.time()
         try:
-            self.transit_matrix.writeCSV(self._parser.encode_filename(filename))
+            self.transit_matrix.writeCSV(self._parser.encode_filename(filename),
+                                         0 if compression_level is None else compression_level,
+                                         self._get_thread_limit())
         except BaseException:
             raise WriteCSVFailedException(filename)
         if self.logger:
             self.logger.info('Wrote to {} in {:,.2f} seconds'.format(filename, time.time() - start))
 
-    def build_matrix(self):
+    def build_matrix(self, max_impedance=None, search_batch_size=1):
         """
+        Args:
+            max_impedance: optional integer. If given, each shortest path
+                search stops once it passes this value and every cell
+                beyond it is left undefined. Use this when only values
+                up to a threshold will be consumed.
+            search_batch_size: integer between 1 and 32, number of sources
+                each worker searches together, sharing one scan of the
+                network. 1 searches one source at a time. Batching only
+                helps when the sources of a batch are close together on
+                the network; for scattered sources it is slower (0.4-0.8x
+                in benchmarks/batchedSearchBenchmark.cpp). Ignored when
+                a contraction hierarchy has been prepared.
         Raises:
             UnableToBuildMatrixException: transit matrix encountered
                 an internal error.
@@ -367,8 +586,13 @@ class MatrixInterface:
         thread_limit = self._get_thread_limit()
         if self.logger:
             self.logger.debug('Processing matrix with {} threads'.format(thread_limit))
+            if max_impedance is not None:
+                self.logger.debug('Bounding searches at {}'.format(max_impedance))
+            if search_batch_size > 1:
+                self.logger.debug('Searching {} sources per batch'.format(search_batch_size))
         try:
-            self.transit_matrix.compute(thread_limit)
+            self.transit_matrix.setSearchBatchSize(search_batch_size)
+            self.transit_matrix.compute(thread_limit, max_impedance)
         except BaseException:
             raise UnableToBuildMatrixException()
 
@@ -376,6 +600,92 @@ class MatrixInterface:
         if self.logger:
             self.logger.debug('Shortest path matrix computed in {:,.2f} seconds'
                               .format(logger_vars))
+            settled_vertex_counts = self.transit_matrix.getSettledVertexCounts()
+            if len(settled_vertex_counts) > 0:
+                self.logger.debug('Settled {:,.1f} vertices per source on average (max: {:,})'
+                                  .format(sum(settled_vertex_counts) / len(settled_vertex_counts),
+                                          max(settled_vertex_counts)))
+            for thread, (busy, idle) in enumerate(self.get_thread_times()):
+                self.logger.debug('Thread {}: {:,.2f} seconds busy, {:,.2f} seconds idle'
+                                  .format(thread, busy, idle))
+
+    def get_network_checksum(self):
+        """
+        Returns: integer identifying the network added with
+            add_edges_to_graph (its vertices, edges and weights).
+            Preprocessed data is only valid for a matching checksum.
+        """
+        return self.transit_matrix.getGraphChecksum()
+
+    def prepare_contraction_hierarchy(self, filename=None):
+        """
+        Preprocess the network into a contraction hierarchy, which
+        build_matrix then uses to answer every source/dest query
+        instead of searching the whole network from each source.
+        Must be called after the network has been added.
+        Args:
+            filename: optional string. If a hierarchy for this network
+                was written here, read it instead of preprocessing
+                again. Otherwise the new hierarchy is written here.
+        """
+        start_time = time.time()
+        if filename is not None and os.path.exists(filename):
+            try:
+                self.transit_matrix.readContractionHierarchy(self._parser.encode_filename(filename))
+                if self.logger:
+                    self.logger.debug('Read contraction hierarchy from {} in {:,.2f} seconds'
+                                      .format(filename, time.time() - start_time))
+                return
+            except BaseException:
+                if self.logger:
+                    self.logger.warning('Unable to use contraction hierarchy in {}, rebuilding'
+                                        .format(filename))
+        self.transit_matrix.buildContractionHierarchy()
+        if self.logger:
+            self.logger.debug('Built contraction hierarchy with {:,} shortcuts in {:,.2f} seconds'
+                              .format(self.transit_matrix.getNumShortcuts(), time.time() - start_time))
+        if filename is not None:
+            try:
+                self.transit_matrix.writeContractionHierarchy(self._parser.encode_filename(filename))
+            except BaseException:
+                if self.logger:
+                    self.logger.warning('Unable to write contraction hierarchy to {}'.format(filename))
+
+    def get_settled_vertex_counts(self):
+        """
+        Returns: a source_id->int map of the number of network
+            vertices settled by the shortest path search for
+            each source during the last build_matrix.
+        """
+        settled_vertex_counts = self.transit_matrix.getSettledVertexCounts()
+        source_ids = self._parser.decode_vector_source_ids(self.transit_matrix.getRowIds())
+        return dict(zip(source_ids, settled_vertex_counts))
+
+    def get_thread_times(self):
+        """
+        Returns: a list with one (busy_seconds, idle_seconds) tuple
+            per worker thread of the last build_matrix. Busy time
+            was spent searching; idle time waiting for other threads.
+        """
+        return list(zip(self.transit_matrix.getThreadBusySeconds(),
+                        self.transit_matrix.getThreadIdleSeconds()))
+
+    def get_in_range_index(self, threshold):
+        """
+        Args:
+            threshold: integer, max value for pairs "in range".
+        Returns:
+            (source_starts, dest_locs, dest_starts, source_locs),
+                numpy arrays indexing the pairs in range both ways,
+                built in one pass over the matrix. The dests in range
+                of source row r are the columns
+                dest_locs[source_starts[r]:source_starts[r + 1]], and
+                the sources in range of dest column c are the rows
+                source_locs[dest_starts[c]:dest_starts[c + 1]], both
+                ascending. Rows follow get_source_ids() and columns
+                follow get_dest_ids().
+        """
+        return self.transit_matrix.getInRangeIndex(threshold, self._get_thread_limit())
 
     def get_dests_in_range(self, threshold):
         """
@@ -386,7 +696,8 @@ class MatrixInterface:
                 map for dests under threshold distance
                 from source.
         """
-        return self._parser.decode_source_to_dest_array_dict(self.transit_matrix.getDestsInRange(threshold))
+        return self._parser.decode_source_to_dest_array_dict(self.transit_matrix.getDestsInRange(threshold,
+                                                                                               self._get_thread_limit()))
 
     def get_sources_in_range(self, threshold):
         """
@@ -397,7 +708,8 @@ class MatrixInterface:
                 map for sources under threshold distance
                 from dest.
         """
-        return self._parser.decode_dest_to_source_array_dict(self.transit_matrix.getSourcesInRange(threshold))
+        return self._parser.decode_dest_to_source_array_dict(self.transit_matrix.getSourcesInRange(threshold,
+                                                                                                 self._get_thread_limit()))
 
     def _get_value_by_id(self, source_id, dest_id):
         """
@@ -452,6 +764,140 @@ class MatrixInterface:
                                                                     self._parser.encode_category(category),
                                                                     threshold)
 
+    def time_to_nearest_dest_by_category(self, dest_categories, num_categories):
+        """
+        Args:
+            dest_categories: array of the category code of each dest,
+                following get_dest_ids(). Dests with a code outside
+                [0, num_categories) are skipped.
+            num_categories: int, number of category codes.
+        Returns: a (sources x categories) numpy.ndarray of the time
+            from each source to its nearest dest of each category,
+            with rows following get_source_ids(). Categories with no
+            reachable dest are the maximum of the dtype.
+        """
+        return self.transit_matrix.timeToNearestDestByCategory(np.ascontiguousarray(dest_categories,
+                                                                                    dtype=np.int64),
+                                                               num_categories, self._get_thread_limit())
+
+    def count_dests_in_range_by_category(self, dest_categories, num_categories, threshold):
+        """
+        Args:
+            dest_categories: array of the category code of each dest,
+                following get_dest_ids(). Dests with a code outside
+                [0, num_categories) are skipped.
+            num_categories: int, number of category codes.
+            threshold: int, upper limit of what is considered
+                to be 'in range'.
+        Returns: a (sources x categories) numpy.ndarray of the
+            number of dests of each category in range of each
+            source, with rows following get_source_ids().
+        """
+        return self.transit_matrix.countDestsInRangeByCategory(np.ascontiguousarray(dest_categories,
+                                                                                    dtype=np.int64),
+                                                               num_categories, threshold, self._get_thread_limit())
+
+    def sum_capacity_in_range_by_category(self, dest_categories, dest_capacities, num_categories, threshold):
+        """
+        Args:
+            dest_categories: array of the category code of each dest,
+                following get_dest_ids(). Dests with a code outside
+                [0, num_categories) are skipped.
+            dest_capacities: array of the capacity of each dest,
+                following get_dest_ids().
+            num_categories: int, number of category codes.
+            threshold: int, upper limit of what is considered
+                to be 'in range'.
+        Returns: a (sources x categories) numpy.ndarray of the
+            summed capacity of the dests of each category in range
+            of each source, with rows following get_source_ids().
+        """
+        return self.transit_matrix.sumCapacityInRangeByCategory(np.ascontiguousarray(dest_categories,
+                                                                                     dtype=np.int64),
+                                                                np.ascontiguousarray(dest_capacities,
+                                                                                     dtype=np.float64),
+                                                                num_categories, threshold,
+                                                                self._get_thread_limit())
+
+    def get_values_in_range(self, threshold):
+        """
+        Args:
+            threshold: int, upper limit of what is considered
+                to be 'in range'.
+        Returns: (row_starts, dest_locs, values), numpy arrays of
+            the values in range as a CSR matrix of sources x dests,
+            with rows following get_source_ids() and columns
+            following get_dest_ids(). The values of source row r
+            are values[row_starts[r]:row_starts[r + 1]], at dest
+            columns dest_locs[row_starts[r]:row_starts[r + 1]].
+        """
+        return self.transit_matrix.getValuesInRange(threshold, self._get_thread_limit())
+
+    def count_dests_in_range_for_thresholds(self, dest_categories, num_categories, thresholds):
+        """
+        Args:
+            dest_categories: array of the category code of each dest,
+                following get_dest_ids(). Dests with a code outside
+                [0, num_categories) are skipped.
+            num_categories: int, number of category codes.
+            thresholds: array of int, upper limits of what is
+                considered to be 'in range', in any order.
+        Returns: a (sources x categories x thresholds) numpy.ndarray
+            of the count of dests of each category in range of each
+            source under each threshold, with rows following
+            get_source_ids(). Each row is read once for all thresholds.
+        """
+        sorted_thresholds, threshold_locs = np.unique(self._as_value_array(thresholds), return_inverse=True)
+        counts = self.transit_matrix.countDestsInRangeByCategoryForThresholds(np.ascontiguousarray(dest_categories,
+                                                                                                   dtype=np.int64),
+                                                                              num_categories, sorted_thresholds,
+                                                                              self._get_thread_limit())
+        return counts[:, :, threshold_locs].astype(np.int64)
+
+    def sum_capacity_in_range_for_thresholds(self, dest_categories, dest_capacities, num_categories, thresholds):
+        """
+        Args:
+            dest_categories: array of the category code of each dest,
+                following get_dest_ids(). Dests with a code outside
+                [0, num_categories) are skipped.
+            dest_capacities: array of the capacity of each dest,
+                following get_dest_ids().
+            num_categories: int, number of category codes.
+            thresholds: array of int, upper limits of what is
+                considered to be 'in range', in any order.
+        Returns: a (sources x categories x thresholds) numpy.ndarray
+            of the summed capacity of the dests of each category in
+            range of each source under each threshold, with rows
+            following get_source_ids(). Each row is read once for all
+            thresholds.
+        """
+        sorted_thresholds, threshold_locs = np.unique(self._as_value_array(thresholds), return_inverse=True)
+        sums = self.transit_matrix.sumInRangeByCategoryForThresholds(np.ascontiguousarray(dest_categories,
+                                                                                          dtype=np.int64),
+                                                                     np.ascontiguousarray(dest_capacities,
+                                                                                          dtype=np.float64),
+                                                                     num_categories, sorted_thresholds,
+                                                                     self._get_thread_limit())
+        return sums[:, :, threshold_locs]
+
+    def sum_population_in_range_for_thresholds(self, source_populations, thresholds):
+        """
+        Args:
+            source_populations: array of the population of each
+                source, following get_source_ids().
+            thresholds: array of int, upper limits of what is
+                considered to be 'in range', in any order.
+        Returns: a (dests x thresholds) numpy.ndarray of the summed
+            population of the sources in range of each dest under each
+            threshold, with rows following get_dest_ids(). Each row
+            of the matrix is read once for all thresholds.
+        """
+        sorted_thresholds, threshold_locs = np.unique(self._as_value_array(thresholds), return_inverse=True)
+        sums = self.transit_matrix.sumSourcesInRangeForThresholds(np.ascontiguousarray(source_populations,
+                                                                                       dtype=np.float64),
+                                                                  sorted_thresholds, self._get_thread_limit())
+        return sums[:, threshold_locs]
+
     def _set_mock_data_frame(self, dataset, source_ids, dest_ids):
         """
         Warning: Not for use in production.
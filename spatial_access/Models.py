@@ -3,6 +3,7 @@
 # ©2017-2019, Center for Spatial Data Science
 
 import pandas as pd
+import scipy.sparse
 from spatial_access.BaseModel import ModelData
 from spatial_access.SpatialAccessExceptions import UnrecognizedDecayFunctionException
 from spatial_access.SpatialAccessExceptions import IncompleteCategoryDictException
@@ -11,37 +12,110 @@ from spatial_access.SpatialAccessExceptions import UnexpectedNormalizeColumnsExc
 from spatial_access.SpatialAccessExceptions import UnexpectedEmptyColumnException
 
 import math
+import numpy as np
+
+# values of the transit matrix decayed at a time by AccessModel.calculate;
+# each block holds as many whole rows as fit in this many values
+ACCESS_MODEL_BLOCK_VALUES = 1 << 22
+
+
+def _as_scalar_or_array(values):
+    """
+    Returns: a float for 0-d results, so the decay functions still
+        return numbers when given numbers.
+    """
+    return values.item() if values.ndim == 0 else values
+
 
 # TODO: Don't prompt for variable for models which don't use them
 def linear_decay_function(time, upper):
     """
-    Linear decay function for distance
+    Linear decay function for distance. time may be a number
+    or a numpy array, which is decayed element-wise.
     """
-
-    if time > upper:
-        return 0
-    else:
-        return (upper - time) / upper
+    time = np.asarray(time, dtype=np.float64)
+    return _as_scalar_or_array(np.where(time > upper, 0.0, (upper - time) / upper))
 
 
 def root_decay_function(time, upper):
     """
-    Square root decay function for distance.
+    Square root decay function for distance. time may be a
+    number or a numpy array, which is decayed element-wise.
     """
-    if time > upper:
-        return 0
-    else:
-        return (1 / math.sqrt(upper)) * (-time ** 0.5) + 1
+    time = np.asarray(time, dtype=np.float64)
+    return _as_scalar_or_array(np.where(time > upper, 0.0, (1 / math.sqrt(upper)) * (-time ** 0.5) + 1))
 
 
 def logit_decay_function(time, upper):
     """
-    Logit distance decay function.
+    Logit distance decay function. time may be a number or
+    a numpy array, which is decayed element-wise.
     """
-    if time > upper:
-        return 0
+    time = np.asarray(time, dtype=np.float64)
+    with np.errstate(over='ignore'):
+        decayed = 1 - (1 / (np.exp((upper / 180) - (.48 / 60) * time) + 1))
+    return _as_scalar_or_array(np.where(time > upper, 0.0, decayed))
+
+
+def _get_decay_function(decay_function):
+    """
+    Args:
+        decay_function: 'linear', 'root', 'logit', or a lambda of
+        the form f(x, y) -> z. Range should be the nonnegative
+        integer space.
+    Returns: the decay function.
+    Raises:
+        UnrecognizedDecayFunctionException: Illegal decay function.
+    """
+    if isinstance(decay_function, str):
+        if decay_function == 'linear':
+            return linear_decay_function
+        elif decay_function == 'root':
+            return root_decay_function
+        elif decay_function == 'logit':
+            return logit_decay_function
+        else:
+            raise UnrecognizedDecayFunctionException(decay_function)
+    elif isinstance(decay_function, type(lambda: x)):
+        try:
+            x = decay_function(1, 2)
+            assert isinstance(x, int) or isinstance(x, float)
+        except (TypeError, AssertionError):
+            raise UnrecognizedDecayFunctionException('lambda sbould have form:f(x, y) -> z')
+        return decay_function
     else:
-        return 1-(1/(math.exp((upper/180)-(.48/60)*time)+1))
+        message = "Decay function should be either a string: ['linear', 'root', 'logit'], or a lamda"
+        raise UnrecognizedDecayFunctionException(message)
+
+
+def _decay_times(decay_function, times, upper_threshold):
+    """
+    Args:
+        decay_function: a function from _get_decay_function.
+        times: numpy array of times.
+        upper_threshold: time in seconds.
+    Returns: numpy array of times decayed element-wise.
+    """
+    if decay_function in (linear_decay_function, root_decay_function, logit_decay_function):
+        return decay_function(times, upper_threshold)
+    # a user supplied decay function may only accept numbers
+    decay_function = np.frompyfunc(decay_function, 2, 1)
+    return decay_function(times.astype(np.int64), upper_threshold).astype(np.float64)
+
+
+def _get_catchment_decay(decay_function, upper_threshold):
+    """
+    Args:
+        decay_function: None, or any decay function accepted
+            by _get_decay_function.
+        upper_threshold: time in seconds.
+    Returns: None, or a function decaying a numpy array of times,
+        for ModelData._get_catchment_matrix.
+    """
+    if decay_function is None:
+        return None
+    decay_function = _get_decay_function(decay_function)
+    return lambda times: _decay_times(decay_function, times, upper_threshold)
 
 # TODO: separate each category into its own column
 class Coverage(ModelData):
@@ -75,30 +149,39 @@ class Coverage(ModelData):
         self._is_source = False
         self._result_column_names = {'service_pop', 'percap_spending'}
 
-    # TODO: optimize
-    def calculate(self, upper_threshold):
+    def calculate(self, upper_threshold, decay_function=None):
         """
         Args:
             upper_threshold: numeric, time in seconds.
+            decay_function: optional, 'linear', 'root', 'logit', or a
+                lambda of the form f(x, y) -> z. If given, each source
+                in range counts toward service_pop weighted by its
+                decayed time (enhanced two step floating catchment).
         Calculate the per-capita values and served population for each destination record.
 
         Returns: DataFrame
         """
-        self.calculate_sources_in_range(upper_threshold)
-        results = {}
+        catchment = self._get_catchment_matrix(upper_threshold, _get_catchment_decay(decay_function,
+                                                                                     upper_threshold))
+        population_in_range, supply_ratios = self._get_dest_supply_ratios(catchment)
+        if decay_function is None:
+            population_in_range = population_in_range.astype(self.sources['population'].dtype)
+
+        dest_ids = []
+        categories = []
         for category in self.focus_categories:
-            for dest_id in self.get_ids_for_category(category):
-                population_in_range = self.get_population_in_range(dest_id)
-                if population_in_range > 0:
-                    percapita_spending = self.get_capacity(dest_id) / population_in_range
-                else:
-                    percapita_spending = 0
-                results[dest_id] = [population_in_range, percapita_spending, category]
-
-        self.model_results = pd.DataFrame.from_dict(results, orient='index',
-                                                    columns=['service_pop',
-                                                             'percap_spending',
-                                                             'category'])
+            category_dest_ids = self.get_ids_for_category(category)
+            dest_ids.extend(category_dest_ids)
+            categories.extend([category] * len(category_dest_ids))
+        # dests missing from the transit matrix serve no one
+        self._missing_transit_data_warning(['source', 'destination'])
+        dest_locs = pd.Index(self.get_transit_dest_ids()).get_indexer(dest_ids)
+        in_matrix = dest_locs >= 0
+        self.model_results = pd.DataFrame({'service_pop': np.where(in_matrix, population_in_range[dest_locs], 0),
+                                           'percap_spending': np.where(in_matrix, supply_ratios[dest_locs], 0),
+                                           'category': categories},
+                                          index=dest_ids)
+        self._cast_zero_columns_to_int(self.model_results, ['service_pop', 'percap_spending'])
         for column in self.model_results.columns:
             if 'service_pop' in column:
                 self._aggregation_args[column] = 'sum'
@@ -107,6 +190,41 @@ class Coverage(ModelData):
 
         #return self.model_results
 
+    def calculate_for_thresholds(self, thresholds):
+        """
+        Computes the service_pop and percap_spending of calculate
+        (without decay) for each of thresholds, reading the transit
+        matrix once rather than once per threshold.
+        Args:
+            thresholds: list of numeric, times in seconds.
+
+        Returns: DataFrame with a row for each destination and
+            threshold, of the destination id, the threshold,
+            service_pop, percap_spending and category.
+        """
+        thresholds = list(thresholds)
+        population_in_range = self.transit_matrix.matrix_interface.sum_population_in_range_for_thresholds(
+            self._get_source_populations(), thresholds)
+        supply_ratios = np.zeros(population_in_range.shape)
+        np.divide(self._get_dest_capacities()[:, np.newaxis], population_in_range,
+                  out=supply_ratios, where=population_in_range > 0)
+
+        dest_ids = []
+        categories = []
+        for category in self.focus_categories:
+            category_dest_ids = self.get_ids_for_category(category)
+            dest_ids.extend(category_dest_ids)
+            categories.extend([category] * len(category_dest_ids))
+        # dests missing from the transit matrix serve no one
+        dest_locs = pd.Index(self.get_transit_dest_ids()).get_indexer(dest_ids)
+        in_matrix = (dest_locs >= 0)[:, np.newaxis]
+        values = np.stack([np.where(in_matrix, population_in_range[dest_locs], 0),
+                           np.where(in_matrix, supply_ratios[dest_locs], 0)], axis=1)
+        results = self._tidy_threshold_results(dest_ids, thresholds, values, ['service_pop', 'percap_spending'])
+        results['service_pop'] = results['service_pop'].astype(self.sources['population'].dtype)
+        results['category'] = np.repeat(np.array(categories, dtype=object), len(thresholds))
+        return results
+
 
 class DestSum(ModelData):
     """
@@ -217,48 +335,38 @@ class TSFCA(ModelData):
         self.set_focus_categories(categories=categories)
         self._result_column_names = {'agg_mean', 'agg_sum'}
 
-    def calculate(self, upper_threshold):
+    def calculate(self, upper_threshold, decay_function=None):
         """
         Args:
             upper_threshold: numeric, time in seconds.
+            decay_function: optional, 'linear', 'root', 'logit', or a
+                lambda of the form f(x, y) -> z. If given, both steps
+                weight each pair in range by its decayed time
+                (enhanced two step floating catchment).
 
         Returns: DataFrame
         """
-        self.calculate_sources_in_range(upper_threshold)
-        self.calculate_dests_in_range(upper_threshold)
-
-        # initialize results as {source_id: []}
-        results = {}
-        num_categories = len(self.focus_categories)
-        for source_id in self.get_all_source_ids():
-            results[source_id] = [0] * num_categories
-
-        # map category to index in results and generate column names
-        column_name_to_index = {}
-        column_names = []
-
-        for index, category in enumerate(self.focus_categories):
-            column_names.append('tsfca_' + category)
-            column_name_to_index[category] = index
-
-        dests_capacity = {}
-        for category in self.focus_categories:
-            for dest_id in self.get_ids_for_category(category):
-                population_in_range = self.get_population_in_range(dest_id)
-                if population_in_range > 0:
-                    contribution_to_spending = self.get_capacity(dest_id) / population_in_range
-                    dests_capacity[dest_id] = contribution_to_spending
-                else:
-                    dests_capacity[dest_id] = 0
-        for source_id in self.get_all_source_ids():
-            for dest_id in self.get_dests_in_range_of_source(source_id):
-                category = self.get_category(dest_id)
-                if category in self.focus_categories:
-                    results[source_id][column_name_to_index[category]] += dests_capacity[dest_id]
-
-        self.model_results = pd.DataFrame.from_dict(results, orient='index',
-                                                    columns=column_names)
+        focus_categories_list = list(self.focus_categories)
+        column_names = ['tsfca_' + category for category in focus_categories_list]
+        catchment = self._get_catchment_matrix(upper_threshold, _get_catchment_decay(decay_function,
+                                                                                     upper_threshold))
+        _, supply_ratios = self._get_dest_supply_ratios(catchment)
+
+        # the supply ratio of each dest, in the column of its category
+        dest_codes = self._get_dest_category_codes(focus_categories_list)
+        focus_dest_locs = np.flatnonzero(dest_codes >= 0)
+        category_supply_ratios = scipy.sparse.csr_matrix((supply_ratios[focus_dest_locs],
+                                                          (focus_dest_locs, dest_codes[focus_dest_locs])),
+                                                         shape=(len(dest_codes), len(focus_categories_list)))
+        source_scores = (catchment @ category_supply_ratios).toarray()
+
+        # sources missing from the transit matrix have nothing in range
+        self._missing_transit_data_warning(['source', 'destination'])
+        self.model_results = pd.DataFrame(0.0, index=self.get_all_source_ids(), columns=column_names)
+        source_locs, common_source_ids = self._get_common_source_locs()
+        self.model_results.iloc[self.model_results.index.get_indexer(common_source_ids)] = source_scores[source_locs]
         self.model_results['tsfca_all_categories'] = self.model_results.sum(axis=1)
+        self._cast_zero_columns_to_int(self.model_results)
 
         for column in self.model_results.columns:
             if 'agg_mean' in column:
@@ -309,17 +417,16 @@ class AccessTime(ModelData):
         Returns: DataFrame
         """
 
-        results = {}
         focus_categories_list = list(self.focus_categories)
         column_names = ['time_to_nearest_' + category for category in focus_categories_list]
-        for source_id in self.get_common_source_ids():
-            results[source_id] = []
-            for category in focus_categories_list:
-                time_to_nearest_neighbor = self.time_to_nearest_dest(source_id, category)
-                results[source_id].append(time_to_nearest_neighbor)
-
-        self.model_results = pd.DataFrame.from_dict(results, orient='index',
-                                                    columns=column_names)
+        source_locs, source_ids = self._get_common_source_locs()
+        dest_codes = self._get_dest_category_codes(focus_categories_list)
+        nearest_times = self.transit_matrix.matrix_interface.time_to_nearest_dest_by_category(
+            dest_codes, len(focus_categories_list))[source_locs].astype(np.int64)
+        # categories with no dests in the transit matrix are 0
+        nearest_times[:, ~np.isin(np.arange(len(focus_categories_list)), dest_codes)] = 0
+
+        self.model_results = pd.DataFrame(nearest_times, index=source_ids, columns=column_names)
         self.model_results['time_to_nearest_all_categories'] = self.model_results.min(axis=1)
         # return self.model_results
 
@@ -367,20 +474,14 @@ class AccessCount(ModelData):
 
         Returns: DataFrame
         """
-        results = {}
         focus_categories_list = list(self.focus_categories)
         column_names = ['count_in_range_' + category for category in focus_categories_list]
-        self.calculate_dests_in_range(upper_threshold)
-        for source_id in self.get_common_source_ids():
-            results[source_id] = []
-            for category in focus_categories_list:
-                count_in_range = self.count_dests_in_range_by_categories(source_id=source_id,
-                                                                                category=category,
-                                                                                    upper_threshold=upper_threshold)
-                results[source_id].append(count_in_range)
-
-        self.model_results = pd.DataFrame.from_dict(results, orient='index',
-                                                    columns=column_names)
+        source_locs, source_ids = self._get_common_source_locs()
+        counts = self.transit_matrix.matrix_interface.count_dests_in_range_by_category(
+            self._get_dest_category_codes(focus_categories_list), len(focus_categories_list),
+            upper_threshold)[source_locs].astype(np.int64)
+
+        self.model_results = pd.DataFrame(counts, index=source_ids, columns=column_names)
 
         self.model_results['count_in_range_all_categories'] = self.model_results.sum(axis=1)
         for column in self.model_results.columns:
@@ -388,6 +489,28 @@ class AccessCount(ModelData):
 
         #return self.model_results
 
+    def calculate_for_thresholds(self, thresholds):
+        """
+        Computes the counts of calculate for each of thresholds,
+        reading the transit matrix once rather than once per
+        threshold.
+        Args:
+            thresholds: list of numeric, times in seconds.
+
+        Returns: DataFrame with a row for each source and threshold,
+            of the source id, the threshold and the counts.
+        """
+        thresholds = list(thresholds)
+        focus_categories_list = list(self.focus_categories)
+        column_names = ['count_in_range_' + category for category in focus_categories_list]
+        source_locs, source_ids = self._get_common_source_locs()
+        counts = self.transit_matrix.matrix_interface.count_dests_in_range_for_thresholds(
+            self._get_dest_category_codes(focus_categories_list), len(focus_categories_list),
+            thresholds)[source_locs]
+        counts = np.concatenate([counts, counts.sum(axis=1, keepdims=True)], axis=1)
+        return self._tidy_threshold_results(source_ids, thresholds, counts,
+                                            column_names + ['count_in_range_all_categories'])
+
 
 class AccessSum(ModelData):
     """
@@ -434,26 +557,54 @@ class AccessSum(ModelData):
         Returns: DataFrame
         """
 
-        results = {}
         focus_categories_list = list(self.focus_categories)
         column_names = ['sum_in_range_' + category for category in focus_categories_list]
-        self.calculate_dests_in_range(upper_threshold)
-        for source_id in self.get_all_source_ids():
-            results[source_id] = []
-            for category in focus_categories_list:
-                sum_in_range = self.count_sum_in_range_by_categories(source_id,
-                                                                                    category)
-                results[source_id].append(sum_in_range)
-
-        self.model_results = pd.DataFrame.from_dict(results, orient='index',
-                                                    columns=column_names)
+        source_locs, source_ids = self._get_common_source_locs()
+        sums = self.transit_matrix.matrix_interface.sum_capacity_in_range_by_category(
+            self._get_dest_category_codes(focus_categories_list), self._get_dest_capacities(),
+            len(focus_categories_list), upper_threshold)
+
+        # sources missing from the transit matrix have nothing in range
+        self._missing_transit_data_warning(['source'])
+        self.model_results = pd.DataFrame(0, index=self.get_all_source_ids(), columns=column_names,
+                                          dtype=self.dests['capacity'].dtype)
+        self.model_results.iloc[self.model_results.index.get_indexer(source_ids)] = sums[source_locs]
         self.model_results['sum_in_range_all_categories'] = self.model_results.sum(axis=1)
+        self._cast_zero_columns_to_int(self.model_results)
         for column in self.model_results.columns:
             self._aggregation_args[column] = 'mean'
 
 
         #return self.model_results
 
+    def calculate_for_thresholds(self, thresholds):
+        """
+        Computes the sums of calculate for each of thresholds,
+        reading the transit matrix once rather than once per
+        threshold.
+        Args:
+            thresholds: list of numeric, times in seconds.
+
+        Returns: DataFrame with a row for each source and threshold,
+            of the source id, the threshold and the sums.
+        """
+        thresholds = list(thresholds)
+        focus_categories_list = list(self.focus_categories)
+        column_names = ['sum_in_range_' + category for category in focus_categories_list]
+        source_locs, source_ids = self._get_common_source_locs()
+        sums = self.transit_matrix.matrix_interface.sum_capacity_in_range_for_thresholds(
+            self._get_dest_category_codes(focus_categories_list), self._get_dest_capacities(),
+            len(focus_categories_list), thresholds)
+
+        # sources missing from the transit matrix have nothing in range
+        all_source_ids = self.get_all_source_ids()
+        all_sums = np.zeros((len(all_source_ids), len(focus_categories_list), len(thresholds)),
+                            dtype=self.dests['capacity'].dtype)
+        all_sums[pd.Index(all_source_ids).get_indexer(source_ids)] = sums[source_locs]
+        all_sums = np.concatenate([all_sums, all_sums.sum(axis=1, keepdims=True)], axis=1)
+        return self._tidy_threshold_results(all_source_ids, thresholds, all_sums,
+                                            column_names + ['sum_in_range_all_categories'])
+
 
 class AccessModel(ModelData):
     """
@@ -510,25 +661,16 @@ class AccessModel(ModelData):
         Raises:
             UnrecognizedDecayFunctionException: Illegal decay function.
         """
-        if isinstance(decay_function, str):
-            if decay_function == 'linear':
-                self.decay_function = linear_decay_function
-            elif decay_function == 'root':
-                self.decay_function = root_decay_function
-            elif decay_function == 'logit':
-                self.decay_function = logit_decay_function
-            else:
-                raise UnrecognizedDecayFunctionException(decay_function)
-        elif isinstance(decay_function, type(lambda: x)):
-            try:
-                x = decay_function(1, 2)
-                assert isinstance(x, int) or isinstance(x, float)
-            except (TypeError, AssertionError):
-                raise UnrecognizedDecayFunctionException('lambda sbould have form:f(x, y) -> z')
-            self.decay_function = decay_function
-        else:
-            message = "Decay function should be either a string: ['linear', 'root', 'logit'], or a lamda"
-            raise UnrecognizedDecayFunctionException(message)
+        self.decay_function = _get_decay_function(decay_function)
+
+    def _decay(self, times, upper_threshold):
+        """
+        Args:
+            times: numpy array of times.
+            upper_threshold: time in seconds.
+        Returns: numpy array of times decayed element-wise.
+        """
+        return _decay_times(self.decay_function, times, upper_threshold)
 
     @staticmethod
     def _test_category_weight_dict(category_weight_dict):
@@ -575,9 +717,6 @@ class AccessModel(ModelData):
         else:
             self._test_category_weight_dict(category_weight_dict)
 
-        # create a quick reference for the number of times to include a dest in each category
-        max_category_occurances = {category: len(weights) for category, weights in category_weight_dict.items()}
-
         # order the user's weights in ascending order so the highest one gets used
         # first, for the closest dest of that category
         category_weight_dict = {category: sorted(weights, reverse=True)
@@ -585,10 +724,6 @@ class AccessModel(ModelData):
 
         self._log_category_weight_dict(category_weight_dict)
 
-        # reserve results dict for each column
-        num_columns = len(self.all_categories) + 1
-        results = {source_id: [0] * num_columns for source_id in self.get_all_source_ids()}
-
         # map of column names
         category_to_index_map = {}
         column_names = ['all_categories_score']
@@ -598,30 +733,42 @@ class AccessModel(ModelData):
             category_to_index_map[category] = index
             index += 1
 
-        # calculate score for each source_id
-        for source_id in self.get_common_source_ids():
-            category_encounters = {category: 0 for category in self.all_categories}
-            for dest_id, time in self.get_values_by_source(source_id, sort=True):
-                decayed_time = self.decay_function(time, upper_threshold)
-                category = self.get_category(dest_id)
-                category_occurances = category_encounters[category]
-                # no weights supplied for this category; so don't decay
+        # sources missing from the transit matrix score 0
+        self.model_results = pd.DataFrame(0.0, index=self.get_all_source_ids(), columns=column_names)
+
+        source_locs, source_ids = self._get_common_source_locs()
+        result_locs = self.model_results.index.get_indexer(source_ids)
+        categories = list(category_to_index_map)
+        dest_codes = self._get_dest_category_codes(categories)
+        category_dest_locs = {category: np.flatnonzero(dest_codes == code)
+                              for code, category in enumerate(categories)}
+
+        block_rows = max(1, ACCESS_MODEL_BLOCK_VALUES // max(1, len(dest_codes)))
+        scores = self.model_results.to_numpy(copy=True)
+        for first in range(0, len(source_locs), block_rows):
+            block_locs = source_locs[first:first + block_rows]
+            times = self.transit_matrix.matrix_interface.get_value_rows(block_locs)
+            decayed = self._decay(times, upper_threshold)
+            block_scores = scores[result_locs[first:first + block_rows]]
+            for category, column in category_to_index_map.items():
+                dest_locs = category_dest_locs[category]
                 if category not in category_weight_dict:
-                    results[source_id][0] += decayed_time
-                    results[source_id][category_to_index_map[category]] += decayed_time
-                # weights supplied for this category, still haven't been used up
-                elif category_occurances < max_category_occurances[category]:
-                    decayed_category_weight = category_weight_dict[category][category_occurances]
-                    category_encounters[category] += 1
-                    score_contribution = decayed_time * decayed_category_weight
-                    results[source_id][0] += score_contribution
-                    results[source_id][category_to_index_map[category]] += score_contribution
-                # weights for this category have been used up
-                else:
+                    # no weights supplied for this category; so don't decay
+                    block_scores[:, column] = decayed[:, dest_locs].sum(axis=1)
                     continue
-
-        self.model_results = pd.DataFrame.from_dict(results, orient='index',
-                                                    columns=column_names)
+                # the k nearest dests get the k weights, nearest first
+                weights = np.array(category_weight_dict[category][:len(dest_locs)], dtype=np.float64)
+                if len(weights) == 0:
+                    continue
+                category_times = times[:, dest_locs]
+                nearest = np.argpartition(category_times, len(weights) - 1, axis=1)[:, :len(weights)]
+                order = np.argsort(np.take_along_axis(category_times, nearest, axis=1), axis=1, kind='stable')
+                nearest = np.take_along_axis(nearest, order, axis=1)
+                block_scores[:, column] = (np.take_along_axis(decayed[:, dest_locs], nearest, axis=1)
+                                           * weights).sum(axis=1)
+            block_scores[:, 0] = block_scores[:, 1:].sum(axis=1)
+            scores[result_locs[first:first + block_rows]] = block_scores
+        self.model_results[:] = scores
 
         if isinstance(normalize, list):
             for column in normalize:
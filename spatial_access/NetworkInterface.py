@@ -146,6 +146,16 @@ class NetworkInterface:
         bbox_string = '_'.join([str(coord) for coord in self.bbox])
         return 'data/osm_query_cache/' + self.network_type + bbox_string + '.h5'
 
+    def get_contraction_hierarchy_filename(self, checksum):
+        """
+        Args:
+            checksum: integer, checksum of the parsed network.
+        Returns: cache filename for the contraction hierarchy of
+            this request. The checksum changes with the edge weights,
+            so differently weighted networks are cached separately.
+        """
+        return self._get_filename()[:-3] + '_{:016x}.ch'.format(checksum)
+
     def _network_exists(self):
         """
         Returns: true if a filename matching these
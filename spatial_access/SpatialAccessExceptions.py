@@ -222,3 +222,7 @@ class AggregateOutputTypeNotExpectedException(Exception):
     def __init__(self, errors=''):
         super().__init__(errors)
 
+
+class MatrixNotDenseException(Exception):
+    def __init__(self, errors=''):
+        super().__init__(errors)
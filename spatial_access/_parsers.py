@@ -73,7 +73,7 @@ class IntStringParser(BaseParser):
         return dest_id.decode()
 
     @staticmethod
-    def decode_vector_dest_id(vector):
+    def decode_vector_dest_ids(vector):
         return [item.decode() for item in vector]
 
     @staticmethod
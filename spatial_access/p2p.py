@@ -7,7 +7,7 @@ import time
 import logging
 import os
 import scipy.spatial
-from geopy import distance
+import numpy as np
 import pandas as pd
 from numpy import issubdtype, integer, signedinteger
 
@@ -26,6 +26,9 @@ from spatial_access.SpatialAccessExceptions import WriteTMXFailedException
 from spatial_access.SpatialAccessExceptions import WriteCSVFailedException
 from spatial_access.SpatialAccessExceptions import ImproperIndecesTypeException
 
+# mean radius of the WGS-84 ellipsoid
+EARTH_RADIUS_METERS = 6371008.8
+
 
 class TransitMatrix:
     """
@@ -125,6 +128,19 @@ class TransitMatrix:
         self.logger = logging.getLogger(__name__)
         self.logger.debug("Running in debug mode")
 
+    @staticmethod
+    def _haversine_distance(lon_a, lat_a, lon_b, lat_b):
+        """
+        Args:
+            lon_a, lat_a, lon_b, lat_b: arrays of coordinates in degrees.
+        Returns: array of great circle distances in meters between
+            (lon_a, lat_a) and (lon_b, lat_b).
+        """
+        lon_a, lat_a, lon_b, lat_b = map(np.radians, (lon_a, lat_a, lon_b, lat_b))
+        a = np.sin((lat_b - lat_a) / 2) ** 2 + \
+            np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2
+        return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(a))
+
     @staticmethod
     def _get_output_filename(keyword, extension):
         """
@@ -320,10 +336,10 @@ class TransitMatrix:
         edges['to_loc'] = edges['to'].map(simple_node_indeces)
         edges['edge_weight'] = edges['edge_weight'].astype('int16')
 
-        from_column = list(edges['from_loc'])
-        to_column = list(edges['to_loc'])
-        edge_weight_column = list(edges['edge_weight'])
-        is_bidirectional_column = list(edges['is_bidirectional'])
+        from_column = edges['from_loc'].values.astype(np.uint64)
+        to_column = edges['to_loc'].values.astype(np.uint64)
+        edge_weight_column = edges['edge_weight'].values
+        is_bidirectional_column = edges['is_bidirectional'].values.astype(bool)
 
         self.matrix_interface.add_edges_to_graph(from_column, to_column, edge_weight_column,
                                                  is_bidirectional_column)
@@ -367,36 +383,32 @@ class TransitMatrix:
             assert False, "Unknown type"
 
         # map each node in the source/dest data to the nearest
-        # corresponding node in the OSM network
-        # and write to file
-        for row in data.itertuples():
-            origin_id, origin_x, origin_y = row
-            latlong_diff, node_loc = kd_tree.query([origin_x, origin_y], k=1)
-            node_number = nodes.index[node_loc]
-            origin_location = (origin_y, origin_x)
-            closest_node_location = (nodes.loc[node_number].y,
-                                                       nodes.loc[node_number].x)
-
-            # keep track of nodes that are used to snap a user data point
-            edge_distance = distance.distance(origin_location, closest_node_location).m
-
-            edge_weight = int(edge_distance / unit_cost)
-
-            if is_primary:
-                self.matrix_interface.add_user_source_data(network_id=node_loc,
-                                                           user_id=origin_id,
-                                                           weight=edge_weight,
-                                                           is_also_dest=is_also_secondary)
-            else:
-                self.matrix_interface.add_user_dest_data(network_id=node_loc,
-                                                         user_id=origin_id,
-                                                         weight=edge_weight)
+        # corresponding node in the OSM network, all at once
+        origins = data.values
+        origin_x = origins[:, 0].astype(float)
+        origin_y = origins[:, 1].astype(float)
+        _, node_locs = kd_tree.query(np.column_stack((origin_x, origin_y)), k=1)
+
+        edge_distances = self._haversine_distance(origin_x, origin_y,
+                                                  node_array[node_locs, 0],
+                                                  node_array[node_locs, 1])
+        edge_weights = (edge_distances / unit_cost).astype(np.int64)
+
+        if is_primary:
+            self.matrix_interface.add_user_source_data_bulk(network_ids=node_locs,
+                                                            user_ids=data.index.values,
+                                                            weights=edge_weights,
+                                                            is_also_dest=is_also_secondary)
+        else:
+            self.matrix_interface.add_user_dest_data_bulk(network_ids=node_locs,
+                                                          user_ids=data.index.values,
+                                                          weights=edge_weights)
 
         time_delta = time.time() - start_time
         self.logger.debug(
             'Nearest Neighbor matching completed in {:,.2f} seconds'.format(time_delta))
 
-    def write_csv(self, outfile=None):
+    def write_csv(self, outfile=None, compression_level=None):
         """
         Write the transit matrix to csv.
 
@@ -405,14 +417,18 @@ class TransitMatrix:
 
         Arguments:
             outfile: optional filename.
+            compression_level: optional integer from 1 (fastest) to 9
+                (smallest), gzip the csv as it is written.
         Raises:
             WriteCSVFailedException: filename does not have correct extension.
         """
         if not outfile:
             outfile = self._get_output_filename(self.network_type, extension='csv')
+            if compression_level is not None:
+                outfile += '.gz'
         if '.csv' not in outfile:
             raise WriteCSVFailedException('given filename does not have the correct extension (.csv)')
-        self.matrix_interface.write_csv(outfile)
+        self.matrix_interface.write_csv(outfile, compression_level=compression_level)
 
     def getRowIds(self):
         """
@@ -426,7 +442,7 @@ class TransitMatrix:
         """
         return self.matrix_interface.getColIds()
 
-    def write_tmx(self, outfile=None):
+    def write_tmx(self, outfile=None, compression_level=None):
         """
         Write the transit matrix to tmx.
 
@@ -436,6 +452,8 @@ class TransitMatrix:
 
         Arguments:
             outfile: optional filename.
+            compression_level: optional integer from 1 (fastest) to 9
+                (smallest), compress the matrix values as they are written.
         Raises:
             WriteTMXFailedException: filename does not have correct extension.
         """
@@ -443,7 +461,7 @@ class TransitMatrix:
             outfile = self._get_output_filename(self.network_type, extension='tmx')
         if '.tmx' not in outfile:
             raise WriteTMXFailedException('given filename does not have the correct extension (.tmx)')
-        self.matrix_interface.write_tmx(outfile)
+        self.matrix_interface.write_tmx(outfile, compression_level=compression_level)
 
     def prefetch_network(self):
         """
@@ -467,9 +485,11 @@ class TransitMatrix:
     def _is_compressible(self):
         """
         Returns: true if the transit matrix can be compressed by
-            half without losing any data.
+            half without losing any data. Sparse matrices are never
+            compressed.
         """
-        return self._is_symmetric() and self.network_type in {'walk', 'bike'}
+        return (self._is_symmetric() and self.network_type in {'walk', 'bike'}
+                and not self.configs.use_sparse_storage)
 
     def _is_symmetric(self):
         """
@@ -478,13 +498,19 @@ class TransitMatrix:
         """
         return self.secondary_input is None
 
-    def process(self):
+    def process(self, max_impedance=None):
         """
         - Load the users's data.
         - Fetch the osm network.
         - Parse the network.
         - Calculate transit matrix.
 
+        Args:
+            max_impedance: optional integer (seconds, or meters if
+                configs.use_meters). If given, values beyond it are
+                not computed and are stored as undefined. This is much
+                faster when only values up to a threshold are needed.
+
         Raises:
             AssertionError: if this method is called on an OTP-matrix.
         """
@@ -504,7 +530,8 @@ class TransitMatrix:
                                              is_compressible=self._is_compressible(),
                                              rows=rows,
                                              columns=cols,
-                                             network_vertices=self._network_interface.number_of_nodes())
+                                             network_vertices=self._network_interface.number_of_nodes(),
+                                             is_sparse=self.configs.use_sparse_storage)
 
         if self.secondary_input:
             self._match_to_nearest_neighbor(is_primary=True, is_also_secondary=False)
@@ -514,11 +541,17 @@ class TransitMatrix:
 
         self._parse_network()
 
+        if self.configs.use_contraction_hierarchy:
+            checksum = self.matrix_interface.get_network_checksum()
+            filename = self._network_interface.get_contraction_hierarchy_filename(checksum)
+            self.matrix_interface.prepare_contraction_hierarchy(filename)
+
         # offload primary and secondary input data frames because we don't need them anymore
         self.primary_input = None
         self.secondary_input = None
 
-        self.matrix_interface.build_matrix()
+        self.matrix_interface.build_matrix(max_impedance=max_impedance,
+                                           search_batch_size=self.configs.search_batch_size)
         time_delta = time.time() - start_time
 
         self.logger.info('All operations completed in {:,.2f} seconds'.format(time_delta))
@@ -29,6 +29,30 @@ void Serializer::writeBool(bool value)
     this->writeNumericType<unsigned short>((unsigned short) value);
 }
 
+unsigned long int Serializer::position()
+{
+    return (unsigned long int) output.tellp();
+}
+
+/* move the write position, to fill in data reserved earlier */
+void Serializer::seek(unsigned long int position)
+{
+    output.seekp(position);
+    checkStreamIsGood();
+}
+
+/* write zeros up to the next multiple of alignment */
+void Serializer::writePadding(unsigned long int alignment)
+{
+    unsigned long int remainder = position() % alignment;
+    if (remainder > 0)
+    {
+        std::string padding(alignment - remainder, '\0');
+        output.write(padding.data(), padding.size());
+        checkStreamIsGood();
+    }
+}
+
 
 Deserializer::Deserializer(const std::string &filename)
 {
@@ -53,3 +77,25 @@ bool Deserializer::readBool()
     return (bool) this->readNumericType<unsigned short>();
 }
 
+unsigned long int Deserializer::position()
+{
+    return (unsigned long int) input.tellg();
+}
+
+void Deserializer::seek(unsigned long int position)
+{
+    input.seekg(position);
+    checkStreamIsGood();
+}
+
+/* skip to the next multiple of alignment */
+void Deserializer::skipPadding(unsigned long int alignment)
+{
+    unsigned long int remainder = position() % alignment;
+    if (remainder > 0)
+    {
+        input.seekg(alignment - remainder, std::ios::cur);
+        checkStreamIsGood();
+    }
+}
+
@@ -0,0 +1,144 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+// Compares searching one source at a time with batched multi-source
+// searches on a synthetic street grid, and checks both produce the
+// same matrix. Batches pay off when the sources searched together are
+// close to each other, so both scattered and clustered sources are timed.
+//
+// Build and run:
+//   cd spatial_access/src
+//   g++ --std=c++11 -O2 -pthread benchmarks/batchedSearchBenchmark.cpp Serializer.cpp threadUtilities.cpp tmxParser.cpp csvParser.cpp mappedFile.cpp compressedChunks.cpp -lz -o batchedSearchBenchmark
+//   ./batchedSearchBenchmark [grid side length] [number of sources] [number of dests] [threads]
+
+#include <chrono>
+#include <cstdlib>
+#include <iostream>
+#include <random>
+#include <algorithm>
+#include <vector>
+
+#include "../include/transitMatrix.h"
+
+typedef unsigned short int value_type;
+typedef transitMatrix<unsigned long int, unsigned long int, value_type> benchmarkMatrix;
+
+/* build a bidirectional side x side grid with random edge weights */
+void buildGrid(benchmarkMatrix &matrix, unsigned long int side)
+{
+    std::mt19937 generator(42);
+    std::uniform_int_distribution<value_type> weight_distribution(5, 60);
+    std::vector<network_node> from_column;
+    std::vector<network_node> to_column;
+    std::vector<value_type> weight_column;
+    for (unsigned long int row = 0; row < side; row++)
+    {
+        for (unsigned long int col = 0; col < side; col++)
+        {
+            network_node u = row * side + col;
+            if (col + 1 < side)
+            {
+                from_column.push_back(u);
+                to_column.push_back(u + 1);
+                weight_column.push_back(weight_distribution(generator));
+            }
+            if (row + 1 < side)
+            {
+                from_column.push_back(u);
+                to_column.push_back(u + side);
+                weight_column.push_back(weight_distribution(generator));
+            }
+        }
+    }
+    std::vector<unsigned char> is_bidirectional_column(from_column.size(), 1);
+    matrix.prepareGraphWithVertices(side * side);
+    matrix.addEdgesToGraph(from_column.data(), to_column.data(), weight_column.data(),
+                           is_bidirectional_column.data(), from_column.size());
+}
+
+double computeMilliseconds(benchmarkMatrix &matrix, unsigned int batchSize, unsigned int numThreads)
+{
+    matrix.setSearchBatchSize(batchSize);
+    auto start = std::chrono::steady_clock::now();
+    matrix.compute(numThreads);
+    std::chrono::duration<double, std::milli> elapsed = std::chrono::steady_clock::now() - start;
+    return elapsed.count();
+}
+
+/* add sources: scattered uniformly at random, or in clusters of 16
+ * within a few blocks of each other (as tract centroids sorted by id) */
+void addSources(benchmarkMatrix &matrix, unsigned long int side, unsigned long int num_sources, bool clustered)
+{
+    std::mt19937 generator(7);
+    std::uniform_int_distribution<network_node> node_distribution(0, side * side - 1);
+    std::uniform_int_distribution<long int> offset_distribution(-3, 3);
+    network_node center = 0;
+    for (unsigned long int i = 0; i < num_sources; i++)
+    {
+        if (!clustered)
+        {
+            matrix.addToUserSourceDataContainer(node_distribution(generator), i, 0);
+            continue;
+        }
+        if (i % 16 == 0)
+        {
+            center = node_distribution(generator);
+        }
+        long int row = (long int) (center / side) + offset_distribution(generator);
+        long int col = (long int) (center % side) + offset_distribution(generator);
+        row = std::max(0L, std::min((long int) side - 1, row));
+        col = std::max(0L, std::min((long int) side - 1, col));
+        matrix.addToUserSourceDataContainer(row * side + col, i, 0);
+    }
+}
+
+int runBenchmark(unsigned long int side, unsigned long int num_sources, unsigned long int num_dests,
+                 unsigned int num_threads, bool clustered)
+{
+    benchmarkMatrix matrix(false, false, num_sources, num_dests);
+    buildGrid(matrix, side);
+    addSources(matrix, side, num_sources, clustered);
+
+    std::mt19937 generator(11);
+    std::uniform_int_distribution<network_node> node_distribution(0, side * side - 1);
+    for (unsigned long int i = 0; i < num_dests; i++)
+    {
+        matrix.addToUserDestDataContainer(node_distribution(generator), i, 0);
+    }
+
+    double single_ms = computeMilliseconds(matrix, 1, num_threads);
+    std::vector<value_type> expected(matrix.df.values(), matrix.df.values() + matrix.df.dataset_size);
+
+    std::cout << (clustered ? "clustered" : "scattered") << " sources" << std::endl;
+    std::cout << "  batch size  1: " << single_ms << " ms" << std::endl;
+    for (unsigned int batch_size : {4, 8, 16, 32})
+    {
+        double batched_ms = computeMilliseconds(matrix, batch_size, num_threads);
+        std::vector<value_type> actual(matrix.df.values(), matrix.df.values() + matrix.df.dataset_size);
+        if (actual != expected)
+        {
+            std::cerr << "matrix mismatch with batch size " << batch_size << std::endl;
+            return 1;
+        }
+        std::cout << "  batch size " << (batch_size < 10 ? " " : "") << batch_size << ": "
+                  << batched_ms << " ms (" << single_ms / batched_ms << "x)" << std::endl;
+    }
+    return 0;
+}
+
+int main(int argc, char **argv)
+{
+    unsigned long int side = argc > 1 ? std::strtoul(argv[1], nullptr, 10) : 200;
+    unsigned long int num_sources = argc > 2 ? std::strtoul(argv[2], nullptr, 10) : 128;
+    unsigned long int num_dests = argc > 3 ? std::strtoul(argv[3], nullptr, 10) : 256;
+    unsigned int num_threads = argc > 4 ? (unsigned int) std::strtoul(argv[4], nullptr, 10) : 1;
+
+    std::cout << "vertices: " << side * side << ", sources: " << num_sources
+              << ", dests: " << num_dests << ", threads: " << num_threads << std::endl;
+    if (runBenchmark(side, num_sources, num_dests, num_threads, false) != 0)
+    {
+        return 1;
+    }
+    return runBenchmark(side, num_sources, num_dests, num_threads, true);
+}
@@ -0,0 +1,116 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+// Compares the indexed heap and the bucket queue in one-to-all searches
+// on synthetic street grids, and checks both produce the same matrix.
+// Edge weights are drawn to resemble walking and driving networks
+// weighted in seconds, and a walking network weighted in meters.
+//
+// Build and run:
+//   cd spatial_access/src
+//   g++ --std=c++11 -O2 -pthread benchmarks/bucketQueueBenchmark.cpp Serializer.cpp threadUtilities.cpp tmxParser.cpp csvParser.cpp mappedFile.cpp compressedChunks.cpp -lz -o bucketQueueBenchmark
+//   ./bucketQueueBenchmark [grid side length] [number of sources] [number of dests]
+
+#include <chrono>
+#include <cstdlib>
+#include <iostream>
+#include <random>
+#include <vector>
+
+#include "../include/transitMatrix.h"
+
+typedef unsigned int value_type;
+typedef transitMatrix<unsigned long int, unsigned long int, value_type> benchmarkMatrix;
+
+/* build a bidirectional side x side grid with edge weights in [min_weight, max_weight] */
+void buildGrid(benchmarkMatrix &matrix, unsigned long int side, value_type min_weight, value_type max_weight)
+{
+    std::mt19937 generator(42);
+    std::uniform_int_distribution<value_type> weight_distribution(min_weight, max_weight);
+    std::vector<network_node> from_column;
+    std::vector<network_node> to_column;
+    std::vector<value_type> weight_column;
+    for (unsigned long int row = 0; row < side; row++)
+    {
+        for (unsigned long int col = 0; col < side; col++)
+        {
+            network_node u = row * side + col;
+            if (col + 1 < side)
+            {
+                from_column.push_back(u);
+                to_column.push_back(u + 1);
+                weight_column.push_back(weight_distribution(generator));
+            }
+            if (row + 1 < side)
+            {
+                from_column.push_back(u);
+                to_column.push_back(u + side);
+                weight_column.push_back(weight_distribution(generator));
+            }
+        }
+    }
+    std::vector<unsigned char> is_bidirectional_column(from_column.size(), 1);
+    matrix.prepareGraphWithVertices(side * side);
+    matrix.addEdgesToGraph(from_column.data(), to_column.data(), weight_column.data(),
+                           is_bidirectional_column.data(), from_column.size());
+}
+
+double computeMilliseconds(benchmarkMatrix &matrix, unsigned long int bucketQueueMaxEdgeWeight)
+{
+    matrix.setBucketQueueMaxEdgeWeight(bucketQueueMaxEdgeWeight);
+    auto start = std::chrono::steady_clock::now();
+    matrix.compute(1);
+    std::chrono::duration<double, std::milli> elapsed = std::chrono::steady_clock::now() - start;
+    return elapsed.count();
+}
+
+int runBenchmark(const std::string &network, value_type min_weight, value_type max_weight,
+                 unsigned long int side, unsigned long int num_sources, unsigned long int num_dests)
+{
+    benchmarkMatrix matrix(false, false, num_sources, num_dests);
+    buildGrid(matrix, side, min_weight, max_weight);
+    std::mt19937 generator(7);
+    std::uniform_int_distribution<network_node> node_distribution(0, side * side - 1);
+    for (unsigned long int i = 0; i < num_sources; i++)
+    {
+        matrix.addToUserSourceDataContainer(node_distribution(generator), i, 0);
+    }
+    for (unsigned long int i = 0; i < num_dests; i++)
+    {
+        matrix.addToUserDestDataContainer(node_distribution(generator), i, 0);
+    }
+
+    double heap_ms = computeMilliseconds(matrix, 0);
+    std::vector<value_type> expected(matrix.df.values(), matrix.df.values() + matrix.df.dataset_size);
+    double bucket_ms = computeMilliseconds(matrix, max_weight);
+    std::vector<value_type> actual(matrix.df.values(), matrix.df.values() + matrix.df.dataset_size);
+    if (actual != expected)
+    {
+        std::cerr << "matrix mismatch on the " << network << " network" << std::endl;
+        return 1;
+    }
+    std::cout << network << " (edge weights " << min_weight << "-" << max_weight << ")" << std::endl;
+    std::cout << "  heap:         " << heap_ms << " ms" << std::endl;
+    std::cout << "  bucket queue: " << bucket_ms << " ms (" << heap_ms / bucket_ms << "x)" << std::endl;
+    return 0;
+}
+
+int main(int argc, char **argv)
+{
+    unsigned long int side = argc > 1 ? std::strtoul(argv[1], nullptr, 10) : 300;
+    unsigned long int num_sources = argc > 2 ? std::strtoul(argv[2], nullptr, 10) : 100;
+    unsigned long int num_dests = argc > 3 ? std::strtoul(argv[3], nullptr, 10) : 1000;
+
+    std::cout << "vertices: " << side * side << ", sources: " << num_sources
+              << ", dests: " << num_dests << std::endl;
+    // ~100 m blocks: walked at 1.4 m/s, driven at 5-15 m/s
+    if (runBenchmark("walk, seconds", 40, 120, side, num_sources, num_dests) != 0
+        || runBenchmark("drive, seconds", 5, 25, side, num_sources, num_dests) != 0
+        || runBenchmark("walk, meters", 50, 400, side, num_sources, num_dests) != 0
+        || runBenchmark("long edges, meters", 50, 5000, side, num_sources, num_dests) != 0)
+    {
+        return 1;
+    }
+    return 0;
+}
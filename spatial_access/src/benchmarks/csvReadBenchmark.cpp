@@ -0,0 +1,114 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+// Compares reading a csv matrix with the memory mapped parallel reader
+// and with the getline/istringstream reader it replaced (reproduced
+// below), and checks both produce the same dataFrame.
+//
+// Build and run:
+//   cd spatial_access/src
+//   g++ --std=c++11 -O2 -pthread benchmarks/csvReadBenchmark.cpp Serializer.cpp threadUtilities.cpp tmxParser.cpp csvParser.cpp mappedFile.cpp compressedChunks.cpp -lz -o csvReadBenchmark
+//   ./csvReadBenchmark [rows] [cols] [threads]
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <iostream>
+#include <random>
+#include <sstream>
+#include <vector>
+
+#include "../include/transitMatrix.h"
+
+typedef unsigned short int value_type;
+typedef dataFrame<unsigned long int, unsigned long int, value_type> benchmarkFrame;
+
+/* the reader used before csvs were memory mapped and parsed in parallel */
+void readCSVWithStreams(benchmarkFrame &df, const std::string &infile)
+{
+    std::ifstream fileIN(infile);
+    csvParser<unsigned long int> labelReader(fileIN);
+    csvParser<value_type> valueReader(fileIN);
+    labelReader.readLine(df.colIds);
+    df.cols = df.colIds.size();
+    std::string line;
+    std::string row_label;
+    std::string value;
+    while (getline(fileIN, line))
+    {
+        std::istringstream stream(line);
+        getline(stream, row_label, ',');
+        df.rowIds.push_back(labelReader.parse(row_label));
+        unsigned long int row_end = df.dataset.size() + df.cols;
+        while (getline(stream, value, ','))
+        {
+            df.dataset.push_back(valueReader.parse(value));
+        }
+        df.dataset.resize(row_end, benchmarkFrame::UNDEFINED);
+    }
+    df.rows = df.rowIds.size();
+}
+
+template <class reader_type>
+double readMilliseconds(benchmarkFrame &df, reader_type reader)
+{
+    auto start = std::chrono::steady_clock::now();
+    reader(df);
+    std::chrono::duration<double, std::milli> elapsed = std::chrono::steady_clock::now() - start;
+    return elapsed.count();
+}
+
+int main(int argc, char **argv)
+{
+    unsigned long int rows = argc > 1 ? std::strtoul(argv[1], nullptr, 10) : 4000;
+    unsigned long int cols = argc > 2 ? std::strtoul(argv[2], nullptr, 10) : 4000;
+    unsigned int num_threads = argc > 3 ? (unsigned int) std::strtoul(argv[3], nullptr, 10)
+                                        : std::max(1u, std::thread::hardware_concurrency());
+    const std::string filename = "csvReadBenchmark.csv";
+
+    std::mt19937 generator(42);
+    std::uniform_int_distribution<value_type> value_distribution(0, 7200);
+    std::vector<unsigned long int> ids;
+    for (unsigned long int i = 0; i < std::max(rows, cols); i++)
+    {
+        ids.push_back(i * 7919);
+    }
+    benchmarkFrame source(false, false, rows, cols);
+    source.setRowIds(std::vector<unsigned long int>(ids.begin(), ids.begin() + rows));
+    source.setColIds(std::vector<unsigned long int>(ids.begin(), ids.begin() + cols));
+    for (unsigned long int row_loc = 0; row_loc < rows; row_loc++)
+    {
+        for (unsigned long int col_loc = 0; col_loc < cols; col_loc++)
+        {
+            // about one value in twenty is unreachable, written as -1
+            value_type value = value_distribution(generator);
+            source.setValueByLoc(row_loc, col_loc, value > 6840 ? benchmarkFrame::UNDEFINED : value);
+        }
+    }
+    source.writeCSV(filename);
+
+    benchmarkFrame expected;
+    double streams_ms = readMilliseconds(expected, [&](benchmarkFrame &df) { readCSVWithStreams(df, filename); });
+    std::cout << rows << " x " << cols << std::endl;
+    std::cout << "  getline/istringstream: " << streams_ms << " ms" << std::endl;
+    for (unsigned int threads : {1u, num_threads})
+    {
+        benchmarkFrame actual;
+        double mapped_ms = readMilliseconds(actual, [&](benchmarkFrame &df) { df.readCSV(filename, threads); });
+        if (actual.dataset != expected.dataset || actual.rowIds != expected.rowIds || actual.colIds != expected.colIds)
+        {
+            std::cerr << "dataFrame mismatch with " << threads << " threads" << std::endl;
+            std::remove(filename.c_str());
+            return 1;
+        }
+        std::cout << "  mapped, " << threads << " thread" << (threads > 1 ? "s" : " ") << ":     "
+                  << mapped_ms << " ms (" << streams_ms / mapped_ms << "x)" << std::endl;
+        if (threads == num_threads)
+        {
+            break;
+        }
+    }
+    std::remove(filename.c_str());
+    return 0;
+}
@@ -0,0 +1,187 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+// Compares the adjacency list and the frozen CSR representation of Graph
+// on a synthetic street grid: memory footprint and per-source Dijkstra time.
+//
+// Build and run from the repository root:
+//   g++ --std=c++11 -O2 spatial_access/src/benchmarks/graphBenchmark.cpp -o graphBenchmark
+//   ./graphBenchmark [grid side length] [number of sources]
+
+#include <chrono>
+#include <cstdlib>
+#include <functional>
+#include <iostream>
+#include <limits>
+#include <queue>
+#include <random>
+#include <vector>
+
+#include "../include/Graph.h"
+
+typedef unsigned short int value_type;
+typedef std::pair<value_type, network_loc> queue_pair;
+
+static const value_type UNDEFINED = std::numeric_limits<value_type>::max();
+
+/* build a bidirectional side x side grid with random edge weights */
+void buildGrid(Graph<value_type> &graph, unsigned long int side)
+{
+    std::mt19937 generator(42);
+    std::uniform_int_distribution<value_type> weight_distribution(5, 60);
+    graph.initializeGraph(side * side);
+    for (unsigned long int row = 0; row < side; row++)
+    {
+        for (unsigned long int col = 0; col < side; col++)
+        {
+            network_loc u = row * side + col;
+            if (col + 1 < side)
+            {
+                value_type weight = weight_distribution(generator);
+                graph.addEdge(u, u + 1, weight);
+                graph.addEdge(u + 1, u, weight);
+            }
+            if (row + 1 < side)
+            {
+                value_type weight = weight_distribution(generator);
+                graph.addEdge(u, u + side, weight);
+                graph.addEdge(u + side, u, weight);
+            }
+        }
+    }
+}
+
+/* bytes held by the adjacency lists, including a typical 16 byte allocator header per list */
+unsigned long int adjacencyListBytes(const Graph<value_type> &graph)
+{
+    unsigned long int bytes = graph.neighbors.capacity() * sizeof(graph.neighbors.at(0));
+    for (const auto &adjacency : graph.neighbors)
+    {
+        if (adjacency.capacity() > 0)
+        {
+            bytes += adjacency.capacity() * sizeof(std::pair<network_loc, value_type>) + 16;
+        }
+    }
+    return bytes;
+}
+
+unsigned long int csrBytes(const Graph<value_type> &graph)
+{
+    return graph.offsets.capacity() * sizeof(network_loc)
+           + graph.targets.capacity() * sizeof(network_loc)
+           + graph.weights.capacity() * sizeof(value_type);
+}
+
+void dijkstraAdjacencyList(const Graph<value_type> &graph, network_loc src, std::vector<value_type> &dist)
+{
+    std::fill(dist.begin(), dist.end(), UNDEFINED);
+    std::vector<bool> visited(graph.vertices, false);
+    std::priority_queue<queue_pair, std::vector<queue_pair>, std::greater<queue_pair>> queue;
+    dist.at(src) = 0;
+    queue.push(std::make_pair(0, src));
+    while (!queue.empty())
+    {
+        network_loc u = queue.top().second;
+        queue.pop();
+        visited.at(u) = true;
+        for (auto neighbor : graph.neighbors.at(u))
+        {
+            auto v = std::get<0>(neighbor);
+            auto weight = std::get<1>(neighbor);
+            if ((!visited.at(v)) and (dist.at(v) > dist.at(u) + weight))
+            {
+                dist.at(v) = dist.at(u) + weight;
+                queue.push(std::make_pair(dist.at(v), v));
+            }
+        }
+    }
+}
+
+void dijkstraCSR(const Graph<value_type> &graph, network_loc src, std::vector<value_type> &dist)
+{
+    std::fill(dist.begin(), dist.end(), UNDEFINED);
+    std::vector<bool> visited(graph.vertices, false);
+    std::priority_queue<queue_pair, std::vector<queue_pair>, std::greater<queue_pair>> queue;
+    dist.at(src) = 0;
+    queue.push(std::make_pair(0, src));
+    while (!queue.empty())
+    {
+        network_loc u = queue.top().second;
+        queue.pop();
+        visited.at(u) = true;
+        const network_loc edges_end = graph.offsets[u + 1];
+        for (network_loc edge = graph.offsets[u]; edge < edges_end; edge++)
+        {
+            auto v = graph.targets[edge];
+            auto weight = graph.weights[edge];
+            if ((!visited[v]) and (dist[v] > dist[u] + weight))
+            {
+                dist[v] = dist[u] + weight;
+                queue.push(std::make_pair(dist[v], v));
+            }
+        }
+    }
+}
+
+double timePerSource(const std::function<void(network_loc)> &search, const std::vector<network_loc> &sources)
+{
+    auto start = std::chrono::steady_clock::now();
+    for (network_loc src : sources)
+    {
+        search(src);
+    }
+    std::chrono::duration<double, std::milli> elapsed = std::chrono::steady_clock::now() - start;
+    return elapsed.count() / sources.size();
+}
+
+int main(int argc, char **argv)
+{
+    unsigned long int side = argc > 1 ? std::strtoul(argv[1], nullptr, 10) : 300;
+    unsigned long int num_sources = argc > 2 ? std::strtoul(argv[2], nullptr, 10) : 20;
+
+    Graph<value_type> graph;
+    buildGrid(graph, side);
+
+    std::mt19937 generator(7);
+    std::uniform_int_distribution<network_loc> node_distribution(0, graph.vertices - 1);
+    std::vector<network_loc> sources;
+    for (unsigned long int i = 0; i < num_sources; i++)
+    {
+        sources.push_back(node_distribution(generator));
+    }
+
+    std::vector<value_type> adjacency_dist(graph.vertices);
+    std::vector<value_type> csr_dist(graph.vertices);
+
+    unsigned long int adjacency_bytes = adjacencyListBytes(graph);
+    double adjacency_ms = timePerSource([&](network_loc src) {
+        dijkstraAdjacencyList(graph, src, adjacency_dist);
+    }, sources);
+
+    Graph<value_type> adjacency_graph = graph;
+    graph.freeze();
+    unsigned long int csr_bytes = csrBytes(graph);
+    double csr_ms = timePerSource([&](network_loc src) {
+        dijkstraCSR(graph, src, csr_dist);
+    }, sources);
+
+    // sanity check: both representations must agree
+    for (network_loc src : sources)
+    {
+        dijkstraAdjacencyList(adjacency_graph, src, adjacency_dist);
+        dijkstraCSR(graph, src, csr_dist);
+        if (adjacency_dist != csr_dist)
+        {
+            std::cerr << "distance mismatch from source " << src << std::endl;
+            return 1;
+        }
+    }
+
+    std::cout << "vertices: " << graph.vertices << ", edges: " << graph.numberOfEdges() << std::endl;
+    std::cout << "adjacency lists: " << adjacency_bytes / 1024 << " KiB, "
+              << adjacency_ms << " ms per source" << std::endl;
+    std::cout << "csr:             " << csr_bytes / 1024 << " KiB, "
+              << csr_ms << " ms per source" << std::endl;
+    return 0;
+}
@@ -0,0 +1,116 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+// Counts heap allocations made by transitMatrix::compute with dense
+// storage. Searches and row fills reuse per-thread state, so the count
+// depends on the number of threads but not on the number of sources or
+// dests: each doubling of the points below should only add the few
+// allocations of reused buffers growing to their new high water mark.
+//
+// Build and run:
+//   cd spatial_access/src
+//   g++ --std=c++11 -O2 -pthread benchmarks/rowFillAllocationBenchmark.cpp Serializer.cpp threadUtilities.cpp tmxParser.cpp csvParser.cpp mappedFile.cpp compressedChunks.cpp -lz -o rowFillAllocationBenchmark
+//   ./rowFillAllocationBenchmark [grid side length] [threads]
+
+#include <atomic>
+#include <chrono>
+#include <cstdlib>
+#include <iostream>
+#include <new>
+#include <random>
+#include <vector>
+
+#include "../include/transitMatrix.h"
+
+static std::atomic<unsigned long int> allocations(0);
+
+void* operator new(std::size_t size)
+{
+    allocations++;
+    void *pointer = std::malloc(size);
+    if (pointer == nullptr)
+    {
+        throw std::bad_alloc();
+    }
+    return pointer;
+}
+
+void operator delete(void *pointer) noexcept
+{
+    std::free(pointer);
+}
+
+typedef unsigned short int value_type;
+typedef transitMatrix<unsigned long int, unsigned long int, value_type> benchmarkMatrix;
+
+/* build a bidirectional side x side grid with random edge weights */
+void buildGrid(benchmarkMatrix &matrix, unsigned long int side)
+{
+    std::mt19937 generator(42);
+    std::uniform_int_distribution<value_type> weight_distribution(5, 60);
+    std::vector<network_node> from_column;
+    std::vector<network_node> to_column;
+    std::vector<value_type> weight_column;
+    for (unsigned long int row = 0; row < side; row++)
+    {
+        for (unsigned long int col = 0; col < side; col++)
+        {
+            network_node u = row * side + col;
+            if (col + 1 < side)
+            {
+                from_column.push_back(u);
+                to_column.push_back(u + 1);
+                weight_column.push_back(weight_distribution(generator));
+            }
+            if (row + 1 < side)
+            {
+                from_column.push_back(u);
+                to_column.push_back(u + side);
+                weight_column.push_back(weight_distribution(generator));
+            }
+        }
+    }
+    std::vector<unsigned char> is_bidirectional_column(from_column.size(), 1);
+    matrix.prepareGraphWithVertices(side * side);
+    matrix.addEdgesToGraph(from_column.data(), to_column.data(), weight_column.data(),
+                           is_bidirectional_column.data(), from_column.size());
+}
+
+void runBenchmark(unsigned long int side, unsigned long int num_points, unsigned int num_threads)
+{
+    benchmarkMatrix matrix(false, false, num_points, num_points);
+    buildGrid(matrix, side);
+    std::mt19937 generator(7);
+    std::uniform_int_distribution<network_node> node_distribution(0, side * side - 1);
+    std::uniform_int_distribution<value_type> last_mile_distribution(0, 30);
+    for (unsigned long int i = 0; i < num_points; i++)
+    {
+        network_node node = node_distribution(generator);
+        matrix.addToUserSourceDataContainer(node, i, last_mile_distribution(generator));
+        matrix.addToUserDestDataContainer(node, i, last_mile_distribution(generator));
+    }
+
+    // the first run also builds the graph's CSR arrays
+    matrix.compute(num_threads, 600);
+    unsigned long int before = allocations.load();
+    auto start = std::chrono::steady_clock::now();
+    matrix.compute(num_threads, 600);
+    std::chrono::duration<double, std::milli> elapsed = std::chrono::steady_clock::now() - start;
+    unsigned long int used = allocations.load() - before;
+    std::cout << "  " << num_points << " x " << num_points << ": " << used << " allocations, "
+              << elapsed.count() << " ms" << std::endl;
+}
+
+int main(int argc, char **argv)
+{
+    unsigned long int side = argc > 1 ? std::strtoul(argv[1], nullptr, 10) : 200;
+    unsigned int num_threads = argc > 2 ? (unsigned int) std::strtoul(argv[2], nullptr, 10) : 1;
+
+    std::cout << "vertices: " << side * side << ", threads: " << num_threads << std::endl;
+    for (unsigned long int num_points : {250, 500, 1000, 2000, 4000})
+    {
+        runBenchmark(side, num_points, num_threads);
+    }
+    return 0;
+}
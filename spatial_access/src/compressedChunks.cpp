@@ -0,0 +1,121 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#include <stdexcept>
+
+#include "include/compressedChunks.h"
+
+#ifdef SPATIAL_ACCESS_HAS_ZLIB
+
+#include <zlib.h>
+
+bool hasCompression()
+{
+    return true;
+}
+
+std::vector<char> compressBytes(const char *data, unsigned long int size, unsigned long int elementSize, int level)
+{
+    if (level < 1 || level > 9)
+    {
+        throw std::runtime_error("compression level must be between 1 and 9");
+    }
+    unsigned long int numElements = size / elementSize;
+    std::vector<char> shuffled(size);
+    for (unsigned long int byte = 0; byte < elementSize; byte++)
+    {
+        char *plane = shuffled.data() + byte * numElements;
+        for (unsigned long int i = 0; i < numElements; i++)
+        {
+            plane[i] = data[i * elementSize + byte];
+        }
+    }
+    uLongf compressedSize = compressBound(size);
+    std::vector<char> compressed(compressedSize);
+    if (compress2(reinterpret_cast<Bytef *>(compressed.data()), &compressedSize,
+                  reinterpret_cast<const Bytef *>(shuffled.data()), size, level) != Z_OK)
+    {
+        throw std::runtime_error("CompressionError: unable to compress chunk");
+    }
+    compressed.resize(compressedSize);
+    return compressed;
+}
+
+void decompressBytes(const char *compressed, unsigned long int compressedSize, char *output,
+                     unsigned long int size, unsigned long int elementSize)
+{
+    std::vector<char> shuffled(size);
+    uLongf outputSize = size;
+    if (uncompress(reinterpret_cast<Bytef *>(shuffled.data()), &outputSize,
+                   reinterpret_cast<const Bytef *>(compressed), compressedSize) != Z_OK || outputSize != size)
+    {
+        throw std::runtime_error("CompressionError: chunk is corrupt");
+    }
+    unsigned long int numElements = size / elementSize;
+    for (unsigned long int byte = 0; byte < elementSize; byte++)
+    {
+        const char *plane = shuffled.data() + byte * numElements;
+        for (unsigned long int i = 0; i < numElements; i++)
+        {
+            output[i * elementSize + byte] = plane[i];
+        }
+    }
+}
+
+std::vector<char> gzipBytes(const char *data, unsigned long int size, int level)
+{
+    if (level < 1 || level > 9)
+    {
+        throw std::runtime_error("compression level must be between 1 and 9");
+    }
+    z_stream stream;
+    stream.zalloc = Z_NULL;
+    stream.zfree = Z_NULL;
+    stream.opaque = Z_NULL;
+    // 16 + the largest window selects a gzip header and trailer
+    if (deflateInit2(&stream, level, Z_DEFLATED, 16 + MAX_WBITS, 8, Z_DEFAULT_STRATEGY) != Z_OK)
+    {
+        throw std::runtime_error("CompressionError: unable to start gzip stream");
+    }
+    std::vector<char> compressed(deflateBound(&stream, size));
+    stream.next_in = reinterpret_cast<Bytef *>(const_cast<char *>(data));
+    stream.avail_in = (uInt) size;
+    stream.next_out = reinterpret_cast<Bytef *>(compressed.data());
+    stream.avail_out = (uInt) compressed.size();
+    int status = deflate(&stream, Z_FINISH);
+    compressed.resize(stream.total_out);
+    deflateEnd(&stream);
+    if (status != Z_STREAM_END)
+    {
+        throw std::runtime_error("CompressionError: unable to gzip block");
+    }
+    return compressed;
+}
+
+#else
+
+// built without zlib: tmx and csv files can only be read and written uncompressed
+
+bool hasCompression()
+{
+    return false;
+}
+
+std::vector<char> compressBytes(const char *data, unsigned long int size, unsigned long int elementSize, int level)
+{
+    throw std::runtime_error("CompressionError: spatial_access was built without zlib");
+}
+
+void decompressBytes(const char *compressed, unsigned long int compressedSize, char *output,
+                     unsigned long int size, unsigned long int elementSize)
+{
+    throw std::runtime_error("CompressionError: spatial_access was built without zlib");
+}
+
+std::vector<char> gzipBytes(const char *data, unsigned long int size, int level)
+{
+    throw std::runtime_error("CompressionError: spatial_access was built without zlib");
+}
+
+#endif
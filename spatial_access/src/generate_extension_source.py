@@ -19,10 +19,12 @@ ID_TYPES = [{"type_name":"ulong",
 
 VALUE_TYPES = [{"type_name":"ushort",
                 "type_name_full":"unsigned short int",
-                "type_name_short":"US"},
+                "type_name_short":"US",
+                "buffer_format": "H"},
                 {"type_name": "uint",
                  "type_name_full": "unsigned int",
-                 "type_name_short": "UI"}]
+                 "type_name_short": "UI",
+                 "buffer_format": "I"}]
 
 
 def build_param_dict(row_id_type, col_id_type, value_type):
@@ -33,6 +35,8 @@ def build_param_dict(row_id_type, col_id_type, value_type):
 
     return_value['class_name'] = 'transitMatrix' + type_extension
     return_value['py_class_name'] = 'pyTransitMatrix' + type_extension
+    return_value['lazy_class_name'] = 'lazyTMXReader' + type_extension
+    return_value['py_lazy_class_name'] = 'pyLazyTMXReader' + type_extension
 
     return_value['row_type'] = row_id_type['type_name']
     return_value['row_type_full'] = row_id_type['type_name_full']
@@ -42,6 +46,7 @@ def build_param_dict(row_id_type, col_id_type, value_type):
 
     return_value['value_type'] = value_type['type_name']
     return_value['value_type_full'] = value_type['type_name_full']
+    return_value['value_buffer_format'] = value_type['buffer_format']
 
     return return_value
 
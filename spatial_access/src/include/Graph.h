@@ -10,23 +10,47 @@
 
 typedef unsigned long int network_loc;
 
+/* A directed, weighted graph. Edges are accumulated in per-vertex
+ * adjacency lists, then frozen into a compressed sparse row (CSR)
+ * representation (offsets, targets, weights) which is what the
+ * shortest path workers traverse. */
 template <class value_type>
 class Graph
 {
 public:
     Graph()= default;
-    unsigned long int vertices;
+    unsigned long int vertices = 0;
     std::vector<std::vector<std::pair<network_loc, value_type>>> neighbors;
+
+    // CSR representation: the edges leaving vertex u are
+    // targets[offsets[u]] ... targets[offsets[u + 1] - 1]
+    std::vector<network_loc> offsets;
+    std::vector<network_loc> targets;
+    std::vector<value_type> weights;
+    bool isFrozen = false;
+
     void initializeGraph(unsigned long int vertices)
     {
         std::vector<std::pair<network_loc , value_type>> value;
         this->neighbors.assign(vertices, value);
         this->vertices = vertices;
+        this->offsets.clear();
+        this->targets.clear();
+        this->weights.clear();
+        this->isFrozen = false;
     }
 
 /* Adds an edge to an undirected graph */
     void addEdge(network_loc src, network_loc dest, value_type weight)
     {
+        if (isFrozen)
+        {
+            throw std::runtime_error("cannot add edges to a frozen graph");
+        }
+        if (dest >= vertices)
+        {
+            throw std::runtime_error("edge incompatible with declared graph structure");
+        }
         try
         {
             this->neighbors.at(src).push_back(std::make_pair(dest, weight));
@@ -37,4 +61,151 @@ public:
         }
     }
 
-};
\ No newline at end of file
+/* Presize each adjacency list for outDegrees[u] more edges */
+    void reserveEdges(const std::vector<unsigned long int> &outDegrees)
+    {
+        if (isFrozen)
+        {
+            throw std::runtime_error("cannot add edges to a frozen graph");
+        }
+        for (network_loc u = 0; u < vertices && u < outDegrees.size(); u++)
+        {
+            if (outDegrees[u] > 0)
+            {
+                neighbors[u].reserve(neighbors[u].size() + outDegrees[u]);
+            }
+        }
+    }
+
+/* Build the CSR arrays from the adjacency lists and release the lists */
+    void freeze()
+    {
+        if (isFrozen)
+        {
+            return;
+        }
+        unsigned long int num_edges = 0;
+        for (const auto &adjacency : neighbors)
+        {
+            num_edges += adjacency.size();
+        }
+        offsets.assign(vertices + 1, 0);
+        targets.clear();
+        weights.clear();
+        targets.reserve(num_edges);
+        weights.reserve(num_edges);
+        for (network_loc u = 0; u < vertices; u++)
+        {
+            offsets.at(u) = targets.size();
+            for (const auto &neighbor : neighbors.at(u))
+            {
+                targets.push_back(std::get<0>(neighbor));
+                weights.push_back(std::get<1>(neighbor));
+            }
+        }
+        offsets.at(vertices) = targets.size();
+        std::vector<std::vector<std::pair<network_loc, value_type>>>().swap(neighbors);
+        isFrozen = true;
+    }
+
+/* FNV-1a hash of the frozen graph, used to match preprocessed data to a graph */
+    unsigned long int
+    checksum() const
+    {
+        if (!isFrozen)
+        {
+            throw std::runtime_error("graph must be frozen to compute its checksum");
+        }
+        unsigned long int hash = 14695981039346656037UL;
+        auto mix = [&hash](unsigned long int value) {
+            hash ^= value;
+            hash *= 1099511628211UL;
+        };
+        mix(vertices);
+        for (network_loc u = 0; u < vertices; u++)
+        {
+            mix(offsets[u + 1] - offsets[u]);
+            for (network_loc edge = offsets[u]; edge < offsets[u + 1]; edge++)
+            {
+                mix(targets[edge]);
+                mix(weights[edge]);
+            }
+        }
+        return hash;
+    }
+
+    unsigned long int
+    numberOfEdges() const
+    {
+        if (isFrozen)
+        {
+            return targets.size();
+        }
+        unsigned long int num_edges = 0;
+        for (const auto &adjacency : neighbors)
+        {
+            num_edges += adjacency.size();
+        }
+        return num_edges;
+    }
+
+    /* position of each vertex in a breadth first traversal of the frozen
+     * graph, restarted from the lowest unvisited vertex for every component */
+    std::vector<network_loc>
+    breadthFirstRanks() const
+    {
+        if (!isFrozen)
+        {
+            throw std::runtime_error("graph must be frozen to rank vertices");
+        }
+        const network_loc unranked = vertices;
+        std::vector<network_loc> rank(vertices, unranked);
+        std::vector<network_loc> order;
+        order.reserve(vertices);
+        for (network_loc root = 0; root < vertices; root++)
+        {
+            if (rank[root] != unranked)
+            {
+                continue;
+            }
+            rank[root] = order.size();
+            order.push_back(root);
+            for (network_loc head = rank[root]; head < order.size(); head++)
+            {
+                network_loc u = order[head];
+                for (network_loc edge = offsets[u]; edge < offsets[u + 1]; edge++)
+                {
+                    if (rank[targets[edge]] == unranked)
+                    {
+                        rank[targets[edge]] = order.size();
+                        order.push_back(targets[edge]);
+                    }
+                }
+            }
+        }
+        return rank;
+    }
+
+    value_type
+    maxEdgeWeight() const
+    {
+        value_type max_weight = 0;
+        if (isFrozen)
+        {
+            for (value_type weight : weights)
+            {
+                max_weight = std::max(max_weight, weight);
+            }
+            return max_weight;
+        }
+        for (const auto &adjacency : neighbors)
+        {
+            for (const auto &edge : adjacency)
+            {
+                max_weight = std::max(max_weight, edge.second);
+            }
+        }
+        return max_weight;
+    }
+
+};
@@ -23,7 +23,7 @@ public:
     {
         unsigned long int vec_size = value.size();
         writeNumericType<unsigned long int>(vec_size);
-        output.write((char *) &value[0], vec_size * sizeof(T));
+        output.write((const char *) value.data(), vec_size * sizeof(T));
         checkStreamIsGood();
     }
 
@@ -51,7 +51,16 @@ public:
         }
         checkStreamIsGood();
     }
+    template <class T> void writeBlock(const T* values, unsigned long int size)
+    {
+        output.write((const char *) values, size * sizeof(T));
+        checkStreamIsGood();
+    }
+
     void writeBool(bool value);
+    unsigned long int position();
+    void seek(unsigned long int position);
+    void writePadding(unsigned long int alignment);
 private:
     std::ofstream output;
     void checkStreamIsGood();
@@ -74,7 +83,7 @@ public:
         auto vec_size = readNumericType<unsigned long>();
 
         value.assign(vec_size, 0);
-        input.read(reinterpret_cast<char *>(&value[0]), vec_size*sizeof(T));
+        input.read(reinterpret_cast<char *>(value.data()), vec_size*sizeof(T));
         checkStreamIsGood();
     }
 
@@ -107,7 +116,16 @@ public:
         checkStreamIsGood();
     }
 
+    template <class T> void readBlock(T* values, unsigned long int size)
+    {
+        input.read(reinterpret_cast<char *>(values), size * sizeof(T));
+        checkStreamIsGood();
+    }
+
     bool readBool();
+    unsigned long int position();
+    void seek(unsigned long int position);
+    void skipPadding(unsigned long int alignment);
 private:
     std::ifstream input;
     void checkStreamIsGood();
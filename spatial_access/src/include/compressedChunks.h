@@ -0,0 +1,39 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#pragma once
+
+#include <vector>
+
+// raw bytes aimed for per compressed chunk of a tmx value block
+#define TMX_CHUNK_BYTES (1 << 20)
+
+/* One independently compressed block of whole rows of a tmx value block */
+struct tmxChunk {
+    // first row in the chunk, and the first value as an index into the dense block
+    unsigned long int firstRow;
+    unsigned long int firstValue;
+    unsigned long int numValues;
+    // where the compressed bytes start in the file
+    unsigned long int offset;
+    unsigned long int compressedSize;
+};
+
+/* false if the extension was built without zlib, in which case the functions
+ * below throw */
+bool hasCompression();
+
+/* Compress size bytes of elementSize byte values with zlib (deflate) at level
+ * 1 (fastest) to 9 (smallest). Bytes are first shuffled so the first byte of
+ * every value comes first, then every second byte, and so on: the high bytes
+ * of matrix values vary slowly, which deflate compresses far better. */
+std::vector<char> compressBytes(const char *data, unsigned long int size, unsigned long int elementSize, int level);
+
+/* inflate compressedSize bytes into exactly size bytes at output, undoing the shuffle */
+void decompressBytes(const char *compressed, unsigned long int compressedSize, char *output,
+                     unsigned long int size, unsigned long int elementSize);
+
+/* Compress size bytes as one complete gzip member at level 1 to 9. A
+ * file of concatenated members is itself a valid gzip file. */
+std::vector<char> gzipBytes(const char *data, unsigned long int size, int level);
@@ -0,0 +1,483 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#pragma once
+
+#include <vector>
+#include <queue>
+#include <functional>
+#include <limits>
+#include <stdexcept>
+#include <string>
+#include <algorithm>
+#include <tuple>
+
+#include "Graph.h"
+#include "Serializer.h"
+
+#define CH_VERSION (1)
+
+// nodes a witness search may settle before giving up (and adding the shortcut)
+#define CH_WITNESS_SETTLE_LIMIT (500)
+
+// distance of a node a search has not reached
+static const unsigned long int CH_UNREACHED = std::numeric_limits<unsigned long int>::max();
+
+typedef std::vector<std::pair<network_loc, unsigned long int>> weightedAdjacency;
+
+/* Dijkstra from one node over a static CSR graph, bounded by maxDistance.
+ * Distances are reset in O(touched) so one instance serves many searches. */
+class boundedSearch
+{
+public:
+    std::vector<unsigned long int> dist;
+    // nodes in the order they were settled
+    std::vector<network_loc> settled;
+
+    explicit boundedSearch(unsigned long int vertices) : dist(vertices, CH_UNREACHED) {}
+
+    template <class value_type>
+    void run(network_loc src, const std::vector<network_loc> &offsets, const std::vector<network_loc> &targets,
+             const std::vector<value_type> &weights, unsigned long int maxDistance)
+    {
+        typedef std::pair<unsigned long int, network_loc> queue_pair;
+        reset();
+        std::priority_queue<queue_pair, std::vector<queue_pair>, std::greater<queue_pair>> queue;
+        relax(src, 0);
+        queue.push(std::make_pair(0, src));
+        while (!queue.empty())
+        {
+            auto top = queue.top();
+            queue.pop();
+            network_loc u = top.second;
+            // skip stale queue entries
+            if (top.first > dist[u])
+            {
+                continue;
+            }
+            settled.push_back(u);
+            for (network_loc edge = offsets[u]; edge < offsets[u + 1]; edge++)
+            {
+                unsigned long int candidate = top.first + weights[edge];
+                if (candidate <= maxDistance && relax(targets[edge], candidate))
+                {
+                    queue.push(std::make_pair(candidate, targets[edge]));
+                }
+            }
+        }
+    }
+
+private:
+    std::vector<network_loc> touched;
+
+    void reset()
+    {
+        for (network_loc v : touched)
+        {
+            dist[v] = CH_UNREACHED;
+        }
+        touched.clear();
+        settled.clear();
+    }
+
+    bool relax(network_loc v, unsigned long int candidate)
+    {
+        if (candidate >= dist[v])
+        {
+            return false;
+        }
+        if (dist[v] == CH_UNREACHED)
+        {
+            touched.push_back(v);
+        }
+        dist[v] = candidate;
+        return true;
+    }
+};
+
+
+/* A contraction hierarchy of a Graph. Nodes are contracted one at a time
+ * in order of importance, adding shortcut edges where the contracted node
+ * lay on the only shortest path between two neighbors. A shortest path
+ * then always climbs to a highest node and descends, so queries only
+ * search the upward edges from each end. */
+template <class value_type>
+class contractionHierarchy
+{
+public:
+    unsigned long int vertices = 0;
+    unsigned long int graphChecksum = 0;
+    unsigned long int numShortcuts = 0;
+    // order in which nodes were contracted
+    std::vector<unsigned long int> rank;
+    // forward search: edges u -> v of the graph (or shortcuts) with rank[v] > rank[u]
+    std::vector<network_loc> upOffsets;
+    std::vector<network_loc> upTargets;
+    std::vector<value_type> upWeights;
+    // backward search: edges u -> v of the graph (or shortcuts) with rank[u] > rank[v], stored at v
+    std::vector<network_loc> downOffsets;
+    std::vector<network_loc> downTargets;
+    std::vector<value_type> downWeights;
+
+    contractionHierarchy() = default;
+
+    void build(const Graph<value_type> &graph)
+    {
+        if (!graph.isFrozen)
+        {
+            throw std::runtime_error("graph must be frozen before contraction");
+        }
+        vertices = graph.vertices;
+        graphChecksum = graph.checksum();
+        numShortcuts = 0;
+
+        std::vector<weightedAdjacency> out(vertices);
+        std::vector<weightedAdjacency> in(vertices);
+        for (network_loc u = 0; u < vertices; u++)
+        {
+            for (network_loc edge = graph.offsets[u]; edge < graph.offsets[u + 1]; edge++)
+            {
+                network_loc v = graph.targets[edge];
+                if (u != v)
+                {
+                    setEdge(out[u], v, graph.weights[edge]);
+                    setEdge(in[v], u, graph.weights[edge]);
+                }
+            }
+        }
+
+        std::vector<std::vector<std::pair<network_loc, value_type>>> up(vertices);
+        std::vector<std::vector<std::pair<network_loc, value_type>>> down(vertices);
+        std::vector<unsigned long int> contractedNeighbors(vertices, 0);
+        std::vector<std::tuple<network_loc, network_loc, unsigned long int>> shortcuts;
+        witnessSearch witness(vertices);
+
+        typedef std::pair<long int, network_loc> queue_pair;
+        std::priority_queue<queue_pair, std::vector<queue_pair>, std::greater<queue_pair>> order;
+        for (network_loc v = 0; v < vertices; v++)
+        {
+            order.push(std::make_pair(priority(v, out, in, contractedNeighbors, witness, shortcuts), v));
+        }
+
+        rank.assign(vertices, 0);
+        unsigned long int next_rank = 0;
+        while (!order.empty())
+        {
+            network_loc v = order.top().second;
+            order.pop();
+            // priorities change as neighbors are contracted, so re-check lazily
+            long int current = priority(v, out, in, contractedNeighbors, witness, shortcuts);
+            if (!order.empty() && current > order.top().first)
+            {
+                order.push(std::make_pair(current, v));
+                continue;
+            }
+            for (const auto &neighbor : out[v])
+            {
+                up[v].push_back(std::make_pair(neighbor.first, (value_type) neighbor.second));
+                removeEdgesTo(in[neighbor.first], v);
+                contractedNeighbors[neighbor.first]++;
+            }
+            for (const auto &neighbor : in[v])
+            {
+                down[v].push_back(std::make_pair(neighbor.first, (value_type) neighbor.second));
+                removeEdgesTo(out[neighbor.first], v);
+                contractedNeighbors[neighbor.first]++;
+            }
+            for (const auto &shortcut : shortcuts)
+            {
+                setEdge(out[std::get<0>(shortcut)], std::get<1>(shortcut), std::get<2>(shortcut));
+                setEdge(in[std::get<1>(shortcut)], std::get<0>(shortcut), std::get<2>(shortcut));
+            }
+            numShortcuts += shortcuts.size();
+            weightedAdjacency().swap(out[v]);
+            weightedAdjacency().swap(in[v]);
+            rank[v] = next_rank++;
+        }
+        toCSR(up, upOffsets, upTargets, upWeights);
+        toCSR(down, downOffsets, downTargets, downWeights);
+    }
+
+    void write(const std::string &filename) const
+    {
+        Serializer serializer(filename);
+        serializer.writeNumericType<unsigned short>(CH_VERSION);
+        serializer.writeNumericType<unsigned short>(sizeof(value_type));
+        serializer.writeNumericType<unsigned long int>(vertices);
+        serializer.writeNumericType<unsigned long int>(graphChecksum);
+        serializer.writeNumericType<unsigned long int>(numShortcuts);
+        serializer.writeVector(rank);
+        serializer.writeVector(upOffsets);
+        serializer.writeVector(upTargets);
+        serializer.writeVector(upWeights);
+        serializer.writeVector(downOffsets);
+        serializer.writeVector(downTargets);
+        serializer.writeVector(downWeights);
+    }
+
+    /* Read a hierarchy written by write(). Throws if it was built from a different graph. */
+    void read(const std::string &filename, const Graph<value_type> &graph)
+    {
+        Deserializer deserializer(filename);
+        if (deserializer.readNumericType<unsigned short>() != CH_VERSION)
+        {
+            throw std::runtime_error("unsupported contraction hierarchy version");
+        }
+        if (deserializer.readNumericType<unsigned short>() != sizeof(value_type))
+        {
+            throw std::runtime_error("contraction hierarchy has a different value type");
+        }
+        vertices = deserializer.readNumericType<unsigned long int>();
+        graphChecksum = deserializer.readNumericType<unsigned long int>();
+        if (vertices != graph.vertices || graphChecksum != graph.checksum())
+        {
+            throw std::runtime_error("contraction hierarchy was built from a different graph");
+        }
+        numShortcuts = deserializer.readNumericType<unsigned long int>();
+        deserializer.readVector(rank);
+        deserializer.readVector(upOffsets);
+        deserializer.readVector(upTargets);
+        deserializer.readVector(upWeights);
+        deserializer.readVector(downOffsets);
+        deserializer.readVector(downTargets);
+        deserializer.readVector(downWeights);
+        if (upOffsets.size() != vertices + 1 || downOffsets.size() != vertices + 1)
+        {
+            throw std::runtime_error("contraction hierarchy is corrupted");
+        }
+    }
+
+private:
+    static constexpr unsigned long int UNDEFINED = std::numeric_limits<value_type>::max();
+
+    /* Dijkstra over the uncontracted graph which ignores one node */
+    class witnessSearch
+    {
+    public:
+        std::vector<unsigned long int> dist;
+        explicit witnessSearch(unsigned long int vertices)
+        : dist(vertices, CH_UNREACHED) {}
+
+        void run(network_loc src, network_loc ignored, const std::vector<weightedAdjacency> &out,
+                 unsigned long int maxDistance)
+        {
+            typedef std::pair<unsigned long int, network_loc> queue_pair;
+            for (network_loc v : touched)
+            {
+                dist[v] = CH_UNREACHED;
+            }
+            touched.clear();
+            std::priority_queue<queue_pair, std::vector<queue_pair>, std::greater<queue_pair>> queue;
+            dist[src] = 0;
+            touched.push_back(src);
+            queue.push(std::make_pair(0, src));
+            unsigned long int settled = 0;
+            while (!queue.empty() && settled < CH_WITNESS_SETTLE_LIMIT)
+            {
+                auto top = queue.top();
+                queue.pop();
+                network_loc u = top.second;
+                if (top.first > dist[u])
+                {
+                    continue;
+                }
+                if (top.first > maxDistance)
+                {
+                    break;
+                }
+                settled++;
+                for (const auto &neighbor : out[u])
+                {
+                    network_loc v = neighbor.first;
+                    unsigned long int candidate = top.first + neighbor.second;
+                    if (v == ignored || candidate > maxDistance || candidate >= dist[v])
+                    {
+                        continue;
+                    }
+                    if (dist[v] == CH_UNREACHED)
+                    {
+                        touched.push_back(v);
+                    }
+                    dist[v] = candidate;
+                    queue.push(std::make_pair(candidate, v));
+                }
+            }
+        }
+    private:
+        std::vector<network_loc> touched;
+    };
+
+    static void setEdge(weightedAdjacency &adjacency, network_loc target, unsigned long int weight)
+    {
+        for (auto &neighbor : adjacency)
+        {
+            if (neighbor.first == target)
+            {
+                neighbor.second = std::min(neighbor.second, weight);
+                return;
+            }
+        }
+        adjacency.push_back(std::make_pair(target, weight));
+    }
+
+    static void removeEdgesTo(weightedAdjacency &adjacency, network_loc target)
+    {
+        adjacency.erase(std::remove_if(adjacency.begin(), adjacency.end(),
+                                       [target](const std::pair<network_loc, unsigned long int> &neighbor) {
+                                           return neighbor.first == target;
+                                       }),
+                        adjacency.end());
+    }
+
+    /* Find the shortcuts contracting v would need, and return its priority:
+     * the edge difference plus the number of already contracted neighbors */
+    long int priority(network_loc v, const std::vector<weightedAdjacency> &out,
+                      const std::vector<weightedAdjacency> &in,
+                      const std::vector<unsigned long int> &contractedNeighbors,
+                      witnessSearch &witness,
+                      std::vector<std::tuple<network_loc, network_loc, unsigned long int>> &shortcuts) const
+    {
+        shortcuts.clear();
+        for (const auto &incoming : in[v])
+        {
+            network_loc u = incoming.first;
+            unsigned long int maxDistance = 0;
+            bool hasTarget = false;
+            for (const auto &outgoing : out[v])
+            {
+                if (outgoing.first != u)
+                {
+                    maxDistance = std::max(maxDistance, incoming.second + outgoing.second);
+                    hasTarget = true;
+                }
+            }
+            // zero weight paths through v still need shortcuts, so test for targets rather than distance
+            if (!hasTarget)
+            {
+                continue;
+            }
+            witness.run(u, v, out, maxDistance);
+            for (const auto &outgoing : out[v])
+            {
+                unsigned long int through = incoming.second + outgoing.second;
+                // paths this long are undefined in any matrix, so need no shortcut
+                if (outgoing.first == u || through >= UNDEFINED)
+                {
+                    continue;
+                }
+                if (witness.dist[outgoing.first] > through)
+                {
+                    shortcuts.push_back(std::make_tuple(u, outgoing.first, through));
+                }
+            }
+        }
+        return (long int) shortcuts.size() - (long int) (in[v].size() + out[v].size())
+               + (long int) contractedNeighbors[v];
+    }
+
+    static void toCSR(const std::vector<std::vector<std::pair<network_loc, value_type>>> &adjacency,
+                      std::vector<network_loc> &offsets, std::vector<network_loc> &targets,
+                      std::vector<value_type> &weights)
+    {
+        offsets.assign(adjacency.size() + 1, 0);
+        targets.clear();
+        weights.clear();
+        for (network_loc u = 0; u < adjacency.size(); u++)
+        {
+            offsets[u] = targets.size();
+            for (const auto &neighbor : adjacency[u])
+            {
+                targets.push_back(neighbor.first);
+                weights.push_back(neighbor.second);
+            }
+        }
+        offsets[adjacency.size()] = targets.size();
+    }
+};
+
+
+/* Bucket based many-to-many queries on a contraction hierarchy. A backward
+ * upward search from every target leaves (target, distance) entries in
+ * the bucket of each node it settles; a forward upward search from a
+ * source then scans the buckets of the nodes it settles. */
+template <class value_type>
+class manyToManyBuckets
+{
+public:
+    manyToManyBuckets(const contractionHierarchy<value_type> &hierarchy,
+                      const std::vector<network_loc> &targetNodes,
+                      unsigned long int maxDistance)
+    : hierarchy(hierarchy), targetNodes(targetNodes), maxDistance(maxDistance)
+    {
+        boundedSearch search(hierarchy.vertices);
+        std::vector<std::vector<std::pair<unsigned long int, unsigned long int>>> buckets(hierarchy.vertices);
+        unsigned long int numEntries = 0;
+        for (unsigned long int i = 0; i < targetNodes.size(); i++)
+        {
+            search.run(targetNodes[i], hierarchy.downOffsets, hierarchy.downTargets,
+                       hierarchy.downWeights, maxDistance);
+            for (network_loc v : search.settled)
+            {
+                buckets[v].push_back(std::make_pair(i, search.dist[v]));
+            }
+            numEntries += search.settled.size();
+        }
+        // flatten the buckets so a forward search reads them contiguously
+        offsets.assign(hierarchy.vertices + 1, 0);
+        entryTargets.reserve(numEntries);
+        entryDistances.reserve(numEntries);
+        for (network_loc v = 0; v < hierarchy.vertices; v++)
+        {
+            offsets[v] = entryTargets.size();
+            for (const auto &entry : buckets[v])
+            {
+                entryTargets.push_back(entry.first);
+                entryDistances.push_back(entry.second);
+            }
+        }
+        offsets[hierarchy.vertices] = entryTargets.size();
+    }
+
+    /* Write the distance from src to every target node into dist[target node].
+     * Returns the number of nodes settled by the forward search. */
+    unsigned long int
+    distancesFrom(network_loc src, boundedSearch &search, std::vector<unsigned long int> &best,
+                  std::vector<value_type> &dist) const
+    {
+        search.run(src, hierarchy.upOffsets, hierarchy.upTargets, hierarchy.upWeights, maxDistance);
+        best.assign(targetNodes.size(), CH_UNREACHED);
+        for (network_loc u : search.settled)
+        {
+            unsigned long int to_u = search.dist[u];
+            for (unsigned long int entry = offsets[u]; entry < offsets[u + 1]; entry++)
+            {
+                unsigned long int candidate = to_u + entryDistances[entry];
+                if (candidate < best[entryTargets[entry]])
+                {
+                    best[entryTargets[entry]] = candidate;
+                }
+            }
+        }
+        for (unsigned long int i = 0; i < targetNodes.size(); i++)
+        {
+            dist[targetNodes[i]] = best[i] > maxDistance ? UNDEFINED : (value_type) best[i];
+        }
+        return search.settled.size();
+    }
+
+private:
+    static constexpr value_type UNDEFINED = std::numeric_limits<value_type>::max();
+    const contractionHierarchy<value_type> &hierarchy;
+    const std::vector<network_loc> targetNodes;
+    const unsigned long int maxDistance;
+    std::vector<unsigned long int> offsets;
+    std::vector<unsigned long int> entryTargets;
+    std::vector<unsigned long int> entryDistances;
+};
+
+template <class value_type>
+constexpr unsigned long int contractionHierarchy<value_type>::UNDEFINED;
+
+template <class value_type>
+constexpr value_type manyToManyBuckets<value_type>::UNDEFINED;
@@ -4,12 +4,53 @@
 
 #pragma once
 
+#include <algorithm>
 #include <fstream>
+#include <stdexcept>
 #include <vector>
 #include <sstream>
 #include <type_traits>
 #include <limits>
 
+/* digits after optional leading spaces, like std::stoul without the
+ * string copy. As in csvParser::parse, a field containing -1 is undefined */
+template <class T>
+inline typename std::enable_if<std::is_integral<T>::value, T>::type
+parseCSVField(const char *begin, const char *end)
+{
+    const char *position = begin;
+    while (position != end && *position == ' ')
+    {
+        position++;
+    }
+    unsigned long value = 0;
+    const char *digits = position;
+    for (; position != end && *position >= '0' && *position <= '9'; position++)
+    {
+        value = value * 10 + (unsigned long) (*position - '0');
+    }
+    if (position != end)
+    {
+        const char undefined[] = "-1";
+        if (std::search(begin, end, undefined, undefined + 2) != end)
+        {
+            return std::numeric_limits<T>::max();
+        }
+    }
+    if (position == digits)
+    {
+        throw std::invalid_argument("csv field is not an unsigned integer");
+    }
+    return (T) value;
+}
+
+template <class T>
+inline typename std::enable_if<!std::is_integral<T>::value, T>::type
+parseCSVField(const char *begin, const char *end)
+{
+    return T(begin, end);
+}
+
 template <class T>
 class csvParser {
 private:
@@ -34,5 +75,11 @@ public:
 
     static const T parse(const std::string& item);
 
+    /* parse the field in [begin, end) in place, as parse would */
+    static const T parseField(const char *begin, const char *end)
+    {
+        return parseCSVField<T>(begin, end);
+    }
+
 
 };
@@ -0,0 +1,55 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#pragma once
+
+#include <string>
+#include <type_traits>
+#include <vector>
+
+// the text of the numbers 00 to 99, two characters each
+static const char CSV_DIGIT_PAIRS[] =
+    "00010203040506070809101112131415161718192021222324252627282930313233343536373839"
+    "40414243444546474849505152535455565758596061626364656667686970717273747576777879"
+    "8081828384858687888990919293949596979899";
+
+/* append the decimal digits of value, two at a time */
+inline void
+appendCSVUnsigned(std::vector<char>& buffer, unsigned long int value)
+{
+    char digits[20];
+    char *first = digits + sizeof(digits);
+    while (value >= 100)
+    {
+        const char *pair = CSV_DIGIT_PAIRS + (value % 100) * 2;
+        value /= 100;
+        *--first = pair[1];
+        *--first = pair[0];
+    }
+    if (value >= 10)
+    {
+        const char *pair = CSV_DIGIT_PAIRS + value * 2;
+        *--first = pair[1];
+        *--first = pair[0];
+    }
+    else
+    {
+        *--first = (char) ('0' + value);
+    }
+    buffer.insert(buffer.end(), first, digits + sizeof(digits));
+}
+
+template <class T>
+inline typename std::enable_if<std::is_integral<T>::value>::type
+appendCSVField(std::vector<char>& buffer, const T& value)
+{
+    appendCSVUnsigned(buffer, (unsigned long int) value);
+}
+
+template <class T>
+inline typename std::enable_if<!std::is_integral<T>::value>::type
+appendCSVField(std::vector<char>& buffer, const T& value)
+{
+    buffer.insert(buffer.end(), value.begin(), value.end());
+}
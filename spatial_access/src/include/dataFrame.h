@@ -12,21 +12,49 @@
 #include <algorithm>
 #include <limits>
 #include <iostream>
+#include <memory>
+#include <thread>
+#include <atomic>
+#include <cstring>
+#include <exception>
 #include "Serializer.h"
+#include "mappedFile.h"
 #include "tmxParser.h"
 #include "csvParser.h"
+#include "csvWriter.h"
 #include "otpCSV.h"
 
-#define TMX_VERSION (2)
+#define TMX_VERSION (3)
+// bytes of text aimed for per block of rows of a csv
+#define CSV_BLOCK_BYTES (1 << 22)
+
+/* how the values of a tmx (version 3+) are laid out on disk */
+enum TMXLayoutTypes {
+    DenseLayout,
+    SparseLayout,
+    ContiguousLayout,
+    // fixed width ids, then the dense values as independently
+    // compressed chunks of whole rows, located by a chunk index
+    CompressedLayout
+};
 
 /* a pandas-like dataFrame */
 template <class row_label_type, class col_label_type, class value_type>
 class dataFrame {
 public:
     static constexpr value_type UNDEFINED = std::numeric_limits<value_type>::max();
-    std::vector<std::vector<value_type>> dataset;
+    // dense storage: row-major values, or the upper triangle if compressible
+    std::vector<value_type> dataset;
+    // when set, dense values are served read-only from a memory mapped tmx
+    std::shared_ptr<mappedFile> mapping;
+    unsigned long int mappedValuesOffset = 0;
+    // sparse storage: for each row, the sorted col locs of the values which
+    // are not UNDEFINED, and the values themselves
+    std::vector<std::vector<unsigned long int>> sparseColLocs;
+    std::vector<std::vector<value_type>> sparseValues;
     bool isCompressible;
     bool isSymmetric;
+    bool isSparse = false;
     unsigned long int rows;
     unsigned long int cols;
     std::vector<row_label_type> rowIds;
@@ -67,6 +95,7 @@ public:
     {
         isCompressible = false;
         isSymmetric = false;
+        isSparse = false;
         otpCSVReader<row_label_type, col_label_type, value_type> reader(filename);
         auto reader_row_labels = reader.row_labels;
         auto reader_col_labels = reader.col_labels;
@@ -82,11 +111,8 @@ public:
         indexCols();
         initializeDatatsetSize();
 
-        for (unsigned int row_loc = 0; row_loc < rows; row_loc++)
-        {
-            std::vector<value_type> data(cols, UNDEFINED);
-            dataset.push_back(data);
-        }
+        mapping.reset();
+        dataset.assign(dataset_size, UNDEFINED);
         for (unsigned long int i = 0; i < reader.data.size(); i++)
         {
             setValueById(reader_row_labels.at(i), reader_col_labels.at(i), reader.data.at(i));
@@ -97,26 +123,30 @@ public:
     // Methods
     dataFrame() = default;
     dataFrame(bool isCompressible, bool isSymmetric, unsigned long int rows, unsigned long int cols)
+    : dataFrame(isCompressible, isSymmetric, rows, cols, false) {}
+
+    dataFrame(bool isCompressible, bool isSymmetric, unsigned long int rows, unsigned long int cols, bool isSparse)
     {
+        if (isSparse && isCompressible)
+        {
+            throw std::runtime_error("sparse dataFrame cannot be compressible");
+        }
         this->isCompressible = isCompressible;
         this->isSymmetric = isSymmetric;
+        this->isSparse = isSparse;
         this->rows = rows;
-        if (isCompressible)
+        if (isSparse)
         {
-            this->cols = rows;
+            this->cols = cols;
             initializeDatatsetSize();
-            std::vector<value_type> data(dataset_size, UNDEFINED);
-            dataset.push_back(data);
+            sparseColLocs.assign(rows, std::vector<unsigned long int>());
+            sparseValues.assign(rows, std::vector<value_type>());
         }
         else
         {
-            this->cols = cols;
+            this->cols = isCompressible ? rows : cols;
             initializeDatatsetSize();
-            for (unsigned int row_loc = 0; row_loc < rows; row_loc++)
-            {
-                std::vector<value_type> data(cols, UNDEFINED);
-                dataset.push_back(data);
-            }
+            dataset.assign(dataset_size, UNDEFINED);
         }
 
     }
@@ -141,24 +171,58 @@ public:
         return dataset_size - row_delta * (row_delta + 1) / 2 + col_loc - row_loc;
     }
 
+    /* index of (row_loc, col_loc) in the dense value block */
+    unsigned long int
+    denseIndex(unsigned long int row_loc, unsigned long int col_loc) const
+    {
+        if (row_loc >= rows || col_loc >= cols)
+        {
+            throw std::out_of_range("loc exceeds index of dataframe");
+        }
+        if (isCompressible)
+        {
+            if (isUnderDiagonal(row_loc, col_loc))
+            {
+                return compressedEquivalentLoc(col_loc, row_loc);
+            }
+            return compressedEquivalentLoc(row_loc, col_loc);
+        }
+        return row_loc * cols + col_loc;
+    }
+
+    /* the dense value block, in memory or memory mapped */
+    const value_type*
+    values() const
+    {
+        if (mapping)
+        {
+            return reinterpret_cast<const value_type*>(mapping->data() + mappedValuesOffset);
+        }
+        return dataset.data();
+    }
+
+    bool
+    isMemoryMapped() const
+    {
+        return (bool) mapping;
+    }
+
 // Getters/Setters
 
     value_type
     getValueByLoc(unsigned long int row_loc, unsigned long int col_loc) const
     {
-        if (isCompressible)
+        if (isSparse)
         {
-            unsigned long int index;
-            if (isUnderDiagonal(row_loc, col_loc))
-            {
-                index = compressedEquivalentLoc(col_loc, row_loc);
-            } else
+            const auto &colLocs = sparseColLocs.at(row_loc);
+            auto position = std::lower_bound(colLocs.begin(), colLocs.end(), col_loc);
+            if (position == colLocs.end() || *position != col_loc)
             {
-                index = compressedEquivalentLoc(row_loc, col_loc);
+                return UNDEFINED;
             }
-            return dataset.at(0).at(index);
+            return sparseValues.at(row_loc).at(position - colLocs.begin());
         }
-        return dataset.at(row_loc).at(col_loc);
+        return values()[denseIndex(row_loc, col_loc)];
     }
 
 
@@ -193,9 +257,22 @@ public:
         }
 
         unsigned long int row_loc = rowIdsToLoc.at(row_id);
-        for (unsigned long int col_loc = 0; col_loc < cols; col_loc++)
+        if (isSparse)
         {
-            returnValue.push_back(std::make_pair(colIds.at(col_loc), getValueByLoc(row_loc, col_loc)));
+            for (unsigned long int col_loc = 0; col_loc < cols; col_loc++)
+            {
+                returnValue.push_back(std::make_pair(colIds.at(col_loc), UNDEFINED));
+            }
+            forEachValueInRow(row_loc, [&returnValue](unsigned long int col_loc, value_type value) {
+                returnValue.at(col_loc).second = value;
+            });
+        }
+        else
+        {
+            for (unsigned long int col_loc = 0; col_loc < cols; col_loc++)
+            {
+                returnValue.push_back(std::make_pair(colIds.at(col_loc), getValueByLoc(row_loc, col_loc)));
+            }
         }
         if (sort)
         {
@@ -273,23 +350,80 @@ public:
     }
 
 
+    /* Call f(col_loc, value) for each stored value of the row, in order of col loc.
+     * Dense storage visits every cell; sparse storage skips UNDEFINED cells. */
+    template <class Function>
     void
-    setValueByLoc(unsigned long int row_loc, unsigned long int col_loc, value_type value)
+    forEachValueInRow(unsigned long int row_loc, Function f) const
     {
+        if (isSparse)
+        {
+            const auto &colLocs = sparseColLocs.at(row_loc);
+            const auto &values = sparseValues.at(row_loc);
+            for (unsigned long int i = 0; i < colLocs.size(); i++)
+            {
+                f(colLocs[i], values[i]);
+            }
+            return;
+        }
+        if (row_loc >= rows)
+        {
+            throw std::out_of_range("loc exceeds index of dataframe");
+        }
+        const value_type *data = values();
         if (isCompressible)
         {
-            unsigned long int index;
-            if (isUnderDiagonal(row_loc, col_loc))
+            // cells left of the diagonal are stored in the rows above
+            for (unsigned long int col_loc = 0; col_loc < row_loc; col_loc++)
+            {
+                f(col_loc, data[compressedEquivalentLoc(col_loc, row_loc)]);
+            }
+            const value_type *rowValues = data + compressedEquivalentLoc(row_loc, row_loc);
+            for (unsigned long int col_loc = row_loc; col_loc < cols; col_loc++)
+            {
+                f(col_loc, rowValues[col_loc - row_loc]);
+            }
+            return;
+        }
+        const value_type *rowValues = data + row_loc * cols;
+        for (unsigned long int col_loc = 0; col_loc < cols; col_loc++)
+        {
+            f(col_loc, rowValues[col_loc]);
+        }
+    }
+
+
+    void
+    setValueByLoc(unsigned long int row_loc, unsigned long int col_loc, value_type value)
+    {
+        if (isSparse)
+        {
+            auto &colLocs = sparseColLocs.at(row_loc);
+            auto &values = sparseValues.at(row_loc);
+            auto position = std::lower_bound(colLocs.begin(), colLocs.end(), col_loc);
+            auto index = position - colLocs.begin();
+            bool isStored = position != colLocs.end() && *position == col_loc;
+            if (value == UNDEFINED)
+            {
+                if (isStored)
+                {
+                    colLocs.erase(position);
+                    values.erase(values.begin() + index);
+                }
+            }
+            else if (isStored)
             {
-                index = compressedEquivalentLoc(col_loc, row_loc);
-            } else
+                values.at(index) = value;
+            }
+            else
             {
-                index = compressedEquivalentLoc(row_loc, col_loc);
+                colLocs.insert(position, col_loc);
+                values.insert(values.begin() + index, value);
             }
-            dataset.at(0).at(index) = value;
             return;
         }
-        dataset.at(row_loc).at(col_loc) = value;
+        throwIfMemoryMapped();
+        dataset.at(denseIndex(row_loc, col_loc)) = value;
     }
 
 
@@ -300,18 +434,55 @@ public:
         {
             throw std::runtime_error("row loc exceeds index of dataframe");
         }
-        if (!isCompressible)
+        if (isSparse)
         {
-
-            this->dataset.at(source_loc) = row_data;
-
+            // keep only the defined values of the row
+            auto &colLocs = sparseColLocs.at(source_loc);
+            auto &values = sparseValues.at(source_loc);
+            colLocs.clear();
+            values.clear();
+            for (unsigned long int col_loc = 0; col_loc < row_data.size(); col_loc++)
+            {
+                if (row_data[col_loc] != UNDEFINED)
+                {
+                    colLocs.push_back(col_loc);
+                    values.push_back(row_data[col_loc]);
+                }
+            }
+            colLocs.shrink_to_fit();
+            values.shrink_to_fit();
         }
         else
         {
-            unsigned long int left_index = this->compressedEquivalentLoc(source_loc, source_loc);
-            std::copy(row_data.begin(), row_data.end(), this->dataset.at(0).begin() + left_index);
+            throwIfMemoryMapped();
+            unsigned long int left_index = denseIndex(source_loc, isCompressible ? source_loc : 0);
+            if (left_index + row_data.size() > dataset.size())
+            {
+                throw std::runtime_error("row exceeds index of dataframe");
+            }
+            std::copy(row_data.begin(), row_data.end(), this->dataset.begin() + left_index);
+        }
+    }
 
+    /* Writable slice of the dense block holding row_loc. The slice starts
+     * at col_loc 0, or at col_loc row_loc when storage is compressible, and
+     * spans rowSliceSize(row_loc) values. Rows do not overlap, so threads
+     * may fill different rows at once. */
+    value_type*
+    rowSlice(unsigned long int row_loc)
+    {
+        if (isSparse)
+        {
+            throw std::runtime_error("sparse dataframes have no dense rows");
         }
+        throwIfMemoryMapped();
+        return dataset.data() + denseIndex(row_loc, isCompressible ? row_loc : 0);
+    }
+
+    unsigned long int
+    rowSliceSize(unsigned long int row_loc) const
+    {
+        return isCompressible ? cols - row_loc : cols;
     }
 
     void
@@ -349,19 +520,72 @@ public:
         return index;
     }
 
+    /* make room for count more row ids without rehashing */
+    void
+    reserveRowIndex(unsigned long int count)
+    {
+        rowIds.reserve(rowIds.size() + count);
+        rowIdsToLoc.reserve(rowIdsToLoc.size() + count);
+    }
+
+    /* make room for count more col ids without rehashing */
+    void
+    reserveColIndex(unsigned long int count)
+    {
+        colIds.reserve(colIds.size() + count);
+        colIdsToLoc.reserve(colIdsToLoc.size() + count);
+    }
+
 
 
 // Input/Output:
 
+    /* Write a csv of a header of col ids, then a row id and the values
+     * of each row, with -1 for undefined values. Blocks of rows are
+     * formatted on numThreads threads and written in order. If
+     * compressionLevel is 1-9, each block is also gzipped on its thread
+     * and the file is a series of gzip members; 0 writes plain text. */
     bool
-    writeCSV(const std::string &outfile) const
+    writeCSV(const std::string &outfile, int compressionLevel=0,
+             unsigned int numThreads=std::max(1u, std::thread::hardware_concurrency())) const
     {
+        if (compressionLevel < 0 || compressionLevel > 9)
+        {
+            throw std::runtime_error("compression level must be between 0 and 9");
+        }
         std::ofstream Ofile;
-        Ofile.open(outfile);
+        Ofile.open(outfile, std::ios::binary | std::ios::out);
         if (Ofile.fail()) {
             throw std::runtime_error("Could not open output file");
         }
-        writeToStream(Ofile);
+        // rows of about CSV_BLOCK_BYTES of text; block 0 is the header
+        unsigned long int rowsPerBlock = std::max(1ul, CSV_BLOCK_BYTES / (cols * 6 + 24));
+        unsigned long int numBlocks = 1 + (rows + rowsPerBlock - 1) / rowsPerBlock;
+        pipelineBlocks(numBlocks, numThreads,
+            [this, rowsPerBlock, compressionLevel](unsigned long int block) {
+                std::vector<char> text;
+                if (block == 0)
+                {
+                    formatCSVHeader(text);
+                }
+                else
+                {
+                    unsigned long int firstRow = (block - 1) * rowsPerBlock;
+                    formatCSVRows(text, firstRow, std::min(firstRow + rowsPerBlock, rows));
+                }
+                if (compressionLevel > 0)
+                {
+                    return gzipBytes(text.data(), text.size(), compressionLevel);
+                }
+                return text;
+            },
+            [&Ofile](unsigned long int block, const std::vector<char>& bytes) {
+                Ofile.write(bytes.data(), bytes.size());
+                if (Ofile.fail())
+                {
+                    throw std::runtime_error("unable to write csv");
+                }
+            });
         Ofile.close();
         return true;
     }
@@ -372,45 +596,86 @@ public:
         writeToStream(std::cout);
     }
 
-    void readCSV(const std::string& infile)
+    /* Read a csv of a header of col ids, then a row id and the values
+     * of each row. The file is memory mapped and its rows are parsed on
+     * numThreads threads straight into dataset. Short rows are padded
+     * with undefined values. */
+    void readCSV(const std::string& infile, unsigned int numThreads=std::max(1u, std::thread::hardware_concurrency()))
     {
         isCompressible = false;
         isSymmetric = false;
-        std::ifstream fileIN;
-        fileIN.open(infile);
-        if (fileIN.fail())
+        isSparse = false;
+        mappedFile file(infile);
+        const char *fileEnd = file.data() + file.size();
+
+        // the start of every non-empty line, and the end of the file
+        std::vector<const char*> lineStarts;
+        for (const char *line = file.data(); line < fileEnd; )
         {
-            throw std::runtime_error("unable to read file");
+            const char *lineEnd = findLineEnd(line, fileEnd);
+            if (line != lineEnd && !(lineEnd - line == 1 && *line == '\r'))
+            {
+                lineStarts.push_back(line);
+            }
+            line = lineEnd + 1;
         }
+        lineStarts.push_back(fileEnd);
 
-        csvParser<row_label_type> rowReader(fileIN);
-        csvParser<col_label_type> colReader(fileIN);
-        csvParser<value_type> valueReader(fileIN);
-
-        colReader.readLine(colIds);
-        indexCols();
+        colIds.clear();
+        if (lineStarts.size() > 1)
+        {
+            const char *header = lineStarts[0];
+            forEachCSVField(header, trimLineEnd(header, findLineEnd(header, fileEnd)),
+                            [this](unsigned long int field, const char *begin, const char *end) {
+                if (field > 0)
+                {
+                    colIds.push_back(csvParser<col_label_type>::parseField(begin, end));
+                }
+            });
+        }
+        cols = colIds.size();
+        rows = lineStarts.size() > 1 ? lineStarts.size() - 2 : 0;
+        initializeDatatsetSize();
 
-        std::string line;
-        std::string row_label;
-        std::string value;
+        mapping.reset();
+        sparseColLocs.clear();
+        sparseValues.clear();
+        rowIds.assign(rows, row_label_type());
+        dataset.assign(dataset_size, UNDEFINED);
 
-        while (getline(fileIN, line))
+        numThreads = (unsigned int) std::max(1ul, std::min((unsigned long int) numThreads, rows));
+        std::vector<std::exception_ptr> errors(numThreads);
+        std::vector<std::thread> threads;
+        for (unsigned int i = 0; i < numThreads; i++)
         {
-            this->dataset.emplace_back(std::vector<value_type>());
-            std::istringstream stream(line);
-
-            getline(stream, row_label,',');
-            rowIds.push_back(rowReader.parse(row_label));
-            while(getline(stream, value, ','))
+            threads.push_back(std::thread([&, i]() {
+                try
+                {
+                    for (unsigned long int row_loc = rows * i / numThreads; row_loc < rows * (i + 1) / numThreads; row_loc++)
+                    {
+                        const char *line = lineStarts[row_loc + 1];
+                        parseCSVRow(line, trimLineEnd(line, findLineEnd(line, fileEnd)), row_loc);
+                    }
+                }
+                catch (...)
+                {
+                    errors[i] = std::current_exception();
+                }
+            }));
+        }
+        std::for_each(threads.begin(), threads.end(), [](std::thread &t) { t.join(); });
+        for (const auto &error : errors)
+        {
+            if (error)
             {
-                this->dataset.at(this->dataset.size() - 1).push_back(valueReader.parse(value));
+                std::rethrow_exception(error);
             }
         }
-        fileIN.close();
-        rows = this->rowIds.size();
-        cols = this->colIds.size();
+
+        rowIdsToLoc.clear();
+        colIdsToLoc.clear();
         indexRows();
-        initializeDatatsetSize();
+        indexCols();
     }
 
 
@@ -421,32 +686,112 @@ public:
         tmxWriter<col_label_type> colWriter(serializer);
         tmxWriter<value_type> dataWriter(serializer);
 
-        rowWriter.writeTMXVersion(TMX_VERSION);
-        rowWriter.writeIdTypeEnum();
-        colWriter.writeIdTypeEnum();
-        dataWriter.writeValueTypeEnum();
+        writeTMXHeader(serializer, isSparse ? SparseLayout : ContiguousLayout);
 
-        rowWriter.writeIsCompressible(isCompressible);
-        rowWriter.writeIsSymmetric(isSymmetric);
+        if (isSparse)
+        {
+            rowWriter.writeIds(rowIds);
+            colWriter.writeIds(colIds);
+            tmxWriter<unsigned long int> locWriter(serializer);
+            locWriter.writeData(sparseColLocs);
+            dataWriter.writeData(sparseValues);
+        }
+        else
+        {
+            rowWriter.writeFixedWidthIds(rowIds);
+            colWriter.writeFixedWidthIds(colIds);
+            dataWriter.writeValueBlock(values(), dataset_size);
+        }
+    }
 
-        rowWriter.writeNumberOfRows(rows);
-        colWriter.writeNumberOfCols(cols);
+    /* Write a tmx whose dense values are split into chunks of whole rows,
+     * each deflated independently by one of numThreads threads at the given
+     * zlib level (1-9). Chunks are written in order while the next ones are
+     * compressed. Sparse dataFrames are written as with writeTMX. */
+    void writeCompressedTMX(const std::string& filename, int level, unsigned int numThreads) const
+    {
+        if (isSparse)
+        {
+            writeTMX(filename);
+            return;
+        }
+        if (level < 1 || level > 9)
+        {
+            throw std::runtime_error("compression level must be between 1 and 9");
+        }
+        Serializer serializer(filename);
+        tmxWriter<row_label_type> rowWriter(serializer);
+        tmxWriter<col_label_type> colWriter(serializer);
+        tmxWriter<value_type> dataWriter(serializer);
 
-        rowWriter.writeIds(rowIds);
-        colWriter.writeIds(colIds);
-        dataWriter.writeData(dataset);
+        writeTMXHeader(serializer, CompressedLayout);
+        rowWriter.writeFixedWidthIds(rowIds);
+        colWriter.writeFixedWidthIds(colIds);
+        dataWriter.writeValueCount(dataset_size);
+
+        std::vector<tmxChunk> chunks = planChunks();
+        // reserve the index; it is filled in once the compressed sizes are known
+        unsigned long int indexPosition = dataWriter.position();
+        dataWriter.writeChunkIndex(chunks);
+
+        pipelineBlocks(chunks.size(), numThreads,
+            [this, &chunks, level](unsigned long int chunk) {
+                return compressBytes(reinterpret_cast<const char*>(values() + chunks.at(chunk).firstValue),
+                                     chunks.at(chunk).numValues * sizeof(value_type), sizeof(value_type), level);
+            },
+            [&chunks, &dataWriter](unsigned long int chunk, const std::vector<char>& compressed) {
+                chunks.at(chunk).offset = dataWriter.position();
+                chunks.at(chunk).compressedSize = compressed.size();
+                dataWriter.writeCompressedChunk(compressed);
+            });
+        dataWriter.seek(indexPosition);
+        dataWriter.writeChunkIndex(chunks);
     }
 
-    void readTMX(const std::string& filename)
+    /* chunks of whole rows of about chunkBytes each. Offsets
+     * and compressed sizes are left for the writer to fill in */
+    std::vector<tmxChunk>
+    planChunks(unsigned long int chunkBytes=TMX_CHUNK_BYTES) const
     {
-        Deserializer deserializer(filename);
+        unsigned long int rowsPerChunk = std::max(1ul, chunkBytes / std::max(1ul, cols * sizeof(value_type)));
+        std::vector<tmxChunk> chunks;
+        for (unsigned long int firstRow = 0; firstRow < rows; firstRow += rowsPerChunk)
+        {
+            unsigned long int endRow = std::min(firstRow + rowsPerChunk, rows);
+            tmxChunk chunk;
+            chunk.firstRow = firstRow;
+            chunk.firstValue = rowStartIndex(firstRow);
+            chunk.numValues = rowStartIndex(endRow) - chunk.firstValue;
+            chunk.offset = 0;
+            chunk.compressedSize = 0;
+            chunks.push_back(chunk);
+        }
+        return chunks;
+    }
 
+    /* index of the first value of row_loc in the dense block,
+     * or dataset_size for row_loc == rows */
+    unsigned long int
+    rowStartIndex(unsigned long int row_loc) const
+    {
+        if (row_loc >= rows)
+        {
+            return dataset_size;
+        }
+        return isCompressible ? compressedEquivalentLoc(row_loc, row_loc) : row_loc * cols;
+    }
+
+    /* Read the header and the ids of a tmx, leaving deserializer at
+     * the start of the values. Returns the layout of the values. */
+    unsigned short readTMXHeader(Deserializer& deserializer)
+    {
         tmxReader<row_label_type> rowReader(deserializer);
         tmxReader<col_label_type> colReader(deserializer);
         tmxReader<value_type> dataReader(deserializer);
 
         auto tmx_version = rowReader.readTMXVersion();
-        if (tmx_version != TMX_VERSION)
+        // version 2 files have the same header, less the layout enum
+        if (tmx_version != TMX_VERSION && tmx_version != 2)
         {
             auto error = std::string("file is an older version of tmx: ") + std::to_string(tmx_version);
             error += std::string("expected: ") + std::to_string(TMX_VERSION);
@@ -464,22 +809,349 @@ public:
 
         isCompressible = rowReader.readIsCompressible();
         isSymmetric = rowReader.readIsSymmetric();
+        unsigned short layout = DenseLayout;
+        if (tmx_version >= 3)
+        {
+            layout = rowReader.readLayoutEnum();
+        }
+        isSparse = layout == SparseLayout;
 
         rows = rowReader.readNumberOfRows();
         cols = colReader.readNumberOfCols();
+        initializeDatatsetSize();
 
-        rowReader.readIds(rowIds);
-        colReader.readIds(colIds);
-        dataReader.readData(dataset);
-
+        if (layout == CompressedLayout || layout == ContiguousLayout)
+        {
+            rowReader.readFixedWidthIds(rowIds);
+            colReader.readFixedWidthIds(colIds);
+        }
+        else
+        {
+            rowReader.readIds(rowIds);
+            colReader.readIds(colIds);
+        }
+        rowIdsToLoc.clear();
+        colIdsToLoc.clear();
         indexRows();
         indexCols();
-        initializeDatatsetSize();
+        return layout;
+    }
+
+    /* Read a tmx. If memoryMap is true and the file has a contiguous
+     * layout, values are served from a read-only mapping of the file
+     * instead of being copied into memory. */
+    void readTMX(const std::string& filename, bool memoryMap=false)
+    {
+        Deserializer deserializer(filename);
+        tmxReader<value_type> dataReader(deserializer);
 
+        unsigned short layout = readTMXHeader(deserializer);
+
+        dataset.clear();
+        mapping.reset();
+        sparseColLocs.clear();
+        sparseValues.clear();
+        if (layout == CompressedLayout)
+        {
+            if (dataReader.readValueCount() != dataset_size)
+            {
+                throw std::runtime_error("unexpected size of value block");
+            }
+            std::vector<tmxChunk> chunks;
+            dataReader.readChunkIndex(chunks);
+            dataset.assign(dataset_size, UNDEFINED);
+            readCompressedChunks(filename, chunks, std::max(1u, std::thread::hardware_concurrency()));
+        }
+        else if (layout == ContiguousLayout)
+        {
+            auto size = dataReader.readValueBlockSize();
+            if (size != dataset_size)
+            {
+                throw std::runtime_error("unexpected size of value block");
+            }
+            if (memoryMap)
+            {
+                mappedValuesOffset = dataReader.position();
+                mapping = std::make_shared<mappedFile>(filename);
+                if (mapping->size() < mappedValuesOffset + dataset_size * sizeof(value_type))
+                {
+                    mapping.reset();
+                    throw std::runtime_error("tmx is truncated");
+                }
+            }
+            else
+            {
+                dataset.assign(dataset_size, UNDEFINED);
+                dataReader.readValueBlock(dataset.data(), dataset_size);
+            }
+        }
+        else if (isSparse)
+        {
+            tmxReader<unsigned long int> locReader(deserializer);
+            locReader.readData(sparseColLocs);
+            dataReader.readData(sparseValues);
+        }
+        else
+        {
+            // rows were stored as separate vectors (one vector if compressible)
+            std::vector<std::vector<value_type>> rowVectors;
+            dataReader.readData(rowVectors);
+            dataset.reserve(dataset_size);
+            for (const auto &rowVector : rowVectors)
+            {
+                dataset.insert(dataset.end(), rowVector.begin(), rowVector.end());
+            }
+            if (dataset.size() != dataset_size)
+            {
+                throw std::runtime_error("unexpected size of value block");
+            }
+        }
     }
 
 private:
 
+    /* Make blocks 0..numBlocks-1 with produce(block) on numThreads
+     * threads, and hand them to consume(block, bytes) in order on this
+     * thread. Blocks are made in waves, each consumed while the next
+     * one is made. The first exception thrown by produce is rethrown. */
+    template <class producer_type, class consumer_type>
+    static void
+    pipelineBlocks(unsigned long int numBlocks, unsigned int numThreads,
+                   producer_type produce, consumer_type consume)
+    {
+        numThreads = std::max(numThreads, 1u);
+        const unsigned long int waveSize = numThreads * 4;
+        std::vector<std::vector<char>> consuming;
+        std::vector<std::vector<char>> producing;
+        std::vector<std::exception_ptr> consumingErrors;
+        std::vector<std::exception_ptr> producingErrors;
+        auto produceWave = [&](unsigned long int firstBlock, std::vector<std::vector<char>> &results,
+                               std::vector<std::exception_ptr> &errors) {
+            unsigned long int lastBlock = std::min(firstBlock + waveSize, numBlocks);
+            results.assign(lastBlock - firstBlock, std::vector<char>());
+            errors.assign(lastBlock - firstBlock, nullptr);
+            auto nextBlock = std::make_shared<std::atomic<unsigned long int>>(firstBlock);
+            std::vector<std::thread> threads;
+            for (unsigned int i = 0; i < numThreads; i++)
+            {
+                threads.push_back(std::thread([&results, &errors, produce, nextBlock, firstBlock, lastBlock]() {
+                    for (unsigned long int block = (*nextBlock)++; block < lastBlock; block = (*nextBlock)++)
+                    {
+                        try
+                        {
+                            results.at(block - firstBlock) = produce(block);
+                        }
+                        catch (...)
+                        {
+                            errors.at(block - firstBlock) = std::current_exception();
+                        }
+                    }
+                }));
+            }
+            return threads;
+        };
+        auto joinAll = [](std::vector<std::thread> &threads) {
+            std::for_each(threads.begin(), threads.end(), [](std::thread &t) { t.join(); });
+        };
+
+        auto threads = produceWave(0, consuming, consumingErrors);
+        joinAll(threads);
+        for (unsigned long int firstBlock = 0; firstBlock < numBlocks; firstBlock += waveSize)
+        {
+            std::vector<std::thread> nextThreads;
+            if (firstBlock + waveSize < numBlocks)
+            {
+                nextThreads = produceWave(firstBlock + waveSize, producing, producingErrors);
+            }
+            try
+            {
+                for (unsigned long int i = 0; i < consuming.size(); i++)
+                {
+                    if (consumingErrors.at(i))
+                    {
+                        std::rethrow_exception(consumingErrors.at(i));
+                    }
+                    consume(firstBlock + i, consuming.at(i));
+                }
+            }
+            catch (...)
+            {
+                joinAll(nextThreads);
+                throw;
+            }
+            joinAll(nextThreads);
+            consuming.swap(producing);
+            consumingErrors.swap(producingErrors);
+        }
+    }
+
+    void
+    formatCSVHeader(std::vector<char>& text) const
+    {
+        text.push_back(',');
+        for (const auto &col_label : colIds)
+        {
+            appendCSVField(text, col_label);
+            text.push_back(',');
+        }
+        text.push_back('\n');
+    }
+
+    /* format rows [firstRow, endRow) as they would be written by writeToStream */
+    void
+    formatCSVRows(std::vector<char>& text, unsigned long int firstRow, unsigned long int endRow) const
+    {
+        static const char undefined[] = "-1,";
+        text.reserve((endRow - firstRow) * (cols * 6 + 24));
+        std::vector<value_type> rowValues(cols);
+        for (unsigned long int row_loc = firstRow; row_loc < endRow; row_loc++)
+        {
+            const value_type *row = rowValues.data();
+            if (!isSparse && !isCompressible)
+            {
+                row = values() + row_loc * cols;
+            }
+            else
+            {
+                std::fill(rowValues.begin(), rowValues.end(), UNDEFINED);
+                forEachValueInRow(row_loc, [&rowValues](unsigned long int col_loc, value_type value) {
+                    rowValues[col_loc] = value;
+                });
+            }
+            appendCSVField(text, rowIds.at(row_loc));
+            text.push_back(',');
+            for (unsigned long int col_loc = 0; col_loc < cols; col_loc++)
+            {
+                if (row[col_loc] < UNDEFINED)
+                {
+                    appendCSVUnsigned(text, row[col_loc]);
+                    text.push_back(',');
+                }
+                else
+                {
+                    text.insert(text.end(), undefined, undefined + 3);
+                }
+            }
+            text.push_back('\n');
+        }
+    }
+
+    static const char*
+    findLineEnd(const char *begin, const char *end)
+    {
+        const void *newline = std::memchr(begin, '\n', end - begin);
+        return newline ? static_cast<const char*>(newline) : end;
+    }
+
+    /* drop the carriage return of a windows line ending */
+    static const char*
+    trimLineEnd(const char *begin, const char *end)
+    {
+        return end != begin && *(end - 1) == '\r' ? end - 1 : end;
+    }
+
+    /* call visit(field, begin, end) for each comma separated field of a
+     * line. Like getline, a trailing comma does not start another field */
+    template <class visitor_type>
+    static void
+    forEachCSVField(const char *begin, const char *end, visitor_type visit)
+    {
+        for (unsigned long int field = 0; ; field++)
+        {
+            const char *fieldEnd = std::find(begin, end, ',');
+            visit(field, begin, fieldEnd);
+            if (fieldEnd == end || fieldEnd + 1 == end)
+            {
+                return;
+            }
+            begin = fieldEnd + 1;
+        }
+    }
+
+    void
+    parseCSVRow(const char *begin, const char *end, unsigned long int row_loc)
+    {
+        value_type *row = dataset.data() + row_loc * cols;
+        forEachCSVField(begin, end, [this, row, row_loc](unsigned long int field, const char *fieldBegin,
+                                                         const char *fieldEnd) {
+            if (field == 0)
+            {
+                rowIds[row_loc] = csvParser<row_label_type>::parseField(fieldBegin, fieldEnd);
+            }
+            else if (field > cols)
+            {
+                throw std::runtime_error("row has more values than the header");
+            }
+            else
+            {
+                row[field - 1] = csvParser<value_type>::parseField(fieldBegin, fieldEnd);
+            }
+        });
+    }
+
+    void
+    writeTMXHeader(Serializer& serializer, unsigned short layout) const
+    {
+        tmxWriter<row_label_type> rowWriter(serializer);
+        tmxWriter<col_label_type> colWriter(serializer);
+        tmxWriter<value_type> dataWriter(serializer);
+
+        rowWriter.writeTMXVersion(TMX_VERSION);
+        rowWriter.writeIdTypeEnum();
+        colWriter.writeIdTypeEnum();
+        dataWriter.writeValueTypeEnum();
+
+        rowWriter.writeIsCompressible(isCompressible);
+        rowWriter.writeIsSymmetric(isSymmetric);
+        rowWriter.writeLayoutEnum(layout);
+
+        rowWriter.writeNumberOfRows(rows);
+        colWriter.writeNumberOfCols(cols);
+    }
+
+    /* inflate every chunk into dataset, on numThreads threads reading
+     * from a memory mapping of the file */
+    void
+    readCompressedChunks(const std::string& filename, const std::vector<tmxChunk>& chunks, unsigned int numThreads)
+    {
+        mappedFile file(filename);
+        for (const auto &chunk : chunks)
+        {
+            if (chunk.offset + chunk.compressedSize > file.size()
+                || chunk.firstValue + chunk.numValues > dataset_size)
+            {
+                throw std::runtime_error("tmx is truncated");
+            }
+        }
+        std::atomic<unsigned long int> nextChunk(0);
+        std::atomic<bool> failed(false);
+        std::vector<std::thread> threads;
+        for (unsigned int i = 0; i < numThreads; i++)
+        {
+            threads.push_back(std::thread([&]() {
+                for (unsigned long int c = nextChunk++; c < chunks.size() && !failed; c = nextChunk++)
+                {
+                    const auto &chunk = chunks[c];
+                    try
+                    {
+                        decompressBytes(file.data() + chunk.offset, chunk.compressedSize,
+                                        reinterpret_cast<char*>(dataset.data() + chunk.firstValue),
+                                        chunk.numValues * sizeof(value_type), sizeof(value_type));
+                    }
+                    catch (...)
+                    {
+                        failed = true;
+                    }
+                }
+            }));
+        }
+        std::for_each(threads.begin(), threads.end(), [](std::thread &t) { t.join(); });
+        if (failed)
+        {
+            throw std::runtime_error("tmx chunk is corrupt");
+        }
+    }
+
     bool
     writeToStream(std::ostream& streamToWrite) const
     {
@@ -511,6 +1183,15 @@ private:
     }
 
 
+    void
+    throwIfMemoryMapped() const
+    {
+        if (mapping)
+        {
+            throw std::runtime_error("dataFrame is memory mapped and read only");
+        }
+    }
+
 public:
 // Utilities
 
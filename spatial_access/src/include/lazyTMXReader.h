@@ -0,0 +1,295 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#pragma once
+
+#include <algorithm>
+#include <list>
+#include <stdexcept>
+#include <string>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+#include "Serializer.h"
+#include "compressedChunks.h"
+#include "dataFrame.h"
+#include "tmxParser.h"
+
+// raw bytes per block of rows read from a contiguous tmx
+#define LAZY_TMX_BLOCK_BYTES (1 << 16)
+#define DEFAULT_LAZY_TMX_CACHE_BLOCKS (64)
+
+/* Serves values of a tmx without loading the whole file. Only the
+ * header and the ids are read up front; values are read a block of
+ * whole rows at a time, when first needed, and the most recently used
+ * blocks are kept in an LRU cache. Blocks are the chunks of a
+ * compressed tmx, or runs of rows of about LAZY_TMX_BLOCK_BYTES of a
+ * contiguous one. Row reads touch one block (more if compressible);
+ * column reads scan the blocks of every row. */
+template <class row_label_type, class col_label_type, class value_type>
+class lazyTMXReader {
+public:
+    lazyTMXReader(const std::string& filename, unsigned long int cacheBlocks=DEFAULT_LAZY_TMX_CACHE_BLOCKS)
+        : deserializer(filename), cacheBlocks(std::max(1ul, cacheBlocks))
+    {
+        tmxReader<value_type> dataReader(deserializer);
+        unsigned short layout = df.readTMXHeader(deserializer);
+        if (layout == CompressedLayout)
+        {
+            isCompressed = true;
+            if (dataReader.readValueCount() != df.dataset_size)
+            {
+                throw std::runtime_error("unexpected size of value block");
+            }
+            dataReader.readChunkIndex(blocks);
+        }
+        else if (layout == ContiguousLayout)
+        {
+            isCompressed = false;
+            if (dataReader.readValueBlockSize() != df.dataset_size)
+            {
+                throw std::runtime_error("unexpected size of value block");
+            }
+            unsigned long int valuesOffset = dataReader.position();
+            blocks = df.planChunks(LAZY_TMX_BLOCK_BYTES);
+            for (auto &block : blocks)
+            {
+                block.offset = valuesOffset + block.firstValue * sizeof(value_type);
+                block.compressedSize = block.numValues * sizeof(value_type);
+            }
+        }
+        else
+        {
+            throw std::runtime_error("lazy reads need a tmx with a contiguous or compressed layout");
+        }
+        for (const auto &block : blocks)
+        {
+            blockStarts.push_back(block.firstValue);
+        }
+    }
+
+    value_type
+    getValueById(const row_label_type& row_id, const col_label_type& col_id)
+    {
+        auto row = df.rowIdsToLoc.find(row_id);
+        auto col = df.colIdsToLoc.find(col_id);
+        if (row == df.rowIdsToLoc.end() || col == df.colIdsToLoc.end())
+        {
+            return valueAt(df.denseIndex(0, 0));
+        }
+        return valueAt(df.denseIndex(row->second, col->second));
+    }
+
+    std::vector<std::pair<col_label_type, value_type>>
+    getValuesBySource(const row_label_type& source_id, bool sort)
+    {
+        std::vector<std::pair<col_label_type, value_type>> returnValue;
+        auto row = df.rowIdsToLoc.find(source_id);
+        if (row == df.rowIdsToLoc.end())
+        {
+            return returnValue;
+        }
+        returnValue.reserve(df.cols);
+        for (unsigned long int col_loc = 0; col_loc < df.cols; col_loc++)
+        {
+            returnValue.push_back(std::make_pair(df.colIds[col_loc], valueAt(df.denseIndex(row->second, col_loc))));
+        }
+        if (sort)
+        {
+            sortByValue(returnValue);
+        }
+        return returnValue;
+    }
+
+    std::vector<std::pair<row_label_type, value_type>>
+    getValuesByDest(const col_label_type& dest_id, bool sort)
+    {
+        std::vector<std::pair<row_label_type, value_type>> returnValue;
+        auto col = df.colIdsToLoc.find(dest_id);
+        if (col == df.colIdsToLoc.end())
+        {
+            return returnValue;
+        }
+        returnValue.reserve(df.rows);
+        for (unsigned long int row_loc = 0; row_loc < df.rows; row_loc++)
+        {
+            returnValue.push_back(std::make_pair(df.rowIds[row_loc], valueAt(df.denseIndex(row_loc, col->second))));
+        }
+        if (sort)
+        {
+            sortByValue(returnValue);
+        }
+        return returnValue;
+    }
+
+    /* copy the rows at rowLocs, in that order, into rows, a
+     * numRows x cols array */
+    void
+    getValueRows(const long int* rowLocs, unsigned long int numRows, value_type* rows)
+    {
+        for (unsigned long int i = 0; i < numRows; i++)
+        {
+            unsigned long int row_loc = rowLocs[i];
+            value_type *row = rows + i * df.cols;
+            // cells left of the diagonal of a compressible row are stored in the rows above
+            unsigned long int first_col = df.isCompressible ? row_loc : 0;
+            for (unsigned long int col_loc = 0; col_loc < first_col; col_loc++)
+            {
+                row[col_loc] = valueAt(df.denseIndex(row_loc, col_loc));
+            }
+            if (first_col >= df.cols)
+            {
+                continue;
+            }
+            // the rest of the row is contiguous, and blocks hold whole rows
+            unsigned long int index = df.denseIndex(row_loc, first_col);
+            unsigned long int block = blockOf(index);
+            const std::vector<value_type> &values = getBlock(block);
+            auto first = values.begin() + (index - blocks[block].firstValue);
+            std::copy(first, first + (df.cols - first_col), row + first_col);
+        }
+    }
+
+    const std::vector<row_label_type>&
+    getRowIds() const
+    {
+        return df.rowIds;
+    }
+
+    const std::vector<col_label_type>&
+    getColIds() const
+    {
+        return df.colIds;
+    }
+
+    unsigned long int
+    getNumRows() const
+    {
+        return df.rows;
+    }
+
+    unsigned long int
+    getNumCols() const
+    {
+        return df.cols;
+    }
+
+    bool
+    getIsCompressible() const
+    {
+        return df.isCompressible;
+    }
+
+    bool
+    getIsCompressed() const
+    {
+        return isCompressed;
+    }
+
+    unsigned long int
+    getNumBlocks() const
+    {
+        return blocks.size();
+    }
+
+    unsigned long int
+    getNumCachedBlocks() const
+    {
+        return cache.size();
+    }
+
+    /* blocks read from the file so far, including ones read again after eviction */
+    unsigned long int
+    getNumBlocksRead() const
+    {
+        return blocksRead;
+    }
+
+private:
+    typedef std::pair<unsigned long int, std::vector<value_type>> cachedBlock;
+
+    dataFrame<row_label_type, col_label_type, value_type> df;
+    Deserializer deserializer;
+    bool isCompressed;
+    std::vector<tmxChunk> blocks;
+    // first dense index of each block, to find the block of a value
+    std::vector<unsigned long int> blockStarts;
+    unsigned long int cacheBlocks;
+    unsigned long int blocksRead = 0;
+    // most recently used first
+    std::list<cachedBlock> lru;
+    std::unordered_map<unsigned long int, typename std::list<cachedBlock>::iterator> cache;
+    std::vector<char> compressedBuffer;
+
+    unsigned long int
+    blockOf(unsigned long int index) const
+    {
+        return std::upper_bound(blockStarts.begin(), blockStarts.end(), index) - blockStarts.begin() - 1;
+    }
+
+    value_type
+    valueAt(unsigned long int index)
+    {
+        unsigned long int block = blockOf(index);
+        return getBlock(block)[index - blocks[block].firstValue];
+    }
+
+    /* the values of block, from the cache or the file */
+    const std::vector<value_type>&
+    getBlock(unsigned long int block)
+    {
+        if (!lru.empty() && lru.front().first == block)
+        {
+            return lru.front().second;
+        }
+        auto cached = cache.find(block);
+        if (cached != cache.end())
+        {
+            lru.splice(lru.begin(), lru, cached->second);
+            return lru.front().second;
+        }
+        std::vector<value_type> values;
+        if (cache.size() >= cacheBlocks)
+        {
+            // reuse the evicted block's buffer
+            values.swap(lru.back().second);
+            cache.erase(lru.back().first);
+            lru.pop_back();
+        }
+        readBlock(blocks[block], values);
+        lru.emplace_front(block, std::move(values));
+        cache[block] = lru.begin();
+        return lru.front().second;
+    }
+
+    void
+    readBlock(const tmxChunk& block, std::vector<value_type>& values)
+    {
+        values.resize(block.numValues);
+        deserializer.seek(block.offset);
+        if (isCompressed)
+        {
+            compressedBuffer.resize(block.compressedSize);
+            deserializer.readBlock(compressedBuffer.data(), block.compressedSize);
+            decompressBytes(compressedBuffer.data(), block.compressedSize, reinterpret_cast<char*>(values.data()),
+                            block.numValues * sizeof(value_type), sizeof(value_type));
+        }
+        else
+        {
+            deserializer.readBlock(values.data(), block.numValues);
+        }
+        blocksRead++;
+    }
+
+    template <class label_type>
+    static void
+    sortByValue(std::vector<std::pair<label_type, value_type>>& values)
+    {
+        std::sort(values.begin(), values.end(), [](const std::pair<label_type, value_type> &left,
+                                                   const std::pair<label_type, value_type> &right) {
+            return left.second < right.second;
+        });
+    }
+};
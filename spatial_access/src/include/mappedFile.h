@@ -0,0 +1,30 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#pragma once
+
+#include <string>
+
+/* A read-only memory mapping of a whole file. Pages are shared through
+ * the page cache by every process which maps the same file. */
+class mappedFile {
+public:
+    mappedFile(const std::string &filename);
+    ~mappedFile();
+    mappedFile(const mappedFile&) = delete;
+    mappedFile& operator=(const mappedFile&) = delete;
+
+    const char *data() const
+    {
+        return begin;
+    }
+
+    unsigned long int size() const
+    {
+        return length;
+    }
+private:
+    const char *begin;
+    unsigned long int length;
+};
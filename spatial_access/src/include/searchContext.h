@@ -0,0 +1,310 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#pragma once
+
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+#include <vector>
+
+#include "Graph.h"
+
+// children per heap node; 4 keeps siblings on one cache line
+#define INDEXED_HEAP_ARITY (4)
+
+/* A d-ary min heap of graph nodes with a position index, so a node's
+ * key is decreased in place rather than pushed again. */
+template<class key_type>
+class indexedHeap
+{
+public:
+    explicit indexedHeap(unsigned long int vertices) : position(vertices, NOT_IN_HEAP) {}
+
+    bool empty() const
+    {
+        return heap.empty();
+    }
+
+    key_type topKey() const
+    {
+        return heap.front().first;
+    }
+
+    network_loc topNode() const
+    {
+        return heap.front().second;
+    }
+
+    /* insert node, or lower its key if it is already queued */
+    void pushOrDecrease(network_loc node, key_type key)
+    {
+        network_loc slot = position[node];
+        if (slot == NOT_IN_HEAP)
+        {
+            slot = heap.size();
+            heap.emplace_back(key, node);
+        }
+        else if (key < heap[slot].first)
+        {
+            heap[slot].first = key;
+        }
+        else
+        {
+            return;
+        }
+        siftUp(slot);
+    }
+
+    network_loc pop()
+    {
+        network_loc node = heap.front().second;
+        position[node] = NOT_IN_HEAP;
+        if (heap.size() > 1)
+        {
+            heap.front() = heap.back();
+            heap.pop_back();
+            siftDown(0);
+        }
+        else
+        {
+            heap.pop_back();
+        }
+        return node;
+    }
+
+    /* empty the heap in O(entries) */
+    void clear()
+    {
+        for (const auto &entry : heap)
+        {
+            position[entry.second] = NOT_IN_HEAP;
+        }
+        heap.clear();
+    }
+
+private:
+    static constexpr network_loc NOT_IN_HEAP = std::numeric_limits<network_loc>::max();
+    std::vector<std::pair<key_type, network_loc>> heap;
+    std::vector<network_loc> position;
+
+    void siftUp(network_loc slot)
+    {
+        auto entry = heap[slot];
+        while (slot > 0)
+        {
+            network_loc parent = (slot - 1) / INDEXED_HEAP_ARITY;
+            if (heap[parent].first <= entry.first)
+            {
+                break;
+            }
+            heap[slot] = heap[parent];
+            position[heap[slot].second] = slot;
+            slot = parent;
+        }
+        heap[slot] = entry;
+        position[entry.second] = slot;
+    }
+
+    void siftDown(network_loc slot)
+    {
+        auto entry = heap[slot];
+        const network_loc size = heap.size();
+        while (true)
+        {
+            network_loc first_child = slot * INDEXED_HEAP_ARITY + 1;
+            if (first_child >= size)
+            {
+                break;
+            }
+            network_loc last_child = std::min(first_child + INDEXED_HEAP_ARITY, size);
+            network_loc min_child = first_child;
+            for (network_loc child = first_child + 1; child < last_child; child++)
+            {
+                if (heap[child].first < heap[min_child].first)
+                {
+                    min_child = child;
+                }
+            }
+            if (heap[min_child].first >= entry.first)
+            {
+                break;
+            }
+            heap[slot] = heap[min_child];
+            position[heap[slot].second] = slot;
+            slot = min_child;
+        }
+        heap[slot] = entry;
+        position[entry.second] = slot;
+    }
+};
+
+template<class key_type>
+constexpr network_loc indexedHeap<key_type>::NOT_IN_HEAP;
+
+
+/* Dial's bucket queue for integer keys: a ring of maxEdgeWeight + 1
+ * buckets. Dijkstra only queues keys within maxEdgeWeight of the current
+ * minimum, so each key has its own bucket and push and pop are O(1)
+ * amortized. A decreased key leaves a stale entry behind, which is
+ * skipped when its bucket is reached. Same interface as indexedHeap. */
+template<class key_type>
+class dialQueue
+{
+public:
+    dialQueue(unsigned long int vertices, unsigned long int maxEdgeWeight)
+        : buckets(maxEdgeWeight + 1), queuedKey(vertices, NOT_QUEUED) {}
+
+    bool empty() const
+    {
+        return live == 0;
+    }
+
+    key_type topKey()
+    {
+        advance();
+        return (key_type) cursor;
+    }
+
+    network_loc topNode()
+    {
+        advance();
+        return buckets[cursor % buckets.size()].back();
+    }
+
+    /* insert node, or lower its key if it is already queued */
+    void pushOrDecrease(network_loc node, key_type key)
+    {
+        if (queuedKey[node] == NOT_QUEUED)
+        {
+            live++;
+        }
+        else if (key >= queuedKey[node])
+        {
+            return;
+        }
+        queuedKey[node] = key;
+        buckets[key % buckets.size()].push_back(node);
+    }
+
+    network_loc pop()
+    {
+        advance();
+        auto &bucket = buckets[cursor % buckets.size()];
+        network_loc node = bucket.back();
+        bucket.pop_back();
+        queuedKey[node] = NOT_QUEUED;
+        live--;
+        return node;
+    }
+
+    /* empty the queue in O(buckets + entries) */
+    void clear()
+    {
+        for (auto &bucket : buckets)
+        {
+            for (network_loc node : bucket)
+            {
+                queuedKey[node] = NOT_QUEUED;
+            }
+            bucket.clear();
+        }
+        cursor = 0;
+        live = 0;
+    }
+
+private:
+    static constexpr unsigned long int NOT_QUEUED = std::numeric_limits<unsigned long int>::max();
+    std::vector<std::vector<network_loc>> buckets;
+    // key each queued node was last pushed with, to recognize stale entries
+    std::vector<unsigned long int> queuedKey;
+    unsigned long int cursor = 0;
+    unsigned long int live = 0;
+
+    /* move the cursor to the bucket of the minimum live entry */
+    void advance()
+    {
+        while (true)
+        {
+            auto &bucket = buckets[cursor % buckets.size()];
+            while (!bucket.empty() && queuedKey[bucket.back()] != cursor)
+            {
+                bucket.pop_back();
+            }
+            if (!bucket.empty())
+            {
+                return;
+            }
+            cursor++;
+        }
+    }
+};
+
+template<class key_type>
+constexpr unsigned long int dialQueue<key_type>::NOT_QUEUED;
+
+
+/* Per-thread state for one-to-all searches, reused across sources.
+ * Starting a search costs O(nodes touched by the previous search)
+ * rather than O(V): distances are reset from a dirty list and the
+ * visited flags are invalidated by advancing a timestamp. */
+template<class value_type, class queue_type = indexedHeap<value_type>>
+class searchContext
+{
+public:
+    static constexpr value_type UNDEFINED = std::numeric_limits<value_type>::max();
+    // distance to every node, UNDEFINED where not reached
+    std::vector<value_type> dist;
+    queue_type queue;
+
+    /* queue_args follow the vertex count to the queue constructor */
+    template<class... queue_args>
+    explicit searchContext(unsigned long int vertices, queue_args... args)
+        : dist(vertices, UNDEFINED), queue(vertices, args...), visitedAt(vertices, 0) {}
+
+    void begin(network_loc src)
+    {
+        for (network_loc v : touched)
+        {
+            dist[v] = UNDEFINED;
+        }
+        touched.clear();
+        queue.clear();
+        if (++timestamp == 0)
+        {
+            // the counter wrapped, so old stamps could collide with new ones
+            std::fill(visitedAt.begin(), visitedAt.end(), 0);
+            timestamp = 1;
+        }
+        setDistance(src, 0);
+        queue.pushOrDecrease(src, 0);
+    }
+
+    bool isVisited(network_loc v) const
+    {
+        return visitedAt[v] == timestamp;
+    }
+
+    void markVisited(network_loc v)
+    {
+        visitedAt[v] = timestamp;
+    }
+
+    void setDistance(network_loc v, value_type distance)
+    {
+        if (dist[v] == UNDEFINED)
+        {
+            touched.push_back(v);
+        }
+        dist[v] = distance;
+    }
+
+private:
+    std::vector<uint32_t> visitedAt;
+    uint32_t timestamp = 0;
+    std::vector<network_loc> touched;
+};
+
+template<class value_type, class queue_type>
+constexpr value_type searchContext<value_type, queue_type>::UNDEFINED;
@@ -6,6 +6,8 @@
 
 #include <thread>
 #include <mutex>
+#include <atomic>
+#include <chrono>
 #include <vector>
 #include <queue>
 #include <iostream>
@@ -15,21 +17,29 @@
 #include "userDataContainer.h"
 #include "dataFrame.h"
 
-/* jobQueue: a thread-safe queue for dispensing integer jobs*/
+// the most jobs a worker claims at once, and the chunks aimed for per thread
+#define MAX_JOB_CHUNK_SIZE (64)
+#define JOB_CHUNKS_PER_THREAD (8)
+
+/* jobQueue: a lock-free queue for dispensing integer jobs in chunks.
+ * Jobs are inserted up front; workers then claim consecutive ranges
+ * of them by advancing an atomic index. */
 class jobQueue {
 private:
-    std::queue <unsigned long int> data;
-    mutable std::mutex lock;
+    std::vector<unsigned long int> data;
+    std::atomic<unsigned long int> next{0};
 public:
     jobQueue() = default;
     void insert(unsigned long int item);
-    unsigned long int pop(bool &endNow);
+    unsigned long int popBatch(std::vector<unsigned long int> &batch, unsigned long int maxSize);
     bool empty() const;
+    unsigned long int chunkSizeFor(unsigned int numThreads) const;
 };
 
 void do_join(std::thread &t);
 
 template<class row_label_type, class col_label_type, class value_type> class graphWorkerArgs;
+template<class value_type> class manyToManyBuckets;
 
 /* A pool of worker threads to execute a job (f_in), which takes arguments (worker_args)*/
 template<class row_label_type, class col_label_type, class value_type>
@@ -62,17 +72,55 @@ public:
     Graph<value_type> &graph;
     dataFrame<row_label_type, col_label_type, value_type> &df;
     jobQueue jq;
-    userDataContainer<value_type> userSourceData;
-    userDataContainer<value_type> userDestData;
+    const userDataContainer<value_type> &userSourceData;
+    const userDataContainer<value_type> &userDestData;
+    // userDestData flattened for row fills
+    userDataIndex<value_type> destIndex;
+    value_type maxImpedance;
+    std::vector<bool> isDestNode;
+    unsigned long int numDestNodes;
+    std::vector<unsigned long int> &settledVertices;
+    unsigned int batchSize;
+    // sources each worker claims from jq at once
+    unsigned long int chunkSize = 1;
+    // seconds each worker spent searching, indexed by thread
+    std::vector<double> &threadBusySeconds;
+    std::atomic<unsigned int> nextThreadIndex{0};
+    // when nonzero, one-to-all searches use a bucket queue this wide
+    unsigned long int bucketQueueWidth = 0;
+    // set when searches run on a contraction hierarchy
+    const manyToManyBuckets<value_type> *buckets = nullptr;
     graphWorkerArgs(Graph<value_type> &graph, userDataContainer<value_type> &userSourceData,
                        userDataContainer<value_type> &userDestData,
-                       dataFrame<row_label_type, col_label_type, value_type> &df)
-    : graph(graph), df(df), jq(), userSourceData(userSourceData), userDestData(userDestData) {}
-    void initialize()
+                       dataFrame<row_label_type, col_label_type, value_type> &df,
+                       value_type maxImpedance,
+                       std::vector<unsigned long int> &settledVertices,
+                       unsigned int batchSize,
+                       std::vector<double> &threadBusySeconds)
+    : graph(graph), df(df), jq(), userSourceData(userSourceData), userDestData(userDestData),
+      maxImpedance(maxImpedance), numDestNodes(0), settledVertices(settledVertices), batchSize(batchSize),
+      threadBusySeconds(threadBusySeconds) {}
+    void initialize(unsigned int numThreads)
     {
-        //initialize job queue
-        for (auto i : userSourceData.retrieveUniqueNetworkNodeIds()) {
+        //initialize job queue, ordering sources by a breadth first traversal
+        //so consecutive searches (and batches) cover overlapping parts of the graph
+        std::vector<unsigned long int> sources = userSourceData.retrieveUniqueNetworkNodeIds();
+        std::vector<network_loc> rank = graph.breadthFirstRanks();
+        std::sort(sources.begin(), sources.end(), [&rank](unsigned long int a, unsigned long int b) {
+            return rank.at(a) < rank.at(b);
+        });
+        for (auto i : sources) {
             jq.insert(i);
         }
+        chunkSize = batchSize > 1 ? batchSize : jq.chunkSizeFor(numThreads);
+        threadBusySeconds.assign(numThreads, 0);
+        // flag the network nodes a search must settle before it can stop
+        isDestNode.assign(graph.vertices, false);
+        for (auto i : userDestData.retrieveUniqueNetworkNodeIds()) {
+            isDestNode.at(i) = true;
+        }
+        numDestNodes = userDestData.retrieveUniqueNetworkNodeIds().size();
+        destIndex.build(userDestData);
+        settledVertices.assign(df.rows, 0);
     }
 };
@@ -5,6 +5,7 @@
 #pragma once
 
 #include "Serializer.h"
+#include "compressedChunks.h"
 #include <string>
 #include <fstream>
 
@@ -18,6 +19,8 @@ enum ValidValueTypes {
     UnsignedIntType
 };
 
+#define TMX_PAGE_SIZE (4096)
+
 template <class T>
 class tmxWriter{
 
@@ -43,6 +46,11 @@ public:
         sharedSerializer.writeBool(isSymmetric);
     }
 
+    void writeLayoutEnum(unsigned short layout)
+    {
+        sharedSerializer.writeNumericType<unsigned short>(layout);
+    }
+
     void writeNumberOfRows(unsigned long int rows)
     {
         sharedSerializer.writeNumericType<unsigned long>(rows);
@@ -62,6 +70,50 @@ public:
     {
         sharedSerializer.write2DVector(data);
     }
+
+    /* ids padded to a common width, so id i is at a fixed offset */
+    void writeFixedWidthIds(const std::vector<T>& ids);
+
+    /* a page-aligned contiguous block of values */
+    void writeValueBlock(const T* values, unsigned long int size)
+    {
+        sharedSerializer.writeNumericType<unsigned long>(size);
+        sharedSerializer.writePadding(TMX_PAGE_SIZE);
+        sharedSerializer.writeBlock(values, size);
+    }
+
+    void writeValueCount(unsigned long int size)
+    {
+        sharedSerializer.writeNumericType<unsigned long>(size);
+    }
+
+    void writeChunkIndex(const std::vector<tmxChunk>& chunks)
+    {
+        sharedSerializer.writeNumericType<unsigned long>(chunks.size());
+        for (const auto &chunk : chunks)
+        {
+            sharedSerializer.writeNumericType<unsigned long>(chunk.firstRow);
+            sharedSerializer.writeNumericType<unsigned long>(chunk.firstValue);
+            sharedSerializer.writeNumericType<unsigned long>(chunk.numValues);
+            sharedSerializer.writeNumericType<unsigned long>(chunk.offset);
+            sharedSerializer.writeNumericType<unsigned long>(chunk.compressedSize);
+        }
+    }
+
+    void writeCompressedChunk(const std::vector<char>& compressed)
+    {
+        sharedSerializer.writeBlock(compressed.data(), compressed.size());
+    }
+
+    unsigned long int position()
+    {
+        return sharedSerializer.position();
+    }
+
+    void seek(unsigned long int position)
+    {
+        sharedSerializer.seek(position);
+    }
 };
 
 template <class T>
@@ -96,6 +148,11 @@ public:
         return sharedDeserializer.readBool();
     }
 
+    unsigned short readLayoutEnum()
+    {
+        return sharedDeserializer.readNumericType<unsigned short>();
+    }
+
     unsigned long int readNumberOfRows()
     {
         return sharedDeserializer.readNumericType<unsigned long>();
@@ -115,6 +172,45 @@ public:
         sharedDeserializer.read2DVector(data);
     }
 
+    void readFixedWidthIds(std::vector<T>& ids);
+
+    /* read the size of a value block and seek to its first value;
+     * returns the size */
+    unsigned long int readValueBlockSize()
+    {
+        auto size = sharedDeserializer.readNumericType<unsigned long>();
+        sharedDeserializer.skipPadding(TMX_PAGE_SIZE);
+        return size;
+    }
+
+    unsigned long int position()
+    {
+        return sharedDeserializer.position();
+    }
+
+    void readValueBlock(T* values, unsigned long int size)
+    {
+        sharedDeserializer.readBlock(values, size);
+    }
+
+    unsigned long int readValueCount()
+    {
+        return sharedDeserializer.readNumericType<unsigned long>();
+    }
+
+    void readChunkIndex(std::vector<tmxChunk>& chunks)
+    {
+        chunks.resize(sharedDeserializer.readNumericType<unsigned long>());
+        for (auto &chunk : chunks)
+        {
+            chunk.firstRow = sharedDeserializer.readNumericType<unsigned long>();
+            chunk.firstValue = sharedDeserializer.readNumericType<unsigned long>();
+            chunk.numValues = sharedDeserializer.readNumericType<unsigned long>();
+            chunk.offset = sharedDeserializer.readNumericType<unsigned long>();
+            chunk.compressedSize = sharedDeserializer.readNumericType<unsigned long>();
+        }
+    }
+
 };
 
 class tmxTypeReader{
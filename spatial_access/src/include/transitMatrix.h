@@ -12,140 +12,392 @@
 #include <numeric>
 #include <mutex>
 #include <iostream>
+#include <cstdint>
+#include <algorithm>
+#include <limits>
+#include <memory>
 
 #include "threadUtilities.h"
 #include "dataFrame.h"
 #include "Graph.h"
+#include "contractionHierarchy.h"
+#include "searchContext.h"
 #include "userDataContainer.h"
 #include "Serializer.h"
 using namespace std;
 
 typedef unsigned long int network_node;
 
+// the most sources a batched search can carry (one bit per lane)
+#define MAX_SEARCH_BATCH_SIZE (32)
+
+// searches use a bucket queue when no edge weighs more than this
+#define DEFAULT_BUCKET_QUEUE_MAX_EDGE_WEIGHT (4096)
+
+/* Per-thread state for searches from a batch of sources at once, reused
+ * across batches. Distances are interleaved in lanes,
+ * dist[v * lanes + lane]. Starting a batch costs O(nodes touched by the
+ * previous batch) rather than O(V * lanes). */
+template<class value_type>
+class batchSearchContext
+{
+public:
+    static constexpr value_type UNDEFINED = std::numeric_limits<value_type>::max();
+    std::vector<value_type> dist;
+    // the lanes of each node whose label improved since its last scan
+    std::vector<uint32_t> pendingLanes;
+    unsigned long int lanes = 0;
+
+    explicit batchSearchContext(unsigned long int vertices)
+        : pendingLanes(vertices, 0), isTouched(vertices, 0) {}
+
+    void begin(unsigned long int batchLanes)
+    {
+        for (network_node v : touched)
+        {
+            std::fill(dist.begin() + v * lanes, dist.begin() + (v + 1) * lanes, UNDEFINED);
+            pendingLanes[v] = 0;
+            isTouched[v] = 0;
+        }
+        touched.clear();
+        lanes = batchLanes;
+        // everything outside the touched nodes is already undefined, whatever the old lane count
+        if (dist.size() < pendingLanes.size() * lanes)
+        {
+            dist.resize(pendingLanes.size() * lanes, UNDEFINED);
+        }
+    }
+
+    /* call before changing the labels or pending lanes of v */
+    void touch(network_node v)
+    {
+        if (!isTouched[v])
+        {
+            isTouched[v] = 1;
+            touched.push_back(v);
+        }
+    }
+
+private:
+    std::vector<unsigned char> isTouched;
+    std::vector<network_node> touched;
+};
+
+template<class value_type>
+constexpr value_type batchSearchContext<value_type>::UNDEFINED;
+
 
 template<class row_label_type, class col_label_type, class value_type>
 constexpr value_type dataFrame<row_label_type, col_label_type, value_type>::UNDEFINED;
 
+/* Claim chunks of sources until the job queue is empty, passing each to
+ * searchChunk. Returns the seconds spent searching. */
+template<class row_label_type, class col_label_type, class value_type, class chunk_function>
+double searchChunks(graphWorkerArgs<row_label_type, col_label_type, value_type> &worker_args,
+                    chunk_function searchChunk)
+{
+    std::vector<network_node> chunk;
+    std::chrono::duration<double> busy(0);
+    while (worker_args.jq.popBatch(chunk, worker_args.chunkSize) > 0)
+    {
+        auto start = std::chrono::steady_clock::now();
+        searchChunk(chunk);
+        busy += std::chrono::steady_clock::now() - start;
+    }
+    return busy.count();
+}
+
 template<class row_label_type, class col_label_type, class value_type>
 void graphWorkerHandler(graphWorkerArgs<row_label_type,col_label_type, value_type> &worker_args)
 {
-    network_node src;
-    bool endNow = false;
-    std::vector<value_type> dist_vector(worker_args.graph.vertices);
-    while (!worker_args.jq.empty()) {
-        src = worker_args.jq.pop(endNow);
-        //exit loop if job queue worker_args is empty
-        if (endNow) {
-            break;
-        }
-        if (src > 0) {
-            doDijstraFromOneNetworkNode(src, worker_args, dist_vector);
-        }
+    unsigned int threadIndex = worker_args.nextThreadIndex++;
+    double busySeconds = 0;
+    if (worker_args.buckets)
+    {
+        std::vector<value_type> dist_vector(worker_args.graph.vertices);
+        boundedSearch search(worker_args.graph.vertices);
+        std::vector<unsigned long int> best;
+        busySeconds = searchChunks(worker_args, [&](const std::vector<network_node> &chunk) {
+            for (network_node src : chunk) {
+                doHierarchyQueryFromOneNetworkNode(src, worker_args, dist_vector, search, best);
+            }
+        });
+    }
+    else if (worker_args.batchSize > 1)
+    {
+        // chunks are exactly one batch
+        batchSearchContext<value_type> context(worker_args.graph.vertices);
+        busySeconds = searchChunks(worker_args, [&](const std::vector<network_node> &batch) {
+            doDijkstraFromManyNetworkNodes(batch, worker_args, context);
+        });
     }
+    else if (worker_args.bucketQueueWidth > 0)
+    {
+        searchContext<value_type, dialQueue<value_type>> context(worker_args.graph.vertices,
+                                                                 worker_args.bucketQueueWidth);
+        busySeconds = searchChunks(worker_args, [&](const std::vector<network_node> &chunk) {
+            for (network_node src : chunk) {
+                doDijstraFromOneNetworkNode(src, worker_args, context);
+            }
+        });
+    }
+    else
+    {
+        // allocated once per thread and reused for every source
+        searchContext<value_type> context(worker_args.graph.vertices);
+        busySeconds = searchChunks(worker_args, [&](const std::vector<network_node> &chunk) {
+            for (network_node src : chunk) {
+                doDijstraFromOneNetworkNode(src, worker_args, context);
+            }
+        });
+    }
+    worker_args.threadBusySeconds.at(threadIndex) = busySeconds;
 }
 
 template<class row_label_type, class col_label_type, class value_type>
-void calculateSingleRowOfDataFrame(const std::vector<value_type> &dist,
+void calculateSingleRowOfDataFrame(const value_type *dist, unsigned long int stride,
                                    graphWorkerArgs<row_label_type, col_label_type, value_type> &worker_args,
                                    network_node src) {
+    auto &df = worker_args.df;
+    // sparse rows are assembled here first; reused by every row this thread fills
+    static thread_local std::vector<value_type> sparseRowBuffer;
     value_type src_imp, dst_imp, calc_imp, fin_imp;
     //  iterate through each data point of the current source tract
-    auto sourceTract = worker_args.userSourceData.retrieveTract(src);
-    for (auto sourceDataPoint : sourceTract.retrieveDataPoints())
+    for (const auto &sourceDataPoint : worker_args.userSourceData.retrieveTract(src).retrieveDataPoints())
     {
         src_imp = sourceDataPoint.lastMileDistance;
-
-        auto destNodeIds = worker_args.userDestData.retrieveUniqueNetworkNodeIds();
-        // iterate through each dest tract
-        std::vector<value_type> row_data;
-        if (worker_args.df.isCompressible)
+        // values are written straight into this row's slice of the dataFrame
+        // (or the buffer), indexed by col loc minus rowOffset
+        unsigned long int rowOffset = df.isCompressible ? sourceDataPoint.loc : 0;
+        value_type *row;
+        if (df.isSparse)
         {
-            row_data.assign(worker_args.df.cols - sourceDataPoint.loc, worker_args.df.UNDEFINED);
-        } else
+            sparseRowBuffer.assign(df.rowSliceSize(sourceDataPoint.loc), df.UNDEFINED);
+            row = sparseRowBuffer.data();
+        }
+        else
         {
-            row_data.assign(worker_args.df.cols, worker_args.df.UNDEFINED);
+            row = df.rowSlice(sourceDataPoint.loc);
+            std::fill(row, row + df.rowSliceSize(sourceDataPoint.loc), df.UNDEFINED);
         }
 
-        for (network_node destNodeId : destNodeIds)
+        // gather from the dest points in col order; compressible rows
+        // start at the diagonal, so skip the points under it
+        const auto &destIndex = worker_args.destIndex;
+        const unsigned long int numDestPoints = destIndex.size();
+        for (unsigned long int i = df.isCompressible ? destIndex.lowerBound(rowOffset) : 0; i < numDestPoints; i++)
         {
-            auto destTract = worker_args.userDestData.retrieveTract(destNodeId);
-            auto destPoints = destTract.retrieveDataPoints();
-            for (auto destDataPoint : destPoints)
+            const unsigned long int destLoc = destIndex.locs[i];
+            if ((df.isSymmetric) && (destLoc == sourceDataPoint.loc))
             {
-                if (worker_args.df.isCompressible)
-                {
-                    if (worker_args.df.isUnderDiagonal(sourceDataPoint.loc, destDataPoint.loc))
-                    {
-                        continue;
-                    }
-                }
-                calc_imp = dist.at(destNodeId);
-                if ((worker_args.df.isSymmetric) && (destDataPoint.loc == sourceDataPoint.loc))
+                fin_imp = 0;
+            }
+            else
+            {
+                calc_imp = dist[destIndex.networkNodeIds[i] * stride];
+                dst_imp = destIndex.lastMileDistances[i];
+                // nodes past maxImpedance may hold tentative distances
+                if ((calc_imp == df.UNDEFINED) || (calc_imp > worker_args.maxImpedance))
                 {
-                    fin_imp = 0;
+                    fin_imp = df.UNDEFINED;
                 }
                 else
                 {
-                    dst_imp = destDataPoint.lastMileDistance;
-                    if (calc_imp == worker_args.df.UNDEFINED)
+                    fin_imp = dst_imp + src_imp + calc_imp;
+                    // values past the requested maximum are not kept
+                    if (fin_imp > worker_args.maxImpedance)
                     {
-                        fin_imp = worker_args.df.UNDEFINED;
+                        fin_imp = df.UNDEFINED;
                     }
-                    else
-                    {
-                        fin_imp = dst_imp + src_imp + calc_imp;
-                    }
-
-                }
-                if (worker_args.df.isCompressible)
-                {
-                    row_data.at(destDataPoint.loc - sourceDataPoint.loc) = fin_imp;
-                } else {
-                    row_data.at(destDataPoint.loc) = fin_imp;
                 }
+            }
+            row[destLoc - rowOffset] = fin_imp;
+        }
+        if (df.isSparse)
+        {
+            df.setRowByRowLoc(sparseRowBuffer, sourceDataPoint.loc);
+        }
+    }
 
+}
 
-            }
 
+template<class row_label_type, class col_label_type, class value_type, class queue_type>
+void doDijstraFromOneNetworkNode(network_node src, graphWorkerArgs<row_label_type, col_label_type, value_type> &worker_args,
+                                 searchContext<value_type, queue_type> &context)
+{
+    std::vector<value_type> &dist_vector = context.dist;
+    queue_type &queue = context.queue;
+    context.begin(src);
+    unsigned long int settledVertices = 0;
+    unsigned long int settledDestNodes = 0;
+    while (!queue.empty())
+    {
+        // the queue minimum only grows, so nothing closer than
+        // maxImpedance remains to be found
+        if (queue.topKey() > worker_args.maxImpedance)
+        {
+            break;
+        }
+        network_node u = queue.pop();
+        context.markVisited(u);
+        settledVertices++;
+        // stop once the distance to every destination node is final
+        if (worker_args.isDestNode[u])
+        {
+            settledDestNodes++;
+            if (settledDestNodes == worker_args.numDestNodes)
+            {
+                break;
+            }
+        }
+        // traverse the frozen CSR representation of the graph
+        const network_loc edges_end = worker_args.graph.offsets[u + 1];
+        for (network_loc edge = worker_args.graph.offsets[u]; edge < edges_end; edge++)
+        {
+            auto v = worker_args.graph.targets[edge];
+            // distances at or past UNDEFINED cannot be stored
+            unsigned long int candidate = (unsigned long int) dist_vector[u] + worker_args.graph.weights[edge];
+            if ((!context.isVisited(v)) and (candidate < dist_vector[v]))
+            {
+                context.setDistance(v, (value_type) candidate);
+                queue.pushOrDecrease(v, (value_type) candidate);
+            }
         }
-        worker_args.df.setRowByRowLoc(row_data, sourceDataPoint.loc);
     }
 
+    // record the work done for each source data point of this node
+    for (const auto &sourceDataPoint : worker_args.userSourceData.retrieveTract(src).retrieveDataPoints())
+    {
+        worker_args.settledVertices.at(sourceDataPoint.loc) = settledVertices;
+    }
+
+    //calculate row and add to dataFrame
+    calculateSingleRowOfDataFrame<row_label_type, col_label_type, value_type>(dist_vector.data(), 1, worker_args, src);
+
 }
 
+/* Distances from src to every destination node, found on the contraction hierarchy */
+template<class row_label_type, class col_label_type, class value_type>
+void doHierarchyQueryFromOneNetworkNode(network_node src,
+                                        graphWorkerArgs<row_label_type, col_label_type, value_type> &worker_args,
+                                        std::vector<value_type> &dist_vector, boundedSearch &search,
+                                        std::vector<unsigned long int> &best)
+{
+    unsigned long int settledVertices = worker_args.buckets->distancesFrom(src, search, best, dist_vector);
+    for (const auto &sourceDataPoint : worker_args.userSourceData.retrieveTract(src).retrieveDataPoints())
+    {
+        worker_args.settledVertices.at(sourceDataPoint.loc) = settledVertices;
+    }
+    calculateSingleRowOfDataFrame<row_label_type, col_label_type, value_type>(dist_vector.data(), 1, worker_args, src);
+}
 
+/* Search from several network nodes at once. Their distances are
+ * interleaved in lanes (dist[v * lanes + lane]) and a vertex is scanned
+ * for every lane whose label improved since its last scan, so each
+ * adjacency list is read once for the whole batch. Labels are corrected
+ * in priority order: a vertex may be scanned more than once, but the
+ * final distances are exact. */
 template<class row_label_type, class col_label_type, class value_type>
-void doDijstraFromOneNetworkNode(network_node src, graphWorkerArgs<row_label_type, col_label_type, value_type> &worker_args,
-                                 std::vector<value_type>& dist_vector)
+void doDijkstraFromManyNetworkNodes(const std::vector<network_node> &sources,
+                                    graphWorkerArgs<row_label_type, col_label_type, value_type> &worker_args,
+                                    batchSearchContext<value_type> &context)
 {
     typedef std::pair<value_type, network_node> queue_pair;
-    network_node V = worker_args.graph.vertices;
+    const auto &graph = worker_args.graph;
+    const value_type UNDEFINED = worker_args.df.UNDEFINED;
+    const unsigned long int lanes = sources.size();
 
-    std::fill(dist_vector.begin(), dist_vector.end(), worker_args.df.UNDEFINED);
-    dist_vector.at(src) = 0;
+    context.begin(lanes);
+    auto &dist = context.dist;
+    auto &pendingLanes = context.pendingLanes;
     std::priority_queue<queue_pair, std::vector<queue_pair>, std::greater<queue_pair>> queue;
-    queue.push(std::make_pair(0, src));
-    std::vector<bool> visited(V, false);
+    // (lane, destination node) labels still undefined, and an upper bound on the defined ones
+    unsigned long int undefinedDestLabels = lanes * worker_args.numDestNodes;
+    unsigned long int destLabelBound = 0;
+    for (unsigned long int lane = 0; lane < lanes; lane++)
+    {
+        network_node src = sources.at(lane);
+        context.touch(src);
+        dist.at(src * lanes + lane) = 0;
+        pendingLanes.at(src) |= (uint32_t) 1 << lane;
+        if (worker_args.isDestNode[src])
+        {
+            undefinedDestLabels--;
+        }
+        queue.push(std::make_pair(0, src));
+    }
+    std::vector<unsigned long int> settledVertices(lanes, 0);
     while (!queue.empty())
     {
+        value_type key = queue.top().first;
+        // every label still to come is at least key
+        if (key > worker_args.maxImpedance)
+        {
+            break;
+        }
+        if ((undefinedDestLabels == 0) && (key >= destLabelBound))
+        {
+            break;
+        }
         network_node u = queue.top().second;
         queue.pop();
-        visited.at(u) = true;
-        for (auto neighbor : worker_args.graph.neighbors.at(u))
+        uint32_t lanesToScan = pendingLanes[u];
+        // skip stale queue entries
+        if (lanesToScan == 0)
+        {
+            continue;
+        }
+        pendingLanes[u] = 0;
+        for (uint32_t remaining = lanesToScan; remaining != 0; remaining &= remaining - 1)
+        {
+            settledVertices[__builtin_ctz(remaining)]++;
+        }
+        const value_type *dist_u = &dist[u * lanes];
+        const network_loc edges_end = graph.offsets[u + 1];
+        for (network_loc edge = graph.offsets[u]; edge < edges_end; edge++)
         {
-            auto v = std::get<0>(neighbor);
-            auto weight = std::get<1>(neighbor);
-            if ((!visited.at(v)) and (dist_vector.at(v) > dist_vector.at(u) + weight))
+            auto v = graph.targets[edge];
+            auto weight = graph.weights[edge];
+            value_type *dist_v = &dist[v * lanes];
+            unsigned long int minImproved = UNDEFINED;
+            for (uint32_t remaining = lanesToScan; remaining != 0; remaining &= remaining - 1)
             {
-                dist_vector.at(v) = dist_vector.at(u) + weight;
-                queue.push(std::make_pair(dist_vector.at(v), v));
+                unsigned int lane = __builtin_ctz(remaining);
+                unsigned long int candidate = (unsigned long int) dist_u[lane] + weight;
+                if ((candidate < dist_v[lane]) && (candidate <= worker_args.maxImpedance))
+                {
+                    if (worker_args.isDestNode[v])
+                    {
+                        if (dist_v[lane] == UNDEFINED)
+                        {
+                            undefinedDestLabels--;
+                        }
+                        destLabelBound = std::max(destLabelBound, candidate);
+                    }
+                    context.touch(v);
+                    dist_v[lane] = (value_type) candidate;
+                    pendingLanes[v] |= (uint32_t) 1 << lane;
+                    minImproved = std::min(minImproved, candidate);
+                }
+            }
+            if (minImproved < UNDEFINED)
+            {
+                queue.push(std::make_pair((value_type) minImproved, v));
             }
         }
     }
 
-    //calculate row and add to dataFrame
-    calculateSingleRowOfDataFrame<row_label_type, col_label_type, value_type>(dist_vector, worker_args, src);
-
+    for (unsigned long int lane = 0; lane < lanes; lane++)
+    {
+        network_node src = sources.at(lane);
+        // record the work done for each source data point of this node
+        for (const auto &sourceDataPoint : worker_args.userSourceData.retrieveTract(src).retrieveDataPoints())
+        {
+            worker_args.settledVertices.at(sourceDataPoint.loc) = settledVertices.at(lane);
+        }
+        calculateSingleRowOfDataFrame<row_label_type, col_label_type, value_type>(&dist[lane], lanes, worker_args, src);
+    }
 }
 
 
@@ -158,10 +410,23 @@ public:
     userDataContainer<value_type> userSourceDataContainer;
     userDataContainer<value_type> userDestDataContainer;
     Graph<value_type> graph;
+    // number of vertices settled by the search for each row, by row loc
+    std::vector<unsigned long int> settledVertexCounts;
+    // seconds each worker thread spent searching and waiting during the last compute
+    std::vector<double> threadBusySeconds;
+    std::vector<double> threadIdleSeconds;
+    // sources searched together by each worker; 1 searches one source at a time
+    unsigned int searchBatchSize = 1;
+    // one-to-all searches use a bucket queue when no edge weighs more than this
+    unsigned long int bucketQueueMaxEdgeWeight = DEFAULT_BUCKET_QUEUE_MAX_EDGE_WEIGHT;
+    // when set, compute answers queries on this preprocessed hierarchy instead of the graph
+    std::shared_ptr<contractionHierarchy<value_type>> hierarchy;
 
     // Constructors
     transitMatrix(bool isCompressible, bool isSymmetric,  unsigned long int rows, unsigned long int cols)
     : df(isCompressible, isSymmetric, rows, cols) {}
+    transitMatrix(bool isCompressible, bool isSymmetric,  unsigned long int rows, unsigned long int cols, bool isSparse)
+    : df(isCompressible, isSymmetric, rows, cols, isSparse) {}
     transitMatrix()= default;
 
     void
@@ -195,6 +460,36 @@ public:
         this->userDestDataContainer.addPoint(networkNodeId, col_loc, lastMileDistance);
     }
 
+    /* Add count source points from contiguous columns */
+    void
+    addToUserSourceDataContainerBulk(const network_node *networkNodeIds,
+                                     const row_label_type *row_ids,
+                                     const value_type *lastMileDistances,
+                                     unsigned long int count)
+    {
+        df.reserveRowIndex(count);
+        userSourceDataContainer.reserve(count);
+        for (unsigned long int i = 0; i < count; i++)
+        {
+            addToUserSourceDataContainer(networkNodeIds[i], row_ids[i], lastMileDistances[i]);
+        }
+    }
+
+    /* Add count dest points from contiguous columns */
+    void
+    addToUserDestDataContainerBulk(const network_node *networkNodeIds,
+                                   const col_label_type *col_ids,
+                                   const value_type *lastMileDistances,
+                                   unsigned long int count)
+    {
+        df.reserveColIndex(count);
+        userDestDataContainer.reserve(count);
+        for (unsigned long int i = 0; i < count; i++)
+        {
+            addToUserDestDataContainer(networkNodeIds[i], col_ids[i], lastMileDistances[i]);
+        }
+    }
+
     void addSingleEdgeToGraph(network_node from_loc, network_node to_loc,
                         value_type edge_weight, bool is_bidirectional)
     {
@@ -206,21 +501,33 @@ public:
     }
 
     void
-    addEdgesToGraph(const std::vector<network_node>& from_column,
-            const std::vector<network_node>& to_column,
-            const std::vector<value_type>& edge_weights_column,
-            const std::vector<bool>& is_bidirectional_column)
+    addEdgesToGraph(const network_node *from_column,
+                    const network_node *to_column,
+                    const value_type *edge_weights_column,
+                    const unsigned char *is_bidirectional_column,
+                    unsigned long int count)
     {
-        for (unsigned long int i = 0; i < from_column.size(); i++)
+        // count out degrees first so each adjacency list is allocated once
+        std::vector<unsigned long int> outDegrees(graph.vertices, 0);
+        for (unsigned long int i = 0; i < count; i++)
         {
-            auto from_loc = from_column.at(i);
-            auto to_loc = to_column.at(i);
-            value_type edge_weight = edge_weights_column.at(i);
-            auto is_bidirectional = is_bidirectional_column.at(i);
-            graph.addEdge(from_loc, to_loc, edge_weight);
-            if (is_bidirectional)
+            if (from_column[i] >= graph.vertices || to_column[i] >= graph.vertices)
+            {
+                throw std::runtime_error("edge incompatible with declared graph structure");
+            }
+            outDegrees[from_column[i]]++;
+            if (is_bidirectional_column[i])
             {
-                graph.addEdge(to_loc, from_loc, edge_weight);
+                outDegrees[to_column[i]]++;
+            }
+        }
+        graph.reserveEdges(outDegrees);
+        for (unsigned long int i = 0; i < count; i++)
+        {
+            graph.addEdge(from_column[i], to_column[i], edge_weights_column[i]);
+            if (is_bidirectional_column[i])
+            {
+                graph.addEdge(to_column[i], from_column[i], edge_weights_column[i]);
             }
         }
     }
@@ -241,17 +548,121 @@ public:
 
     // Calculations
 
+    /* Preprocess the graph into a contraction hierarchy which compute will use */
+    void
+    buildContractionHierarchy()
+    {
+        graph.freeze();
+        auto newHierarchy = std::make_shared<contractionHierarchy<value_type>>();
+        newHierarchy->build(graph);
+        hierarchy = newHierarchy;
+    }
+
+    void
+    writeContractionHierarchy(const std::string &outfile) const
+    {
+        if (!hierarchy)
+        {
+            throw std::runtime_error("no contraction hierarchy to write");
+        }
+        hierarchy->write(outfile);
+    }
+
+    /* Read a contraction hierarchy which compute will use. Throws if it does not match the graph */
+    void
+    readContractionHierarchy(const std::string &infile)
+    {
+        graph.freeze();
+        auto newHierarchy = std::make_shared<contractionHierarchy<value_type>>();
+        newHierarchy->read(infile, graph);
+        hierarchy = newHierarchy;
+    }
+
+    bool
+    hasContractionHierarchy() const
+    {
+        return (bool) hierarchy;
+    }
+
+    unsigned long int
+    getNumShortcuts() const
+    {
+        return hierarchy ? hierarchy->numShortcuts : 0;
+    }
+
+    /* identifies the graph, so preprocessed data can be matched to it. Freezes the graph */
+    unsigned long int
+    getGraphChecksum()
+    {
+        graph.freeze();
+        return graph.checksum();
+    }
+
+    void
+    setSearchBatchSize(unsigned int batchSize)
+    {
+        if (batchSize < 1 || batchSize > MAX_SEARCH_BATCH_SIZE)
+        {
+            throw std::runtime_error("search batch size must be between 1 and 32");
+        }
+        searchBatchSize = batchSize;
+    }
+
+    /* Use a bucket queue instead of the heap when no edge weighs more than
+     * maxEdgeWeight. 0 always uses the heap */
+    void
+    setBucketQueueMaxEdgeWeight(unsigned long int maxEdgeWeight)
+    {
+        bucketQueueMaxEdgeWeight = maxEdgeWeight;
+    }
+
     void
     compute(unsigned int numThreads)
+    {
+        compute(numThreads, df.UNDEFINED);
+    }
+
+    /* Compute the matrix, storing only values up to maxImpedance. Each
+     * search stops as soon as the queue minimum passes maxImpedance, and
+     * cells beyond it are left UNDEFINED. */
+    void
+    compute(unsigned int numThreads, value_type maxImpedance)
     {
         try
         {
+            graph.freeze();
             graphWorkerArgs<row_label_type, col_label_type, value_type> worker_args(graph, userSourceDataContainer, userDestDataContainer,
-                                                               df);
-            worker_args.initialize();
+                                                               df, maxImpedance, settledVertexCounts,
+                                                               searchBatchSize, threadBusySeconds);
+            worker_args.initialize(numThreads);
+            // buckets cost memory and scanning time per unit of the largest
+            // edge weight, so they only beat the heap for light edges
+            unsigned long int maxEdgeWeight = graph.maxEdgeWeight();
+            if (maxEdgeWeight > 0 && maxEdgeWeight <= bucketQueueMaxEdgeWeight)
+            {
+                worker_args.bucketQueueWidth = maxEdgeWeight;
+            }
+            std::unique_ptr<manyToManyBuckets<value_type>> buckets;
+            if (hierarchy)
+            {
+                // distances at or past UNDEFINED cannot be stored
+                unsigned long int maxDistance = std::min((unsigned long int) maxImpedance,
+                                                         (unsigned long int) df.UNDEFINED - 1);
+                buckets.reset(new manyToManyBuckets<value_type>(*hierarchy,
+                        userDestDataContainer.retrieveUniqueNetworkNodeIds(), maxDistance));
+                worker_args.buckets = buckets.get();
+            }
+            auto start = std::chrono::steady_clock::now();
             workerQueue<row_label_type, col_label_type, value_type> wq(numThreads,
                     graphWorkerHandler<row_label_type, col_label_type, value_type>, worker_args);
             wq.startGraphWorker();
+            std::chrono::duration<double> elapsed = std::chrono::steady_clock::now() - start;
+            // whatever part of the run a thread did not spend searching, it waited
+            threadIdleSeconds.clear();
+            for (double busySeconds : threadBusySeconds)
+            {
+                threadIdleSeconds.push_back(std::max(0.0, elapsed.count() - busySeconds));
+            }
         } catch (...)
         {
             throw std::runtime_error("Failed to compute matrix");
@@ -272,49 +683,22 @@ public:
         return this->df.getValuesByColId(dest_id, sort);
     }
 
-
-
-    const std::unordered_map<row_label_type, std::vector<col_label_type>>
-    getDestsInRange(unsigned int threshold) const
+    /* copy the rows at rowLocs, in that order, into rows, a
+     * numRows x cols array; undefined where nothing is stored */
+    void
+    getValueRows(const long int* rowLocs, unsigned long int numRows, value_type* rows) const
     {
-        // Initialize maps
-        std::unordered_map<row_label_type, std::vector<col_label_type>> destsInRange;
-        for (network_node row_loc = 0; row_loc < df.rows; row_loc++)
+        std::fill(rows, rows + numRows * df.cols, df.UNDEFINED);
+        for (unsigned long int i = 0; i < numRows; i++)
         {
-            std::vector<col_label_type> valueData;
-            for (network_node col_loc = 0; col_loc < df.cols; col_loc++) {
-                if (df.getValueByLoc(row_loc, col_loc) <= threshold) {
-                    valueData.push_back(df.getColIdForLoc(col_loc));
-                }
-            }
-            row_label_type row_id = df.getRowIdForLoc(row_loc);
-            destsInRange.emplace(std::make_pair(row_id, valueData));
+            value_type *row = rows + i * df.cols;
+            df.forEachValueInRow(rowLocs[i], [row](unsigned long int col_loc, value_type value) {
+                row[col_loc] = value;
+            });
         }
-        return destsInRange;
-
     }
 
 
-    const std::unordered_map<col_label_type, std::vector<row_label_type>>
-    getSourcesInRange(unsigned int threshold) const
-    {
-        // Initialize maps
-        std::unordered_map<col_label_type, std::vector<row_label_type>> sourcesInRange;
-        for (network_node col_loc = 0; col_loc < df.cols; col_loc++)
-        {
-            std::vector<row_label_type> valueData;
-            for (network_node row_loc = 0; row_loc < df.rows; row_loc++) {
-                if (df.getValueByLoc(row_loc, col_loc) <= threshold) {
-                    valueData.push_back(df.getRowIdForLoc(row_loc));
-                }
-            }
-            col_label_type col_id = df.getColIdForLoc(col_loc);
-            sourcesInRange.emplace(std::make_pair(col_id, valueData));
-        }
-        return sourcesInRange;
-
-    }
-
 
     value_type
     timeToNearestDestPerCategory(const row_label_type& source_id, const std::string& category) const
@@ -358,14 +742,12 @@ public:
     {
         value_type minimum = df.UNDEFINED;
         network_node row_loc = df.getRowLocForId(source_id);
-        for (network_node col_loc = 0; col_loc < df.cols; col_loc++)
-        {
-            value_type dest_time = this->df.getValueByLoc(row_loc, col_loc);
+        df.forEachValueInRow(row_loc, [&minimum](network_node col_loc, value_type dest_time) {
             if (dest_time <= minimum)
             {
                 minimum = dest_time;
             }
-        }
+        });
         return minimum;
     }
 
@@ -376,18 +758,260 @@ public:
 
         value_type count = 0;
         network_node row_loc = df.getRowLocForId(source_id);
-        for (network_node col_loc = 0; col_loc < df.cols; col_loc++)
-        {
-            if (this->df.getValueByLoc(row_loc, col_loc) <= range)
+        df.forEachValueInRow(row_loc, [&count, range](network_node col_loc, value_type value) {
+            if (value <= range)
             {
                 count++;
             }
-        }
+        });
         return count;
     }
 
+    /* Whole-matrix category kernels. colCategories holds the category
+     * code of each column; columns with a code outside [0, numCategories)
+     * are skipped. Each writes a rows x numCategories array, row major. */
+
+    /* the time from each row to its nearest dest of each category,
+     * or UNDEFINED if none is reachable */
+    void
+    timeToNearestDestByCategory(const long int* colCategories, unsigned long int numCategories,
+                                value_type* nearestTimes, unsigned int numThreads) const
+    {
+        std::fill(nearestTimes, nearestTimes + df.rows * numCategories, df.UNDEFINED);
+        forEachRowInParallel(numThreads, [&](network_node row_loc) {
+            value_type *rowTimes = nearestTimes + row_loc * numCategories;
+            df.forEachValueInRow(row_loc, [&](network_node col_loc, value_type value) {
+                long int category = colCategories[col_loc];
+                if (category >= 0 && (unsigned long int) category < numCategories && value < rowTimes[category])
+                {
+                    rowTimes[category] = value;
+                }
+            });
+        });
+    }
+
+    /* the number of dests of each category within range of each row */
+    void
+    countDestsInRangeByCategory(const long int* colCategories, unsigned long int numCategories, value_type range,
+                                unsigned long int* counts, unsigned int numThreads) const
+    {
+        std::fill(counts, counts + df.rows * numCategories, 0);
+        forEachRowInParallel(numThreads, [&](network_node row_loc) {
+            unsigned long int *rowCounts = counts + row_loc * numCategories;
+            df.forEachValueInRow(row_loc, [&](network_node col_loc, value_type value) {
+                long int category = colCategories[col_loc];
+                if (value <= range && category >= 0 && (unsigned long int) category < numCategories)
+                {
+                    rowCounts[category]++;
+                }
+            });
+        });
+    }
+
+    /* the sum of colCapacities over the dests of each category
+     * within range of each row */
+    void
+    sumCapacityInRangeByCategory(const long int* colCategories, const double* colCapacities,
+                                 unsigned long int numCategories, value_type range,
+                                 double* sums, unsigned int numThreads) const
+    {
+        std::fill(sums, sums + df.rows * numCategories, 0.0);
+        forEachRowInParallel(numThreads, [&](network_node row_loc) {
+            double *rowSums = sums + row_loc * numCategories;
+            df.forEachValueInRow(row_loc, [&](network_node col_loc, value_type value) {
+                long int category = colCategories[col_loc];
+                if (value <= range && category >= 0 && (unsigned long int) category < numCategories)
+                {
+                    rowSums[category] += colCapacities[col_loc];
+                }
+            });
+        });
+    }
+
+    /* Threshold sweeps. thresholds must be ascending. Each value is
+     * counted once, in the bucket of the lowest threshold it is within,
+     * and the buckets are then accumulated so each threshold also takes
+     * everything within the lower ones. */
+
+    /* the number of dests of each category within each threshold of
+     * each row, as a rows x numCategories x numThresholds array;
+     * colCategories as for the category kernels */
+    void
+    countDestsInRangeByCategoryForThresholds(const long int* colCategories, unsigned long int numCategories,
+                                             const value_type* thresholds, unsigned long int numThresholds,
+                                             unsigned long int* counts, unsigned int numThreads) const
+    {
+        std::fill(counts, counts + df.rows * numCategories * numThresholds, 0);
+        forEachRowInParallel(numThreads, [&](network_node row_loc) {
+            unsigned long int *rowCounts = counts + row_loc * numCategories * numThresholds;
+            df.forEachValueInRow(row_loc, [&](network_node col_loc, value_type value) {
+                long int category = colCategories[col_loc];
+                if (category < 0 || (unsigned long int) category >= numCategories)
+                {
+                    return;
+                }
+                unsigned long int bucket = std::lower_bound(thresholds, thresholds + numThresholds, value) - thresholds;
+                if (bucket < numThresholds)
+                {
+                    rowCounts[category * numThresholds + bucket]++;
+                }
+            });
+            for (unsigned long int i = 0; i < numCategories * numThresholds; i++)
+            {
+                if (i % numThresholds > 0)
+                {
+                    rowCounts[i] += rowCounts[i - 1];
+                }
+            }
+        });
+    }
+
+    /* the sum of colWeights over the dests of each category within each
+     * threshold of each row, as a rows x numCategories x numThresholds
+     * array; colCategories as for the category kernels */
+    void
+    sumInRangeByCategoryForThresholds(const long int* colCategories, const double* colWeights,
+                                      unsigned long int numCategories, const value_type* thresholds,
+                                      unsigned long int numThresholds, double* sums, unsigned int numThreads) const
+    {
+        std::fill(sums, sums + df.rows * numCategories * numThresholds, 0.0);
+        forEachRowInParallel(numThreads, [&](network_node row_loc) {
+            double *rowSums = sums + row_loc * numCategories * numThresholds;
+            df.forEachValueInRow(row_loc, [&](network_node col_loc, value_type value) {
+                long int category = colCategories[col_loc];
+                if (category < 0 || (unsigned long int) category >= numCategories)
+                {
+                    return;
+                }
+                unsigned long int bucket = std::lower_bound(thresholds, thresholds + numThresholds, value) - thresholds;
+                if (bucket < numThresholds)
+                {
+                    rowSums[category * numThresholds + bucket] += colWeights[col_loc];
+                }
+            });
+            for (unsigned long int i = 0; i < numCategories * numThresholds; i++)
+            {
+                if (i % numThresholds > 0)
+                {
+                    rowSums[i] += rowSums[i - 1];
+                }
+            }
+        });
+    }
+
+    /* the sum of rowWeights over the sources within each threshold of
+     * each col, as a cols x numThresholds array */
+    void
+    sumSourcesInRangeForThresholds(const double* rowWeights, const value_type* thresholds,
+                                   unsigned long int numThresholds, double* sums, unsigned int numThreads) const
+    {
+        unsigned int numRuns = numRowRuns(numThreads);
+        // each run of rows sums into its own buckets
+        std::vector<std::vector<double>> runSums(numRuns);
+        forEachRowRunInParallel(numRuns, [&](unsigned int run, network_node firstRow, network_node lastRow) {
+            std::vector<double> &buckets = runSums[run];
+            buckets.assign(df.cols * numThresholds, 0.0);
+            for (network_node row_loc = firstRow; row_loc < lastRow; row_loc++)
+            {
+                double weight = rowWeights[row_loc];
+                df.forEachValueInRow(row_loc, [&](network_node col_loc, value_type value) {
+                    unsigned long int bucket = std::lower_bound(thresholds, thresholds + numThresholds, value)
+                                               - thresholds;
+                    if (bucket < numThresholds)
+                    {
+                        buckets[col_loc * numThresholds + bucket] += weight;
+                    }
+                });
+            }
+        });
+        std::fill(sums, sums + df.cols * numThresholds, 0.0);
+        for (const auto &buckets : runSums)
+        {
+            for (unsigned long int i = 0; i < buckets.size(); i++)
+            {
+                sums[i] += buckets[i];
+            }
+        }
+        for (unsigned long int i = 0; i < df.cols * numThresholds; i++)
+        {
+            if (i % numThresholds > 0)
+            {
+                sums[i] += sums[i - 1];
+            }
+        }
+    }
+
+    /* The values within range, as the CSR arrays of a rows x cols sparse
+     * matrix, read in one pass over the matrix: the values of row r are
+     * values[rowStarts[r]:rowStarts[r + 1]], in columns
+     * colLocs[rowStarts[r]:rowStarts[r + 1]] (ascending). */
+    void
+    getValuesInRange(value_type range, std::vector<unsigned long int>& rowStarts,
+                     std::vector<unsigned long int>& colLocs, std::vector<value_type>& values,
+                     unsigned int numThreads) const
+    {
+        std::vector<std::vector<unsigned long int>> runColLocs;
+        std::vector<std::vector<value_type>> runValues;
+        collectInRange(range, numThreads, rowStarts, runColLocs, runValues);
+        concatenateRuns(runColLocs, colLocs);
+        concatenateRuns(runValues, values);
+    }
+
+    /* The pairs within range, indexed both ways from one pass over the
+     * matrix: the dests in range of row r are the columns
+     * colLocs[rowStarts[r]:rowStarts[r + 1]] (ascending, CSR), and the
+     * sources in range of column c are the rows
+     * rowLocs[colStarts[c]:colStarts[c + 1]] (ascending, CSC). */
+    void
+    getInRangeIndex(value_type range, std::vector<unsigned long int>& rowStarts,
+                    std::vector<unsigned long int>& colLocs, std::vector<unsigned long int>& colStarts,
+                    std::vector<unsigned long int>& rowLocs, unsigned int numThreads) const
+    {
+        std::vector<std::vector<unsigned long int>> runColLocs;
+        std::vector<std::vector<value_type>> runValues;
+        collectInRange(range, numThreads, rowStarts, runColLocs, runValues);
+        runValues.clear();
+        concatenateRuns(runColLocs, colLocs);
+
+        // transpose with a counting sort; visiting rows in order keeps
+        // the rows of each column ascending
+        colStarts.assign(df.cols + 1, 0);
+        for (unsigned long int col_loc : colLocs)
+        {
+            colStarts[col_loc + 1]++;
+        }
+        std::partial_sum(colStarts.begin(), colStarts.end(), colStarts.begin());
+        std::vector<unsigned long int> nextInCol(colStarts.begin(), colStarts.end() - 1);
+        rowLocs.resize(colLocs.size());
+        for (network_node row_loc = 0; row_loc < df.rows; row_loc++)
+        {
+            for (unsigned long int i = rowStarts[row_loc]; i < rowStarts[row_loc + 1]; i++)
+            {
+                rowLocs[nextInCol[colLocs[i]]++] = row_loc;
+            }
+        }
+    }
+
     // Getters
 
+    const std::vector<unsigned long int>&
+    getSettledVertexCounts() const
+    {
+        return settledVertexCounts;
+    }
+
+    const std::vector<double>&
+    getThreadBusySeconds() const
+    {
+        return threadBusySeconds;
+    }
+
+    const std::vector<double>&
+    getThreadIdleSeconds() const
+    {
+        return threadIdleSeconds;
+    }
+
 
     value_type
     getValueById(const row_label_type& row_id, const col_label_type& col_id) const
@@ -417,8 +1041,56 @@ public:
     }
 
     void
-    readTMX(const std::string &infile) {
-        df.readTMX(infile);
+    readTMX(const std::string &infile, bool memoryMap=false) {
+        df.readTMX(infile, memoryMap);
+    }
+
+    bool
+    isMemoryMapped() const
+    {
+        return df.isMemoryMapped();
+    }
+
+    /* The dense value block: rows x cols in row-major order,
+     * or the upper triangle if the matrix is compressible. */
+    const value_type*
+    getValueBuffer() const
+    {
+        if (df.isSparse)
+        {
+            throw std::runtime_error("sparse transit matrix has no contiguous value buffer");
+        }
+        return df.values();
+    }
+
+    unsigned long int
+    getNumRows() const
+    {
+        return df.rows;
+    }
+
+    unsigned long int
+    getNumCols() const
+    {
+        return df.cols;
+    }
+
+    unsigned long int
+    getDatasetSize() const
+    {
+        return df.dataset_size;
+    }
+
+    bool
+    getIsCompressible() const
+    {
+        return df.isCompressible;
+    }
+
+    bool
+    getIsSparse() const
+    {
+        return df.isSparse;
     }
 
     void
@@ -433,10 +1105,10 @@ public:
     }
 
     void
-    writeCSV(const std::string &outfile) const
+    writeCSV(const std::string &outfile, int compressionLevel, unsigned int numThreads) const
     {
         try {
-            df.writeCSV(outfile);
+            df.writeCSV(outfile, compressionLevel, numThreads);
         }
         catch (...)
         {
@@ -454,6 +1126,19 @@ public:
         {
             throw std::runtime_error("Unable to write tmx");
         }
+    }
+
+    /* Write a tmx of independently compressed row chunks, see dataFrame::writeCompressedTMX */
+    void
+    writeCompressedTMX(const std::string &outfile, int level, unsigned int numThreads) const
+    {
+        try {
+            df.writeCompressedTMX(outfile, level, numThreads);
+        }
+        catch (...)
+        {
+            throw std::runtime_error("Unable to write tmx");
+        }
 
     }
 
@@ -461,4 +1146,105 @@ private:
     // Private Members
     std::unordered_map<std::string, std::vector<col_label_type>> categoryToDestMap;
 
+    /* Collect the entries within range of every row in one parallel pass
+     * over the matrix. Each run of rows collects into its own runColLocs
+     * and runValues; rowStarts indexes the runs as if concatenated. */
+    void
+    collectInRange(value_type range, unsigned int numThreads, std::vector<unsigned long int>& rowStarts,
+                   std::vector<std::vector<unsigned long int>>& runColLocs,
+                   std::vector<std::vector<value_type>>& runValues) const
+    {
+        unsigned int numRuns = numRowRuns(numThreads);
+        runColLocs.assign(numRuns, std::vector<unsigned long int>());
+        runValues.assign(numRuns, std::vector<value_type>());
+        std::vector<network_node> runFirstRows(numRuns + 1, df.rows);
+        rowStarts.assign(df.rows + 1, 0);
+        forEachRowRunInParallel(numRuns, [&](unsigned int run, network_node firstRow, network_node lastRow) {
+            runFirstRows[run] = firstRow;
+            for (network_node row_loc = firstRow; row_loc < lastRow; row_loc++)
+            {
+                df.forEachValueInRow(row_loc, [&](network_node col_loc, value_type value) {
+                    if (value <= range)
+                    {
+                        runColLocs[run].push_back(col_loc);
+                        runValues[run].push_back(value);
+                    }
+                });
+                // relative to the run until the runs are concatenated
+                rowStarts[row_loc + 1] = runValues[run].size();
+            }
+        });
+        unsigned long int runStart = 0;
+        for (unsigned int run = 0; run < numRuns; run++)
+        {
+            for (network_node row_loc = runFirstRows[run]; row_loc < runFirstRows[run + 1]; row_loc++)
+            {
+                rowStarts[row_loc + 1] += runStart;
+            }
+            runStart += runValues[run].size();
+        }
+    }
+
+    template <class T>
+    static void
+    concatenateRuns(const std::vector<std::vector<T>>& runs, std::vector<T>& concatenated)
+    {
+        concatenated.clear();
+        for (const auto &run : runs)
+        {
+            concatenated.insert(concatenated.end(), run.begin(), run.end());
+        }
+    }
+
+    /* the number of runs of rows to split the rows into for numThreads */
+    unsigned int
+    numRowRuns(unsigned int numThreads) const
+    {
+        return (unsigned int) std::max(1ul, std::min((unsigned long int) numThreads, df.rows));
+    }
+
+    /* split the rows into numRuns even runs, and call f(run, firstRow, lastRow)
+     * for each on its own thread */
+    template <class Function>
+    void
+    forEachRowRunInParallel(unsigned int numRuns, Function f) const
+    {
+        std::vector<std::exception_ptr> errors(numRuns);
+        std::vector<std::thread> threads;
+        for (unsigned int i = 0; i < numRuns; i++)
+        {
+            threads.push_back(std::thread([&, i]() {
+                try
+                {
+                    f(i, df.rows * i / numRuns, df.rows * (i + 1) / numRuns);
+                }
+                catch (...)
+                {
+                    errors[i] = std::current_exception();
+                }
+            }));
+        }
+        std::for_each(threads.begin(), threads.end(), [](std::thread &t) { t.join(); });
+        for (const auto &error : errors)
+        {
+            if (error)
+            {
+                std::rethrow_exception(error);
+            }
+        }
+    }
+
+    /* call f(row_loc) for every row, splitting the rows evenly between threads */
+    template <class Function>
+    void
+    forEachRowInParallel(unsigned int numThreads, Function f) const
+    {
+        forEachRowRunInParallel(numRowRuns(numThreads), [&f](unsigned int, network_node firstRow, network_node lastRow) {
+            for (network_node row_loc = firstRow; row_loc < lastRow; row_loc++)
+            {
+                f(row_loc);
+            }
+        });
+    }
+
 };
\ No newline at end of file
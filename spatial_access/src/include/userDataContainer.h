@@ -3,6 +3,8 @@
 // ©2017-2019, Center for Spatial Data Science
 
 #pragma once
+#include <algorithm>
+#include <numeric>
 #include <iostream>
 #include <vector>
 #include <string>
@@ -68,6 +70,14 @@ public:
 
 
     }
+    /* make room for count more points */
+    void reserve(unsigned long int count)
+    {
+        ids.reserve(ids.size() + count);
+        allNetworkNodeIds.reserve(allNetworkNodeIds.size() + count);
+        data.reserve(data.size() + count);
+    }
+
     bool containsTract(unsigned long int networkNodeId) const
     {
         return data.find(networkNodeId) != data.end();
@@ -85,3 +95,52 @@ public:
         return uniqueNetworkNodeIds;
     }
 };
+
+
+/* A frozen copy of a userDataContainer's points as parallel arrays sorted
+ * by loc, so filling a matrix row is one linear pass gathering distances
+ * by network node. */
+template <class value_type>
+class userDataIndex
+{
+public:
+    std::vector<unsigned long int> networkNodeIds;
+    std::vector<unsigned long int> locs;
+    std::vector<value_type> lastMileDistances;
+
+    void build(const userDataContainer<value_type> &container)
+    {
+        std::vector<const userDataPoint<value_type>*> points;
+        for (unsigned long int networkNodeId : container.retrieveUniqueNetworkNodeIds())
+        {
+            for (const auto &point : container.retrieveTract(networkNodeId).retrieveDataPoints())
+            {
+                points.push_back(&point);
+            }
+        }
+        std::sort(points.begin(), points.end(), [](const userDataPoint<value_type> *a,
+                                                   const userDataPoint<value_type> *b) {
+            return a->loc < b->loc;
+        });
+        networkNodeIds.resize(points.size());
+        locs.resize(points.size());
+        lastMileDistances.resize(points.size());
+        for (unsigned long int i = 0; i < points.size(); i++)
+        {
+            networkNodeIds[i] = points[i]->networkNodeId;
+            locs[i] = points[i]->loc;
+            lastMileDistances[i] = points[i]->lastMileDistance;
+        }
+    }
+
+    unsigned long int size() const
+    {
+        return locs.size();
+    }
+
+    /* position of the first point with loc >= minLoc */
+    unsigned long int lowerBound(unsigned long int minLoc) const
+    {
+        return std::lower_bound(locs.begin(), locs.end(), minLoc) - locs.begin();
+    }
+};
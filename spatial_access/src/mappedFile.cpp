@@ -0,0 +1,47 @@
+// Logan Noel (github.com/lmnoel)
+//
+// ©2017-2019, Center for Spatial Data Science
+
+#include <stdexcept>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include "include/mappedFile.h"
+
+mappedFile::mappedFile(const std::string &filename) : begin(nullptr), length(0)
+{
+    int fd = open(filename.c_str(), O_RDONLY);
+    if (fd < 0)
+    {
+        throw std::runtime_error("MappedFileError: unable to open " + filename);
+    }
+    struct stat file_stat;
+    if (fstat(fd, &file_stat) != 0)
+    {
+        close(fd);
+        throw std::runtime_error("MappedFileError: unable to stat " + filename);
+    }
+    length = (unsigned long int) file_stat.st_size;
+    if (length > 0)
+    {
+        void *mapping = mmap(nullptr, length, PROT_READ, MAP_SHARED, fd, 0);
+        if (mapping == MAP_FAILED)
+        {
+            close(fd);
+            throw std::runtime_error("MappedFileError: unable to map " + filename);
+        }
+        begin = static_cast<const char *>(mapping);
+    }
+    // the mapping stays valid after the descriptor is closed
+    close(fd);
+}
+
+mappedFile::~mappedFile()
+{
+    if (begin != nullptr)
+    {
+        munmap(const_cast<char *>(begin), length);
+    }
+}
@@ -3,43 +3,82 @@ cdef extern from "include/transitMatrix.h":
 
 
         {{ class_name }}(bool, bool, unsigned int, unsigned int) except +
+        {{ class_name }}(bool, bool, unsigned int, unsigned int, bool) except +
         {{ class_name }}() except +
 
         void prepareGraphWithVertices(int V) except +
         void addToUserSourceDataContainer(unsigned int, {{ row_type }}, {{ value_type }}) except +
         void addToUserDestDataContainer(unsigned int, {{ col_type }}, {{ value_type }}) except +
-        void addEdgesToGraph(vector[ulong], vector[ulong], vector[{{ value_type }}], vector[bool]) except +
+        void addToUserSourceDataContainerBulk(const ulong*, const {{ row_type }}*, const {{ value_type }}*, ulong) except +
+        void addToUserDestDataContainerBulk(const ulong*, const {{ col_type }}*, const {{ value_type }}*, ulong) except +
+        void addEdgesToGraph(const ulong*, const ulong*, const {{ value_type }}*, const unsigned char*, ulong) except +
         void addToCategoryMap({{ col_type }}, string) except +
         void setMockDataFrame(vector[vector[{{ value_type }}]], vector[{{ row_type }}], vector[{{ col_type }}]) except +
 
+        void setSearchBatchSize(unsigned int) except +
+        void buildContractionHierarchy() except +
+        void writeContractionHierarchy(string) except +
+        void readContractionHierarchy(string) except +
+        bool hasContractionHierarchy() except +
+        ulong getNumShortcuts() except +
+        ulong getGraphChecksum() except +
         void compute(int) except +
+        void compute(int, {{ value_type }}) except +
         vector[pair[{{ row_type }}, {{ value_type }}]] getValuesByDest({{ col_type }}, bool) except +
         vector[pair[{{ col_type }}, {{ value_type }}]] getValuesBySource({{ row_type }}, bool) except +
-        unordered_map[{{ row_type }}, vector[{{ col_type }}]] getDestsInRange({{ value_type }}) except +
-        unordered_map[{{ col_type }}, vector[{{ row_type }}]] getSourcesInRange({{ value_type }}) except +
+        void getValueRows(const long*, ulong, {{ value_type }}*) except +
         {{ value_type }} timeToNearestDestPerCategory({{ row_type }}, string) except +
         {{ value_type }} countDestsInRangePerCategory({{ row_type }}, string, {{ value_type }}) except +
         {{ value_type }} timeToNearestDest({{ row_type }}) except +
         {{ value_type }} countDestsInRange({{ row_type }}, {{ value_type }}) except +
+        void timeToNearestDestByCategory(const long*, ulong, {{ value_type }}*, unsigned int) except +
+        void countDestsInRangeByCategory(const long*, ulong, {{ value_type }}, ulong*, unsigned int) except +
+        void sumCapacityInRangeByCategory(const long*, const double*, ulong, {{ value_type }}, double*,
+                                          unsigned int) except +
+        void getValuesInRange({{ value_type }}, vector[ulong]&, vector[ulong]&, vector[{{ value_type }}]&,
+                              unsigned int) except +
+        void getInRangeIndex({{ value_type }}, vector[ulong]&, vector[ulong]&, vector[ulong]&, vector[ulong]&,
+                             unsigned int) except +
+        void countDestsInRangeByCategoryForThresholds(const long*, ulong, const {{ value_type }}*, ulong, ulong*,
+                                                      unsigned int) except +
+        void sumInRangeByCategoryForThresholds(const long*, const double*, ulong, const {{ value_type }}*, ulong,
+                                               double*, unsigned int) except +
+        void sumSourcesInRangeForThresholds(const double*, const {{ value_type }}*, ulong, double*,
+                                            unsigned int) except +
 
         vector[{{ col_type }}] getColIds() except +
         vector[{{ row_type }}] getRowIds() except +
+        vector[ulong] getSettledVertexCounts() except +
+        vector[double] getThreadBusySeconds() except +
+        vector[double] getThreadIdleSeconds() except +
 
-        void writeCSV(string) except +
+        void writeCSV(string, int, unsigned int) except +
         void writeTMX(string) except +
-        void readTMX(string) except +
+        void writeCompressedTMX(string, int, unsigned int) except +
+        void readTMX(string, bool) except +
+        bool isMemoryMapped() except +
+        const {{ value_type }}* getValueBuffer() except +
+        ulong getNumRows() except +
+        ulong getNumCols() except +
+        ulong getDatasetSize() except +
+        bool getIsCompressible() except +
+        bool getIsSparse() except +
         void readCSV(string) except +
         void readOTPCSV(string) except +
         void printDataFrame() except +
 
 cdef class  {{ py_class_name }}:
     cdef {{ class_name }} *thisptr
+    cdef Py_ssize_t shape[2]
+    cdef Py_ssize_t strides[2]
+    cdef int exports
 
-    def __cinit__(self, bool isCompressible=False, bool isSymmetric=False, unsigned int rows=0, unsigned int columns=0):
+    def __cinit__(self, bool isCompressible=False, bool isSymmetric=False, unsigned int rows=0, unsigned int columns=0,
+                  bool isSparse=False):
         if rows == 0 and columns == 0:
             self.thisptr = new {{ class_name }}()
         else:
-            self.thisptr = new {{ class_name }}(isCompressible, isSymmetric, rows, columns)
+            self.thisptr = new {{ class_name }}(isCompressible, isSymmetric, rows, columns, isSparse)
 
     def __dealloc__(self):
         del self.thisptr
@@ -54,28 +93,154 @@ cdef class  {{ py_class_name }}:
     def addToUserDestDataContainer(self, networkNodeId, id_, lastMileDistance):
         self.thisptr.addToUserDestDataContainer(networkNodeId, id_, lastMileDistance)
 
+    def addToUserSourceDataContainerBulk(self, const ulong[::1] networkNodeIds, ids,
+                                         const {{ value_type }}[::1] lastMileDistances):
+{%- if row_type == 'string' %}
+        cdef vector[string] row_ids = ids
+        cdef Py_ssize_t num_ids = row_ids.size()
+{%- else %}
+        cdef const ulong[::1] row_ids = ids
+        cdef Py_ssize_t num_ids = row_ids.shape[0]
+{%- endif %}
+        cdef Py_ssize_t count = networkNodeIds.shape[0]
+        if num_ids != count or lastMileDistances.shape[0] != count:
+            raise ValueError("source data columns must have the same length")
+        if count == 0:
+            return
+{%- if row_type == 'string' %}
+        self.thisptr.addToUserSourceDataContainerBulk(&networkNodeIds[0], row_ids.data(), &lastMileDistances[0], count)
+{%- else %}
+        self.thisptr.addToUserSourceDataContainerBulk(&networkNodeIds[0], &row_ids[0], &lastMileDistances[0], count)
+{%- endif %}
+
+    def addToUserDestDataContainerBulk(self, const ulong[::1] networkNodeIds, ids,
+                                       const {{ value_type }}[::1] lastMileDistances):
+{%- if col_type == 'string' %}
+        cdef vector[string] col_ids = ids
+        cdef Py_ssize_t num_ids = col_ids.size()
+{%- else %}
+        cdef const ulong[::1] col_ids = ids
+        cdef Py_ssize_t num_ids = col_ids.shape[0]
+{%- endif %}
+        cdef Py_ssize_t count = networkNodeIds.shape[0]
+        if num_ids != count or lastMileDistances.shape[0] != count:
+            raise ValueError("dest data columns must have the same length")
+        if count == 0:
+            return
+{%- if col_type == 'string' %}
+        self.thisptr.addToUserDestDataContainerBulk(&networkNodeIds[0], col_ids.data(), &lastMileDistances[0], count)
+{%- else %}
+        self.thisptr.addToUserDestDataContainerBulk(&networkNodeIds[0], &col_ids[0], &lastMileDistances[0], count)
+{%- endif %}
+
     def addEdgesToGraph(self, from_column, to_column, edge_weight_column, is_bidirectional_column):
-        self.thisptr.addEdgesToGraph(from_column, to_column, edge_weight_column, is_bidirectional_column)
+        # no copies are made if the columns are already contiguous arrays of the right type
+        is_bidirectional_column = np.ascontiguousarray(is_bidirectional_column, dtype=np.bool_)
+        self._addEdgesToGraph(np.ascontiguousarray(from_column, dtype=np.uint64),
+                              np.ascontiguousarray(to_column, dtype=np.uint64),
+                              np.ascontiguousarray(edge_weight_column, dtype='{{ value_buffer_format }}'),
+                              is_bidirectional_column.view(np.uint8))
+
+    def _addEdgesToGraph(self, const ulong[::1] from_column, const ulong[::1] to_column,
+                         const {{ value_type }}[::1] edge_weight_column,
+                         const unsigned char[::1] is_bidirectional_column):
+        cdef Py_ssize_t count = from_column.shape[0]
+        if to_column.shape[0] != count or edge_weight_column.shape[0] != count \
+                or is_bidirectional_column.shape[0] != count:
+            raise ValueError("edge columns must have the same length")
+        if count == 0:
+            return
+        self.thisptr.addEdgesToGraph(&from_column[0], &to_column[0], &edge_weight_column[0],
+                                     &is_bidirectional_column[0], count)
 
     def setMockDataFrame(self, dataset, row_ids, col_ids):
         self.thisptr.setMockDataFrame(dataset, row_ids, col_ids)
 
-    def compute(self, numThreads):
-        self.thisptr.compute(numThreads)
+    def setSearchBatchSize(self, batchSize):
+        self.thisptr.setSearchBatchSize(batchSize)
+
+    def buildContractionHierarchy(self):
+        self.thisptr.buildContractionHierarchy()
+
+    def writeContractionHierarchy(self, outfile):
+        self.thisptr.writeContractionHierarchy(outfile)
+
+    def readContractionHierarchy(self, infile):
+        self.thisptr.readContractionHierarchy(infile)
 
-    def writeCSV(self, outfile):
-        self.thisptr.writeCSV(outfile)
+    def hasContractionHierarchy(self):
+        return self.thisptr.hasContractionHierarchy()
+
+    def getNumShortcuts(self):
+        return self.thisptr.getNumShortcuts()
+
+    def getGraphChecksum(self):
+        return self.thisptr.getGraphChecksum()
+
+    def compute(self, numThreads, maxImpedance=None):
+        if maxImpedance is None:
+            self.thisptr.compute(numThreads)
+        else:
+            self.thisptr.compute(numThreads, maxImpedance)
+
+    def writeCSV(self, outfile, compressionLevel=0, numThreads=1):
+        self.thisptr.writeCSV(outfile, compressionLevel, numThreads)
 
     def writeTMX(self, outfile):
         self.thisptr.writeTMX(outfile)
 
-    def readTMX(self, infile):
-        self.thisptr.readTMX(infile)
+    def writeCompressedTMX(self, outfile, level, numThreads):
+        self.thisptr.writeCompressedTMX(outfile, level, numThreads)
+
+    def _checkNoExports(self):
+        if self.exports > 0:
+            raise BufferError("cannot reload a transit matrix while its values are exported")
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        cdef Py_ssize_t itemsize = sizeof({{ value_type }})
+        if self.thisptr.getIsSparse():
+            raise BufferError("sparse transit matrices cannot be exported as a buffer")
+        if flags & PyBUF_WRITABLE and self.thisptr.isMemoryMapped():
+            raise BufferError("memory mapped transit matrices are read only")
+        if self.thisptr.getIsCompressible():
+            # upper triangle, row by row
+            buffer.ndim = 1
+            self.shape[0] = self.thisptr.getDatasetSize()
+            self.strides[0] = itemsize
+        else:
+            buffer.ndim = 2
+            self.shape[0] = self.thisptr.getNumRows()
+            self.shape[1] = self.thisptr.getNumCols()
+            self.strides[0] = self.shape[1] * itemsize
+            self.strides[1] = itemsize
+        buffer.buf = <void*> self.thisptr.getValueBuffer()
+        buffer.format = b'{{ value_buffer_format }}'
+        buffer.internal = NULL
+        buffer.itemsize = itemsize
+        buffer.len = self.thisptr.getDatasetSize() * itemsize
+        buffer.obj = self
+        buffer.readonly = self.thisptr.isMemoryMapped()
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+        self.exports += 1
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        self.exports -= 1
+
+    def readTMX(self, infile, memoryMap=False):
+        self._checkNoExports()
+        self.thisptr.readTMX(infile, memoryMap)
+
+    def isMemoryMapped(self):
+        return self.thisptr.isMemoryMapped()
 
     def readCSV(self, infile):
+        self._checkNoExports()
         self.thisptr.readCSV(infile)
 
     def readOTPCSV(self, infile):
+        self._checkNoExports()
         self.thisptr.readOTPCSV(infile)
 
     def printDataFrame(self):
@@ -87,6 +252,13 @@ cdef class  {{ py_class_name }}:
     def getValuesByDest(self, dest_id, sort):
         return self.thisptr.getValuesByDest(dest_id, sort)
 
+    def getValueRows(self, const long[::1] rowLocs):
+        rows = np.empty((rowLocs.shape[0], self.thisptr.getNumCols()), dtype='{{ value_buffer_format }}')
+        cdef {{ value_type }}[:, ::1] rowsView = rows
+        if rows.size > 0:
+            self.thisptr.getValueRows(&rowLocs[0], rowLocs.shape[0], &rowsView[0, 0])
+        return rows
+
     def addToCategoryMap(self, dest_id, category):
         self.thisptr.addToCategoryMap(dest_id, category)
 
@@ -102,14 +274,201 @@ cdef class  {{ py_class_name }}:
     def countDestsInRange(self, source_id, range):
         return self.thisptr.countDestsInRange(source_id, range)
 
+    def _checkColCategories(self, const long[::1] colCategories):
+        if <ulong> colCategories.shape[0] != self.thisptr.getNumCols():
+            raise ValueError("expected one category code per column")
+
+    def timeToNearestDestByCategory(self, const long[::1] colCategories, ulong numCategories, unsigned int numThreads):
+        self._checkColCategories(colCategories)
+        nearestTimes = np.full((self.thisptr.getNumRows(), numCategories), np.iinfo('{{ value_buffer_format }}').max,
+                               dtype='{{ value_buffer_format }}')
+        cdef {{ value_type }}[:, ::1] nearestTimesView = nearestTimes
+        if nearestTimes.size > 0 and colCategories.shape[0] > 0:
+            self.thisptr.timeToNearestDestByCategory(&colCategories[0], numCategories, &nearestTimesView[0, 0],
+                                                     numThreads)
+        return nearestTimes
+
+    def countDestsInRangeByCategory(self, const long[::1] colCategories, ulong numCategories, range_,
+                                    unsigned int numThreads):
+        self._checkColCategories(colCategories)
+        counts = np.zeros((self.thisptr.getNumRows(), numCategories), dtype=np.uint64)
+        cdef ulong[:, ::1] countsView = counts
+        if counts.size > 0 and colCategories.shape[0] > 0:
+            self.thisptr.countDestsInRangeByCategory(&colCategories[0], numCategories, range_, &countsView[0, 0],
+                                                     numThreads)
+        return counts
+
+    def sumCapacityInRangeByCategory(self, const long[::1] colCategories, const double[::1] colCapacities,
+                                     ulong numCategories, range_, unsigned int numThreads):
+        self._checkColCategories(colCategories)
+        if colCapacities.shape[0] != colCategories.shape[0]:
+            raise ValueError("expected one capacity per column")
+        sums = np.zeros((self.thisptr.getNumRows(), numCategories), dtype=np.float64)
+        cdef double[:, ::1] sumsView = sums
+        if sums.size > 0 and colCategories.shape[0] > 0:
+            self.thisptr.sumCapacityInRangeByCategory(&colCategories[0], &colCapacities[0], numCategories, range_,
+                                                      &sumsView[0, 0], numThreads)
+        return sums
+
+    def countDestsInRangeByCategoryForThresholds(self, const long[::1] colCategories, ulong numCategories,
+                                                 const {{ value_type }}[::1] thresholds, unsigned int numThreads):
+        self._checkColCategories(colCategories)
+        counts = np.zeros((self.thisptr.getNumRows(), numCategories, thresholds.shape[0]), dtype=np.uint64)
+        cdef ulong[:, :, ::1] countsView = counts
+        if counts.size > 0 and colCategories.shape[0] > 0:
+            self.thisptr.countDestsInRangeByCategoryForThresholds(&colCategories[0], numCategories, &thresholds[0],
+                                                                  thresholds.shape[0], &countsView[0, 0, 0],
+                                                                  numThreads)
+        return counts
+
+    def sumInRangeByCategoryForThresholds(self, const long[::1] colCategories, const double[::1] colWeights,
+                                          ulong numCategories, const {{ value_type }}[::1] thresholds,
+                                          unsigned int numThreads):
+        self._checkColCategories(colCategories)
+        if colWeights.shape[0] != colCategories.shape[0]:
+            raise ValueError("expected one weight per column")
+        sums = np.zeros((self.thisptr.getNumRows(), numCategories, thresholds.shape[0]), dtype=np.float64)
+        cdef double[:, :, ::1] sumsView = sums
+        if sums.size > 0 and colCategories.shape[0] > 0:
+            self.thisptr.sumInRangeByCategoryForThresholds(&colCategories[0], &colWeights[0], numCategories,
+                                                           &thresholds[0], thresholds.shape[0], &sumsView[0, 0, 0],
+                                                           numThreads)
+        return sums
+
+    def sumSourcesInRangeForThresholds(self, const double[::1] rowWeights, const {{ value_type }}[::1] thresholds,
+                                       unsigned int numThreads):
+        if <ulong> rowWeights.shape[0] != self.thisptr.getNumRows():
+            raise ValueError("expected one weight per row")
+        sums = np.zeros((self.thisptr.getNumCols(), thresholds.shape[0]), dtype=np.float64)
+        cdef double[:, ::1] sumsView = sums
+        if sums.size > 0 and rowWeights.shape[0] > 0:
+            self.thisptr.sumSourcesInRangeForThresholds(&rowWeights[0], &thresholds[0], thresholds.shape[0],
+                                                        &sumsView[0, 0], numThreads)
+        return sums
+
+    def getValuesInRange(self, range_, unsigned int numThreads):
+        cdef vector[ulong] rowStarts
+        cdef vector[ulong] colLocs
+        cdef vector[{{ value_type }}] values
+        self.thisptr.getValuesInRange(range_, rowStarts, colLocs, values, numThreads)
+        valuesArray = np.empty(values.size(), dtype='{{ value_buffer_format }}')
+        cdef {{ value_type }}[::1] valuesView = valuesArray
+        if values.size() > 0:
+            memcpy(&valuesView[0], values.data(), values.size() * sizeof({{ value_type }}))
+        return _ulongVectorToArray(rowStarts), _ulongVectorToArray(colLocs), valuesArray
+
+    def getInRangeIndex(self, range_, unsigned int numThreads):
+        cdef vector[ulong] rowStarts
+        cdef vector[ulong] colLocs
+        cdef vector[ulong] colStarts
+        cdef vector[ulong] rowLocs
+        self.thisptr.getInRangeIndex(range_, rowStarts, colLocs, colStarts, rowLocs, numThreads)
+        return (_ulongVectorToArray(rowStarts), _ulongVectorToArray(colLocs),
+                _ulongVectorToArray(colStarts), _ulongVectorToArray(rowLocs))
+
+    def getDestsInRange(self, range_, unsigned int numThreads=1):
+        rowStarts, colLocs, _, _ = self.getInRangeIndex(range_, numThreads)
+        return _idsInRange(self.getRowIds(), rowStarts, colLocs, self.getColIds())
+
+    def getSourcesInRange(self, range_, unsigned int numThreads=1):
+        _, _, colStarts, rowLocs = self.getInRangeIndex(range_, numThreads)
+        return _idsInRange(self.getColIds(), colStarts, rowLocs, self.getRowIds())
+
     def getColIds(self):
         return self.thisptr.getColIds()
 
     def getRowIds(self):
         return self.thisptr.getRowIds()
 
-    def getSourcesInRange(self, range_):
-        return self.thisptr.getSourcesInRange(range_)
+    def getSettledVertexCounts(self):
+        return self.thisptr.getSettledVertexCounts()
+
+    def getThreadBusySeconds(self):
+        return self.thisptr.getThreadBusySeconds()
+
+    def getThreadIdleSeconds(self):
+        return self.thisptr.getThreadIdleSeconds()
+
+    def getNumRows(self):
+        return self.thisptr.getNumRows()
+
+    def getNumCols(self):
+        return self.thisptr.getNumCols()
+
+    def getIsCompressible(self):
+        return self.thisptr.getIsCompressible()
+
+    def getIsSparse(self):
+        return self.thisptr.getIsSparse()
+
+
+cdef extern from "include/lazyTMXReader.h":
+    cdef cppclass {{ lazy_class_name }} "lazyTMXReader<{{ row_type_full }}, {{ col_type_full }},{{ value_type_full }}>":
+
+        {{ lazy_class_name }}(string, ulong) except +
+
+        {{ value_type }} getValueById({{ row_type }}, {{ col_type }}) except +
+        vector[pair[{{ row_type }}, {{ value_type }}]] getValuesByDest({{ col_type }}, bool) except +
+        vector[pair[{{ col_type }}, {{ value_type }}]] getValuesBySource({{ row_type }}, bool) except +
+        void getValueRows(const long*, ulong, {{ value_type }}*) except +
+        vector[{{ col_type }}] getColIds() except +
+        vector[{{ row_type }}] getRowIds() except +
+        ulong getNumRows() except +
+        ulong getNumCols() except +
+        bool getIsCompressible() except +
+        bool getIsCompressed() except +
+        ulong getNumBlocks() except +
+        ulong getNumCachedBlocks() except +
+        ulong getNumBlocksRead() except +
+
+cdef class {{ py_lazy_class_name }}:
+    cdef {{ lazy_class_name }} *thisptr
+
+    def __cinit__(self, infile, ulong cacheBlocks):
+        self.thisptr = new {{ lazy_class_name }}(infile, cacheBlocks)
+
+    def __dealloc__(self):
+        del self.thisptr
+
+    def getValueById(self, source_id, dest_id):
+        return self.thisptr.getValueById(source_id, dest_id)
+
+    def getValuesBySource(self, source_id, sort):
+        return self.thisptr.getValuesBySource(source_id, sort)
+
+    def getValuesByDest(self, dest_id, sort):
+        return self.thisptr.getValuesByDest(dest_id, sort)
+
+    def getValueRows(self, const long[::1] rowLocs):
+        rows = np.empty((rowLocs.shape[0], self.thisptr.getNumCols()), dtype='{{ value_buffer_format }}')
+        cdef {{ value_type }}[:, ::1] rowsView = rows
+        if rows.size > 0:
+            self.thisptr.getValueRows(&rowLocs[0], rowLocs.shape[0], &rowsView[0, 0])
+        return rows
+
+    def getColIds(self):
+        return self.thisptr.getColIds()
+
+    def getRowIds(self):
+        return self.thisptr.getRowIds()
+
+    def getNumRows(self):
+        return self.thisptr.getNumRows()
+
+    def getNumCols(self):
+        return self.thisptr.getNumCols()
+
+    def getIsCompressible(self):
+        return self.thisptr.getIsCompressible()
+
+    def getIsCompressed(self):
+        return self.thisptr.getIsCompressed()
+
+    def getNumBlocks(self):
+        return self.thisptr.getNumBlocks()
+
+    def getNumCachedBlocks(self):
+        return self.thisptr.getNumCachedBlocks()
 
-    def getDestsInRange(self, range_):
-        return self.thisptr.getDestsInRange(range_)
\ No newline at end of file
+    def getNumBlocksRead(self):
+        return self.thisptr.getNumBlocksRead()
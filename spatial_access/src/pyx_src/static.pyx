@@ -6,17 +6,44 @@ from libcpp.vector cimport vector
 from libcpp.unordered_map cimport unordered_map
 from libcpp.utility cimport pair
 from libcpp.unordered_set cimport unordered_set
+from libc.string cimport memcpy
+from cpython cimport Py_buffer
+from cpython.buffer cimport PyBUF_WRITABLE
+import numpy as np
 
 ctypedef unsigned short int ushort
 ctypedef unsigned long int ulong
 ctypedef unsigned int uint
 
+cdef _ulongVectorToArray(const vector[ulong]& values):
+    array = np.empty(values.size(), dtype=np.uint64)
+    cdef ulong[::1] arrayView = array
+    if values.size() > 0:
+        memcpy(&arrayView[0], values.data(), values.size() * sizeof(ulong))
+    return array
+
+
+# the id->[array of other id] map of one side of an index from getInRangeIndex
+def _idsInRange(ids, starts, locs, otherIds):
+    otherIds = np.array(otherIds, dtype=object)[locs.astype(np.int64)]
+    return {id_: otherIds[starts[loc]:starts[loc + 1]].tolist() for loc, id_ in enumerate(ids)}
+
+
 cdef extern from "include/networkUtility.h":
     cdef cppclass NetworkUtility "NetworkUtility<unsigned long int>":
         NetworkUtility(vector[pair[ulong, ulong]], vector[ulong]) except +
         unordered_set[ulong] getConnectedNetworkNodes() except +
 
 
+cdef extern from "include/compressedChunks.h":
+    bool hasCompression()
+
+
+# False if the extension was built without zlib, and so can't compress
+def compressionAvailable():
+    return hasCompression()
+
+
 cdef extern from "include/tmxParser.h":
     cdef cppclass tmxTypeReader:
         tmxTypeReader(string) except +
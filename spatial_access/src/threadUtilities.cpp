@@ -5,37 +5,37 @@
 #include "include/threadUtilities.h"
 
 
-/* initialize jobQueue, reserving size for known inputs*/
-
-
-
-/* insert to the jobQueue */
+/* insert to the jobQueue. Not thread safe: fill the queue before workers start */
 void jobQueue::insert(unsigned long int item) {
-    data.push(item);
+    data.push_back(item);
 }
 
 
-/* pop from the jobQueue.*/
-unsigned long int jobQueue::pop(bool &endNow) {
-    unsigned long int res = 0;
-    std::lock_guard<std::mutex> guard(lock);
-    if (!data.empty()) {
-        res = data.front();
-        data.pop();
-
-    } else {
-        endNow = false;
+/* pop up to maxSize jobs from the jobQueue into batch. Returns the number popped */
+unsigned long int jobQueue::popBatch(std::vector<unsigned long int> &batch, unsigned long int maxSize)
+{
+    batch.clear();
+    // claim a contiguous range of jobs without taking a lock
+    unsigned long int begin = next.fetch_add(maxSize, std::memory_order_relaxed);
+    if (begin < data.size()) {
+        unsigned long int end = std::min(begin + maxSize, (unsigned long int) data.size());
+        batch.assign(data.begin() + begin, data.begin() + end);
     }
-    return res;
+    return batch.size();
 }
 
 /* return true if jobQueue is empty */
 bool jobQueue::empty() const
 {
-    bool res;
-    std::lock_guard<std::mutex> guard(lock);
-    res = data.empty();
-    return res;
+    return next.load(std::memory_order_relaxed) >= data.size();
+}
+
+/* jobs each popBatch should claim: large enough that threads rarely
+ * contend on the shared index, small enough to balance the tail */
+unsigned long int jobQueue::chunkSizeFor(unsigned int numThreads) const
+{
+    unsigned long int chunkSize = data.size() / (JOB_CHUNKS_PER_THREAD * std::max(numThreads, 1u));
+    return std::max(1ul, std::min(chunkSize, (unsigned long int) MAX_JOB_CHUNK_SIZE));
 }
 
 void do_join(std::thread &t)
@@ -2,6 +2,9 @@
 //
 // ©2017-2019, Center for Spatial Data Science
 
+#include <algorithm>
+#include <stdexcept>
+
 #include "include/tmxParser.h"
 
 // write data
@@ -29,3 +32,59 @@ void tmxWriter<unsigned int>::writeValueTypeEnum()
 {
     sharedSerializer.writeNumericType<unsigned short>(UnsignedIntType);
 }
+
+template<>
+void tmxWriter<unsigned long>::writeFixedWidthIds(const std::vector<unsigned long>& ids)
+{
+    sharedSerializer.writeNumericType<unsigned long>(sizeof(unsigned long));
+    sharedSerializer.writeNumericType<unsigned long>(ids.size());
+    sharedSerializer.writeBlock(ids.data(), ids.size());
+}
+
+template<>
+void tmxWriter<std::string>::writeFixedWidthIds(const std::vector<std::string>& ids)
+{
+    unsigned long int width = 0;
+    for (const auto &id : ids)
+    {
+        width = std::max(width, (unsigned long int) id.size());
+    }
+    sharedSerializer.writeNumericType<unsigned long>(width);
+    sharedSerializer.writeNumericType<unsigned long>(ids.size());
+    for (const auto &id : ids)
+    {
+        std::string padded(id);
+        padded.resize(width, '\0');
+        sharedSerializer.writeBlock(padded.data(), width);
+    }
+}
+
+// read data
+
+template<>
+void tmxReader<unsigned long>::readFixedWidthIds(std::vector<unsigned long>& ids)
+{
+    auto width = sharedDeserializer.readNumericType<unsigned long>();
+    if (width != sizeof(unsigned long))
+    {
+        throw std::runtime_error("unexpected width of id table");
+    }
+    auto size = sharedDeserializer.readNumericType<unsigned long>();
+    ids.assign(size, 0);
+    sharedDeserializer.readBlock(ids.data(), size);
+}
+
+template<>
+void tmxReader<std::string>::readFixedWidthIds(std::vector<std::string>& ids)
+{
+    auto width = sharedDeserializer.readNumericType<unsigned long>();
+    auto size = sharedDeserializer.readNumericType<unsigned long>();
+    std::string padded(width, '\0');
+    ids.clear();
+    ids.reserve(size);
+    for (unsigned long int i = 0; i < size; i++)
+    {
+        sharedDeserializer.readBlock(&padded[0], width);
+        ids.push_back(padded.substr(0, padded.find('\0')));
+    }
+}
@@ -1,9 +1,14 @@
+import numpy as np
 from spatial_access.MatrixInterface import MatrixInterface
 
 from spatial_access.SpatialAccessExceptions import ReadTMXFailedException
+from spatial_access.SpatialAccessExceptions import ReadCSVFailedException
 from spatial_access.SpatialAccessExceptions import IndecesNotFoundException
 from spatial_access.SpatialAccessExceptions import FileNotFoundException
 from spatial_access.SpatialAccessExceptions import UnexpectedShapeException
+from spatial_access.SpatialAccessExceptions import WriteTMXFailedException
+from spatial_access.SpatialAccessExceptions import WriteCSVFailedException
+from spatial_access.SpatialAccessExceptions import MatrixNotDenseException
 
 class TestClass:
     def setup_class(self):
@@ -218,3 +223,696 @@ class TestClass:
         interface2.read_file(filename)
         interface2.print_data_frame()
 
+
+    def test_8(self):
+        """
+        Test sparse storage with a maximum impedance,
+        writing to and reading from tmx.
+        """
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=3,
+                                 columns=2,
+                                 network_vertices=4,
+                                 is_sparse=True)
+        from_column = [0, 1, 0, 3, 0]
+        to_column = [1, 0, 3, 2, 2]
+        weight_column = [3, 4, 5, 7, 2]
+        is_bidirectional_column = [False, False, False, False, True]
+        interface.add_edges_to_graph(from_column=from_column,
+                                     to_column=to_column,
+                                     edge_weight_column=weight_column,
+                                     is_bidirectional_column=is_bidirectional_column)
+
+        interface.add_user_source_data(2, 10, 5, False)
+        interface.add_user_source_data(1, 11, 4, False)
+        interface.add_user_source_data(0, 12, 1, False)
+
+        interface.add_user_dest_data(0, 21, 4)
+        interface.add_user_dest_data(3, 20, 6)
+
+        interface.build_matrix(max_impedance=15)
+        undefined = 65535
+
+        assert interface.get_values_by_source(10) == [(21, 11), (20, undefined)]
+        assert interface.get_values_by_source(11, sort=True) == [(21, 12), (20, undefined)]
+        assert interface.get_dests_in_range(15)[10] == [21]
+        assert interface.get_sources_in_range(15)[20] == [12]
+        assert interface.time_to_nearest_dest(10) == 11
+        assert interface.count_dests_in_range(11, 15) == 1
+
+        filename = self.datapath + "test_8.tmx"
+        interface.write_tmx(filename)
+
+        interface2 = MatrixInterface()
+        interface2.read_file(filename)
+
+        assert interface2.get_values_by_source(10) == [(21, 11), (20, undefined)]
+        assert interface2.get_sources_in_range(15)[21] == [10, 11, 12]
+        assert interface2.time_to_nearest_dest(11) == 12
+
+    def test_9(self):
+        """
+        Test memory mapping a tmx written with the contiguous layout.
+        """
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=True,
+                                 is_compressible=True,
+                                 rows=3,
+                                 columns=3,
+                                 network_vertices=4)
+        from_column = [0, 1, 2, 3]
+        to_column = [1, 2, 3, 0]
+        weight_column = [3, 4, 5, 6]
+        is_bidirectional_column = [True, True, True, True]
+        interface.add_edges_to_graph(from_column=from_column,
+                                     to_column=to_column,
+                                     edge_weight_column=weight_column,
+                                     is_bidirectional_column=is_bidirectional_column)
+
+        interface.add_user_source_data(1, 10, 2, True)
+        interface.add_user_source_data(2, 11, 1, True)
+        interface.add_user_source_data(3, 12, 3, True)
+
+        interface.build_matrix()
+
+        filename = self.datapath + "test_9.tmx"
+        interface.write_tmx(filename)
+
+        interface2 = MatrixInterface()
+        interface2.read_file(filename, memory_map=True)
+
+        assert interface2.transit_matrix.isMemoryMapped()
+        for source_id in [10, 11, 12]:
+            assert interface2.get_values_by_source(source_id) == interface.get_values_by_source(source_id)
+        assert interface2.get_dests_in_range(10) == interface.get_dests_in_range(10)
+        assert interface2.time_to_nearest_dest(12) == interface.time_to_nearest_dest(12)
+        assert interface2.get_values_by_source(10) == [(10, 0), (11, 7), (12, 14)]
+
+    def test_10(self):
+        """
+        Test exporting matrix values as numpy arrays.
+        """
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=2,
+                                 columns=3,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=[[1, 2, 3], [4, 5, 6]],
+                                       source_ids=[10, 11],
+                                       dest_ids=[20, 21, 22])
+        values = interface.get_value_array()
+        assert values.shape == (2, 3)
+        assert values.dtype == np.uint16
+        assert values.tolist() == [[1, 2, 3], [4, 5, 6]]
+
+        symmetric = MatrixInterface(require_extended_range=True)
+        symmetric.prepare_matrix(is_symmetric=True,
+                                 is_compressible=True,
+                                 rows=3,
+                                 columns=3,
+                                 network_vertices=1)
+        symmetric._set_mock_data_frame(dataset=[[0, 1, 2], [0, 3], [0]],
+                                       source_ids=[10, 11, 12],
+                                       dest_ids=[10, 11, 12])
+        triangle = symmetric.get_value_array()
+        assert triangle.dtype == np.uint32
+        assert triangle.tolist() == [0, 1, 2, 0, 3, 0]
+        assert symmetric.get_compressed_index(2, 1) == 4
+        assert triangle[symmetric.get_compressed_index([0, 1, 2], [2, 2, 0])].tolist() == [2, 3, 2]
+
+        filename = self.datapath + "test_10.tmx"
+        interface.write_tmx(filename)
+        mapped = MatrixInterface()
+        mapped.read_file(filename, memory_map=True)
+        mapped_values = mapped.get_value_array()
+        assert not mapped_values.flags.writeable
+        assert mapped_values.tolist() == [[1, 2, 3], [4, 5, 6]]
+
+    def test_11(self):
+        """
+        Test bulk ingestion of user data matches adding points one at a time.
+        """
+        def build(bulk):
+            interface = MatrixInterface()
+            interface.primary_ids_are_string = True
+            interface.prepare_matrix(is_symmetric=False,
+                                     is_compressible=False,
+                                     rows=3,
+                                     columns=2,
+                                     network_vertices=4)
+            interface.add_edges_to_graph(from_column=[0, 1, 0, 3, 0],
+                                         to_column=[1, 0, 3, 2, 2],
+                                         edge_weight_column=[3, 4, 5, 7, 2],
+                                         is_bidirectional_column=[False, False, False, False, True])
+            if bulk:
+                interface.add_user_source_data_bulk(network_ids=np.array([2, 1, 3]),
+                                                    user_ids=np.array(['a', 'b', 'c'], dtype=object),
+                                                    weights=np.array([5, 4, 1]),
+                                                    is_also_dest=False)
+                interface.add_user_dest_data_bulk(network_ids=np.array([1, 3]),
+                                                  user_ids=np.array([21, 20]),
+                                                  weights=np.array([4, 6]))
+            else:
+                for network_id, user_id, weight in zip([2, 1, 3], ['a', 'b', 'c'], [5, 4, 1]):
+                    interface.add_user_source_data(network_id, user_id, weight, False)
+                for network_id, user_id, weight in zip([1, 3], [21, 20], [4, 6]):
+                    interface.add_user_dest_data(network_id, user_id, weight)
+            interface.build_matrix()
+            return interface
+
+        single = build(bulk=False)
+        bulk = build(bulk=True)
+        for source_id in ['a', 'b', 'c']:
+            assert bulk.get_values_by_source(source_id) == single.get_values_by_source(source_id)
+
+    def test_12(self):
+        """
+        Test bulk ingestion rejects mismatched columns and
+        weights which do not fit the value type.
+        """
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=2,
+                                 columns=2,
+                                 network_vertices=4)
+        try:
+            interface.add_user_source_data_bulk(network_ids=[1, 2],
+                                                user_ids=[10],
+                                                weights=[3, 4],
+                                                is_also_dest=False)
+            assert False
+        except ValueError:
+            pass
+        try:
+            interface.add_user_dest_data_bulk(network_ids=[1, 2],
+                                              user_ids=[20, 21],
+                                              weights=[3, 70000])
+            assert False
+        except OverflowError:
+            pass
+        interface.add_user_source_data_bulk(network_ids=[], user_ids=[], weights=[], is_also_dest=True)
+        assert interface.get_source_ids() == []
+
+    def _prepare_small_network_interface(self, weight_column):
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=3,
+                                 columns=2,
+                                 network_vertices=4)
+        interface.add_edges_to_graph(from_column=[0, 1, 0, 3, 0],
+                                     to_column=[1, 0, 3, 2, 2],
+                                     edge_weight_column=weight_column,
+                                     is_bidirectional_column=[False, False, False, False, True])
+        interface.add_user_source_data(2, 10, 5, False)
+        interface.add_user_source_data(1, 11, 4, False)
+        interface.add_user_source_data(0, 12, 1, False)
+        interface.add_user_dest_data(0, 21, 4)
+        interface.add_user_dest_data(3, 20, 6)
+        return interface
+
+    def test_13(self):
+        """
+        Test building the matrix on a cached contraction hierarchy.
+        """
+        import os
+        filename = self.datapath + "test_13.ch"
+        expected = self._prepare_small_network_interface([3, 4, 5, 7, 2])
+        expected.build_matrix()
+
+        interface = self._prepare_small_network_interface([3, 4, 5, 7, 2])
+        interface.prepare_contraction_hierarchy(filename)
+        assert os.path.exists(filename)
+        interface.build_matrix()
+        assert np.array_equal(interface.get_value_array(), expected.get_value_array())
+
+        cached = self._prepare_small_network_interface([3, 4, 5, 7, 2])
+        assert cached.get_network_checksum() == interface.get_network_checksum()
+        cached.prepare_contraction_hierarchy(filename)
+        cached.build_matrix()
+        assert np.array_equal(cached.get_value_array(), expected.get_value_array())
+
+        # a stale cache file for different weights is rebuilt
+        reweighted = self._prepare_small_network_interface([3, 4, 5, 7, 9])
+        assert reweighted.get_network_checksum() != interface.get_network_checksum()
+        reweighted.prepare_contraction_hierarchy(filename)
+        reweighted.build_matrix()
+        assert reweighted.get_values_by_source(10) == [(21, 18), (20, 25)]
+
+    def test_14(self):
+        """
+        Test per thread busy and idle times are reported.
+        """
+        interface = self._prepare_small_network_interface([3, 4, 5, 7, 2])
+        interface.build_matrix()
+        thread_times = interface.get_thread_times()
+        assert len(thread_times) == interface._get_thread_limit()
+        for busy, idle in thread_times:
+            assert busy >= 0
+            assert idle >= 0
+
+    def test_15(self):
+        """
+        Test writing and reading tmx files of compressed row chunks.
+        """
+        import os
+        generator = np.random.RandomState(0)
+        dense_values = generator.randint(0, 100, size=(1000, 700))
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=1000,
+                                 columns=700,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=dense_values.tolist(),
+                                       source_ids=list(range(1000)),
+                                       dest_ids=list(range(700)))
+        uncompressed_filename = self.datapath + "test_15.tmx"
+        interface.write_tmx(uncompressed_filename)
+        for compression_level in [1, 9]:
+            filename = self.datapath + "test_15_{}.tmx".format(compression_level)
+            interface.write_tmx(filename, compression_level=compression_level)
+            assert os.path.getsize(filename) < os.path.getsize(uncompressed_filename)
+            for memory_map in [False, True]:
+                reread = MatrixInterface()
+                reread.read_file(filename, memory_map=memory_map)
+                assert not reread.transit_matrix.isMemoryMapped()
+                assert np.array_equal(reread.get_value_array(), dense_values)
+                assert reread.get_values_by_source(3) == interface.get_values_by_source(3)
+
+        rows = 1100
+        triangle = [generator.randint(0, 5000, size=rows - row).tolist() for row in range(rows)]
+        symmetric = MatrixInterface(require_extended_range=True)
+        symmetric.prepare_matrix(is_symmetric=True,
+                                 is_compressible=True,
+                                 rows=rows,
+                                 columns=rows,
+                                 network_vertices=1)
+        symmetric._set_mock_data_frame(dataset=triangle,
+                                       source_ids=list(range(rows)),
+                                       dest_ids=list(range(rows)))
+        filename = self.datapath + "test_15_symmetric.tmx"
+        symmetric.write_tmx(filename, compression_level=6)
+        reread = MatrixInterface()
+        reread.read_file(filename)
+        assert np.array_equal(reread.get_value_array(), np.concatenate(triangle))
+        assert reread.get_values_by_dest(7) == symmetric.get_values_by_dest(7)
+
+        try:
+            interface.write_tmx(filename, compression_level=0)
+            assert False
+        except WriteTMXFailedException:
+            pass
+
+    def test_16(self):
+        """
+        Test lazily reading rows and columns of contiguous and
+        compressed tmx files.
+        """
+        generator = np.random.RandomState(1)
+        dense_values = generator.randint(0, 100, size=(300, 250))
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=300,
+                                 columns=250,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=dense_values.tolist(),
+                                       source_ids=list(range(300)),
+                                       dest_ids=list(range(250)))
+
+        rows = 400
+        triangle = [generator.randint(0, 5000, size=rows - row).tolist() for row in range(rows)]
+        symmetric = MatrixInterface(require_extended_range=True)
+        symmetric.prepare_matrix(is_symmetric=True,
+                                 is_compressible=True,
+                                 rows=rows,
+                                 columns=rows,
+                                 network_vertices=1)
+        symmetric._set_mock_data_frame(dataset=triangle,
+                                       source_ids=list(range(rows)),
+                                       dest_ids=list(range(rows)))
+
+        for name, expected in [('dense', interface), ('symmetric', symmetric)]:
+            for compression_level in [None, 6]:
+                filename = self.datapath + "test_16_{}_{}.tmx".format(name, compression_level)
+                expected.write_tmx(filename, compression_level=compression_level)
+                for cache_blocks in [1, 64]:
+                    lazy = MatrixInterface()
+                    lazy.read_file(filename, lazy=True, cache_blocks=cache_blocks)
+                    assert lazy.transit_matrix.getIsCompressed() == (compression_level is not None)
+                    assert lazy.transit_matrix.getNumBlocksRead() == 0
+                    assert lazy.get_source_ids() == expected.get_source_ids()
+                    assert lazy.get_dest_ids() == expected.get_dest_ids()
+                    for source_id in [0, 7, 299, 7]:
+                        assert lazy.get_values_by_source(source_id) == expected.get_values_by_source(source_id)
+                        assert lazy.get_values_by_source(source_id, sort=True) == \
+                            expected.get_values_by_source(source_id, sort=True)
+                    for dest_id in [0, 120, 249]:
+                        assert lazy.get_values_by_dest(dest_id) == expected.get_values_by_dest(dest_id)
+                    assert lazy.get_values_by_source(10 ** 6) == []
+                    assert lazy.transit_matrix.getNumCachedBlocks() <= cache_blocks
+                    try:
+                        lazy.get_value_array()
+                        assert False
+                    except MatrixNotDenseException:
+                        pass
+
+        lazy = MatrixInterface()
+        lazy.read_file(self.datapath + "test_16_dense_None.tmx", lazy=True)
+        lazy.get_values_by_source(5)
+        blocks_read = lazy.transit_matrix.getNumBlocksRead()
+        assert blocks_read < lazy.transit_matrix.getNumBlocks()
+        lazy.get_values_by_source(5)
+        assert lazy.transit_matrix.getNumBlocksRead() == blocks_read
+
+        sparse = MatrixInterface()
+        sparse.prepare_matrix(is_symmetric=False,
+                              is_compressible=False,
+                              rows=2,
+                              columns=2,
+                              network_vertices=1,
+                              is_sparse=True)
+        sparse._set_mock_data_frame(dataset=[[1, 2], [3, 4]],
+                                    source_ids=[0, 1],
+                                    dest_ids=[0, 1])
+        filename = self.datapath + "test_16_sparse.tmx"
+        sparse.write_tmx(filename)
+        try:
+            MatrixInterface().read_file(filename, lazy=True)
+            assert False
+        except ReadTMXFailedException:
+            pass
+
+    def test_17(self):
+        """
+        Test reading csv files with undefined values, short rows,
+        string ids and windows line endings.
+        """
+        filename = self.datapath + "test_17.csv"
+        with open(filename, 'w', newline='') as csv_file:
+            csv_file.write(",a,b,c,\r\n")
+            csv_file.write("10,1,-1,3,\r\n")
+            csv_file.write("\r\n")
+            csv_file.write("11,4,5\r\n")
+            csv_file.write("12, 7,8,9")
+        interface = MatrixInterface()
+        interface.read_file(filename)
+        assert interface.get_source_ids() == [10, 11, 12]
+        assert interface.get_dest_ids() == ['a', 'b', 'c']
+        undefined = np.iinfo(np.uint16).max
+        assert np.array_equal(interface.get_value_array(),
+                              [[1, undefined, 3], [4, 5, undefined], [7, 8, 9]])
+
+        string_ids = MatrixInterface()
+        string_ids.primary_ids_are_string = True
+        string_ids.secondary_ids_are_string = True
+        string_ids.prepare_matrix(is_symmetric=False,
+                                  is_compressible=False,
+                                  rows=2,
+                                  columns=2,
+                                  network_vertices=1)
+        string_ids._set_mock_data_frame(dataset=[[1, 2], [3, 4]],
+                                        source_ids=['x', 'y'],
+                                        dest_ids=['a', 'b'])
+        assert string_ids.get_source_ids() == ['x', 'y']
+        assert string_ids.get_dest_ids() == ['a', 'b']
+
+        rows = 500
+        generator = np.random.RandomState(2)
+        dense_values = generator.randint(0, 1000, size=(rows, 40))
+        written = MatrixInterface()
+        written.prepare_matrix(is_symmetric=False,
+                               is_compressible=False,
+                               rows=rows,
+                               columns=40,
+                               network_vertices=1)
+        written._set_mock_data_frame(dataset=dense_values.tolist(),
+                                     source_ids=list(range(rows)),
+                                     dest_ids=list(range(40)))
+        filename = self.datapath + "test_17_written.csv"
+        written.write_csv(filename)
+        reread = MatrixInterface()
+        reread.read_file(filename)
+        assert np.array_equal(reread.get_value_array(), dense_values)
+
+        with open(filename, 'a') as csv_file:
+            csv_file.write("{},{}\n".format(rows, ",".join(["1"] * 41)))
+        try:
+            MatrixInterface().read_file(filename)
+            assert False
+        except ReadCSVFailedException:
+            pass
+
+    def test_18(self):
+        """
+        Test writing plain and gzipped csv files.
+        """
+        import gzip
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=2,
+                                 columns=3,
+                                 network_vertices=1)
+        undefined = np.iinfo(np.uint16).max
+        interface._set_mock_data_frame(dataset=[[1, undefined, 300], [65534, 0, 12]],
+                                       source_ids=[5, 60],
+                                       dest_ids=[7, 8, 9])
+        filename = self.datapath + "test_18.csv"
+        interface.write_csv(filename)
+        with open(filename) as csv_file:
+            assert csv_file.read() == ",7,8,9,\n5,1,-1,300,\n60,65534,0,12,\n"
+
+        symmetric = MatrixInterface()
+        symmetric.prepare_matrix(is_symmetric=True,
+                                 is_compressible=True,
+                                 rows=2,
+                                 columns=2,
+                                 network_vertices=1)
+        symmetric._set_mock_data_frame(dataset=[[0, 4], [0]],
+                                       source_ids=[1, 2],
+                                       dest_ids=[1, 2])
+        symmetric.write_csv(filename)
+        with open(filename) as csv_file:
+            assert csv_file.read() == ",1,2,\n1,0,4,\n2,4,0,\n"
+
+        rows = 20000
+        generator = np.random.RandomState(3)
+        dense_values = generator.randint(0, 10000, size=(rows, 40))
+        written = MatrixInterface()
+        written.prepare_matrix(is_symmetric=False,
+                               is_compressible=False,
+                               rows=rows,
+                               columns=40,
+                               network_vertices=1)
+        written._set_mock_data_frame(dataset=dense_values.tolist(),
+                                     source_ids=list(range(rows)),
+                                     dest_ids=list(range(40)))
+        written.write_csv(filename)
+        gzipped_filename = self.datapath + "test_18.csv.gz"
+        written.write_csv(gzipped_filename, compression_level=6)
+        with open(filename, 'rb') as csv_file, gzip.open(gzipped_filename, 'rb') as gzipped_file:
+            assert gzipped_file.read() == csv_file.read()
+        reread = MatrixInterface()
+        reread.read_file(filename)
+        assert np.array_equal(reread.get_value_array(), dense_values)
+
+    def test_19(self):
+        """
+        Test the whole-matrix category kernels against
+        numpy, on dense and symmetric matrices.
+        """
+        undefined = np.iinfo(np.uint16).max
+        generator = np.random.RandomState(4)
+        values = generator.randint(0, 1000, size=(50, 30))
+        values[generator.rand(50, 30) < 0.2] = undefined
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=50,
+                                 columns=30,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=values.tolist(),
+                                       source_ids=list(range(50)),
+                                       dest_ids=list(range(30)))
+        # dests of code -1 and 3 are skipped
+        dest_categories = generator.randint(-1, 4, size=30)
+        dest_capacities = generator.rand(30)
+
+        nearest = interface.time_to_nearest_dest_by_category(dest_categories, 3)
+        counts = interface.count_dests_in_range_by_category(dest_categories, 3, 500)
+        sums = interface.sum_capacity_in_range_by_category(dest_categories, dest_capacities, 3, 500)
+        assert nearest.shape == counts.shape == sums.shape == (50, 3)
+        for category in range(3):
+            category_values = values[:, dest_categories == category]
+            in_range = category_values <= 500
+            assert (nearest[:, category] == category_values.min(axis=1, initial=undefined)).all()
+            assert (counts[:, category] == in_range.sum(axis=1)).all()
+            assert np.allclose(sums[:, category], in_range @ dest_capacities[dest_categories == category])
+
+        symmetric = MatrixInterface()
+        symmetric.prepare_matrix(is_symmetric=True,
+                                 is_compressible=True,
+                                 rows=3,
+                                 columns=3,
+                                 network_vertices=1)
+        symmetric._set_mock_data_frame(dataset=[[0, 4, 9], [0, 2], [0]],
+                                       source_ids=[1, 2, 3],
+                                       dest_ids=[1, 2, 3])
+        nearest = symmetric.time_to_nearest_dest_by_category([1, 0, 0], 2)
+        assert nearest.tolist() == [[4, 0], [0, 4], [0, 9]]
+        counts = symmetric.count_dests_in_range_by_category([1, 0, 0], 2, 4)
+        assert counts.tolist() == [[1, 1], [2, 1], [2, 0]]
+
+    def test_20(self):
+        """
+        Test reading the values in range as CSR arrays.
+        """
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=3,
+                                 columns=4,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=[[1, 500, 3, 65535], [600, 700, 800, 900], [9, 9, 9, 9]],
+                                       source_ids=[1, 2, 3],
+                                       dest_ids=[1, 2, 3, 4])
+        row_starts, dest_locs, values = interface.get_values_in_range(100)
+        assert row_starts.tolist() == [0, 2, 2, 6]
+        assert dest_locs.tolist() == [0, 2, 0, 1, 2, 3]
+        assert values.tolist() == [1, 3, 9, 9, 9, 9]
+
+    def test_21(self):
+        """
+        Test indexing the pairs in range both ways.
+        """
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=True,
+                                 is_compressible=True,
+                                 rows=3,
+                                 columns=3,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=[[0, 4, 9], [0, 65535], [0]],
+                                       source_ids=[1, 2, 3],
+                                       dest_ids=[1, 2, 3])
+        source_starts, dest_locs, dest_starts, source_locs = interface.get_in_range_index(5)
+        assert source_starts.tolist() == [0, 2, 4, 5]
+        assert dest_locs.tolist() == [0, 1, 0, 1, 2]
+        assert dest_starts.tolist() == [0, 2, 4, 5]
+        assert source_locs.tolist() == [0, 1, 0, 1, 2]
+        assert interface.get_dests_in_range(5) == {1: [1, 2], 2: [1, 2], 3: [3]}
+        assert interface.get_sources_in_range(8) == {1: [1, 2], 2: [1, 2], 3: [3]}
+
+    def test_22(self):
+        """
+        Test counts, sums and populations in range for
+        several thresholds at once.
+        """
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=2,
+                                 columns=3,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=[[1, 5, 9], [65535, 3, 6]],
+                                       source_ids=[1, 2],
+                                       dest_ids=[3, 4, 5])
+        counts = interface.count_dests_in_range_for_thresholds([0, 1, 0], 2, [9, 0, 5])
+        assert counts.tolist() == [[[2, 0, 1], [1, 0, 1]],
+                                   [[1, 0, 0], [1, 0, 1]]]
+        assert counts.dtype == np.int64
+        sums = interface.sum_capacity_in_range_for_thresholds([0, 1, 0], [2, 4, 8], 2, [9, 0, 5])
+        assert sums.tolist() == [[[10, 0, 2], [4, 0, 4]],
+                                 [[8, 0, 0], [4, 0, 4]]]
+        populations = interface.sum_population_in_range_for_thresholds([10, 1], [9, 0, 5])
+        assert populations.tolist() == [[10, 0, 10], [11, 0, 11], [11, 0, 0]]
+
+    def test_23(self):
+        """
+        Test reading blocks of rows from dense, compressible,
+        sparse and lazily read matrices.
+        """
+        generator = np.random.RandomState(3)
+        undefined = np.iinfo(np.uint16).max
+        dense_values = generator.randint(0, 100, size=(30, 20))
+        dense_values[generator.rand(30, 20) < 0.3] = undefined
+        rows = 25
+        triangle = [generator.randint(0, 100, size=rows - row).tolist() for row in range(rows)]
+        symmetric_values = np.zeros((rows, rows), dtype=np.int64)
+        for row, values in enumerate(triangle):
+            symmetric_values[row, row:] = values
+            symmetric_values[row:, row] = values
+
+        for is_symmetric, is_sparse, expected in [(False, False, dense_values),
+                                                  (True, False, symmetric_values),
+                                                  (False, True, dense_values)]:
+            interface = MatrixInterface()
+            interface.prepare_matrix(is_symmetric=is_symmetric,
+                                     is_compressible=is_symmetric,
+                                     rows=expected.shape[0],
+                                     columns=expected.shape[1],
+                                     network_vertices=1,
+                                     is_sparse=is_sparse)
+            interface._set_mock_data_frame(dataset=triangle if is_symmetric else expected.tolist(),
+                                           source_ids=list(range(expected.shape[0])),
+                                           dest_ids=list(range(expected.shape[1])))
+            source_locs = [0, 7, expected.shape[0] - 1, 7]
+            assert np.array_equal(interface.get_value_rows(source_locs), expected[source_locs])
+            assert interface.get_value_rows([]).shape == (0, expected.shape[1])
+            if is_sparse:
+                continue
+            for compression_level in [None, 6]:
+                filename = self.datapath + "test_23_{}_{}.tmx".format(is_symmetric, compression_level)
+                interface.write_tmx(filename, compression_level=compression_level)
+                lazy = MatrixInterface()
+                lazy.read_file(filename, lazy=True, cache_blocks=1)
+                assert np.array_equal(lazy.get_value_rows(source_locs), expected[source_locs])
+
+    def test_24(self, monkeypatch):
+        """
+        Test compression_level raises a clear error, and
+        uncompressed writes still work, in an extension
+        built without zlib.
+        """
+        import _p2pExtension
+        monkeypatch.setattr(_p2pExtension, 'compressionAvailable', lambda: False)
+        interface = MatrixInterface()
+        interface.prepare_matrix(is_symmetric=False,
+                                 is_compressible=False,
+                                 rows=2,
+                                 columns=2,
+                                 network_vertices=1)
+        interface._set_mock_data_frame(dataset=[[1, 2], [3, 4]],
+                                       source_ids=[0, 1],
+                                       dest_ids=[0, 1])
+        try:
+            interface.write_tmx(self.datapath + "test_24.tmx", compression_level=6)
+            assert False
+        except WriteTMXFailedException as error:
+            assert 'zlib' in str(error)
+        try:
+            interface.write_csv(self.datapath + "test_24.csv.gz", compression_level=6)
+            assert False
+        except WriteCSVFailedException as error:
+            assert 'zlib' in str(error)
+        interface.write_tmx(self.datapath + "test_24.tmx")
+        interface.write_csv(self.datapath + "test_24.csv")
+
+    def test_25(self):
+        """
+        Tests throws UnexpectedShapeException for a sparse
+        compressible matrix.
+        """
+        interface = MatrixInterface()
+        try:
+            interface.prepare_matrix(is_symmetric=True, is_compressible=True,
+                                     rows=3, columns=3,
+                                     network_vertices=4, is_sparse=True)
+            assert False
+        except UnexpectedShapeException:
+            pass
@@ -779,4 +779,239 @@ class TestClass:
             coverage_model.transit_matrix)
         results = coverage_model.calculate(upper_threshold=700, normalize=True)
 
-        assert list(results.index) == [3, 4, 5, 6, 7, 8]
\ No newline at end of file
+        assert list(results.index) == [3, 4, 5, 6, 7, 8]
+
+    def test_33(self):
+        """
+        Test AccessModel reading a tmx, with weights used up and
+        unreachable dests.
+        """
+        from spatial_access.MatrixInterface import MatrixInterface
+        interface = MatrixInterface()
+        interface.secondary_ids_are_string = True
+        interface.prepare_matrix(False, False, 6, 6, 1)
+        dataset = [[100, 200, 300, 400, 500, 600],
+                   [600, 500, 400, 300, 200, 65535],
+                   [100, 100, 100, 100, 100, 100],
+                   [200, 200, 200, 200, 200, 200],
+                   [300, 300, 300, 300, 300, 300],
+                   [400, 400, 400, 400, 400, 400]]
+        interface._set_mock_data_frame(dataset, [3, 4, 5, 6, 7, 8],
+                                       ['place_a', 'place_b', 'place_c', 'place_d', 'place_e', 'place_f'])
+        filename = self.datapath + 'test_33.tmx'
+        interface.write_tmx(filename)
+
+        access_model = AccessModel('drive',
+                                   sources_filename='tests/test_data/sources_a.csv',
+                                   destinations_filename='tests/test_data/dests_b.csv',
+                                   source_column_names={'idx': 'name', 'lat': 'y', 'lon': 'x',
+                                                        'population': 'pop'},
+                                   dest_column_names={'idx': 'name', 'lat': 'y', 'lon': 'x',
+                                                      'capacity': 'capacity', 'category': 'cat'},
+                                   transit_matrix_filename=filename,
+                                   decay_function='linear')
+        category_weight_dict = {'A': [5, 4, 3, 2, 1],
+                                'D': [4, 3, 1],
+                                'C': [1]}
+        access_model.calculate(category_weight_dict=category_weight_dict, upper_threshold=700)
+        results = access_model.model_results
+
+        assert almost_equal(results.loc[3, 'C_score'], 6 / 7)
+        assert almost_equal(results.loc[3, 'D_score'], 20 / 7)
+        assert almost_equal(results.loc[3, 'A_score'], 38 / 7)
+        assert almost_equal(results.loc[3, 'all_categories_score'], 64 / 7)
+        assert almost_equal(results.loc[4, 'C_score'], 1 / 7)
+        assert almost_equal(results.loc[4, 'D_score'], 8 / 7)
+        assert almost_equal(results.loc[4, 'A_score'], 50 / 7)
+        assert almost_equal(results.loc[4, 'all_categories_score'], 59 / 7)
+        assert almost_equal(results.loc[5, 'all_categories_score'], 102 / 7)
+
+    def test_34(self):
+        """
+        Test TSFCA and Coverage with and without distance
+        decay, reading a tmx.
+        """
+        from spatial_access.MatrixInterface import MatrixInterface
+        interface = MatrixInterface()
+        interface.secondary_ids_are_string = True
+        interface.prepare_matrix(False, False, 6, 6, 1)
+        unreachable = [65535] * 4
+        dataset = [[0, 350] + unreachable,
+                   [350, 0] + unreachable] + [[65535] * 6] * 4
+        interface._set_mock_data_frame(dataset, [3, 4, 5, 6, 7, 8],
+                                       ['place_a', 'place_b', 'place_c', 'place_d', 'place_e', 'place_f'])
+        filename = self.datapath + 'test_34.tmx'
+        interface.write_tmx(filename)
+        model_args = {'sources_filename': 'tests/test_data/sources_a.csv',
+                      'destinations_filename': 'tests/test_data/dests_b.csv',
+                      'source_column_names': {'idx': 'name', 'lat': 'y', 'lon': 'x', 'population': 'pop'},
+                      'dest_column_names': {'idx': 'name', 'lat': 'y', 'lon': 'x',
+                                            'capacity': 'capacity', 'category': 'cat'},
+                      'transit_matrix_filename': filename}
+
+        tsfca_model = TSFCA('drive', **model_args)
+        tsfca_model.calculate(upper_threshold=700)
+        results = tsfca_model.model_results
+        assert almost_equal(results.loc[3, 'tsfca_C'], 5 / 76)
+        assert almost_equal(results.loc[3, 'tsfca_D'], 46 / 76)
+        assert almost_equal(results.loc[4, 'tsfca_all_categories'], 51 / 76)
+        assert results.loc[5, 'tsfca_all_categories'] == 0
+
+        # sources 350 seconds away count for half under linear decay
+        tsfca_model.calculate(upper_threshold=700, decay_function='linear')
+        results = tsfca_model.model_results
+        assert almost_equal(results.loc[3, 'tsfca_C'], 5 / 60.5)
+        assert almost_equal(results.loc[3, 'tsfca_D'], 0.5 * 46 / 53.5)
+        assert almost_equal(results.loc[4, 'tsfca_C'], 0.5 * 5 / 60.5)
+        assert almost_equal(results.loc[4, 'tsfca_D'], 46 / 53.5)
+        assert results.loc[3, 'tsfca_A'] == 0
+
+        coverage_model = Coverage('drive', **model_args)
+        coverage_model.calculate(upper_threshold=700)
+        results = coverage_model.model_results
+        assert results.loc['place_a', 'service_pop'] == 76
+        assert almost_equal(results.loc['place_b', 'percap_spending'], 46 / 76)
+        assert results.loc['place_c', 'service_pop'] == 0
+        assert results.loc['place_c', 'percap_spending'] == 0
+
+        coverage_model.calculate(upper_threshold=700, decay_function='linear')
+        results = coverage_model.model_results
+        assert almost_equal(results.loc['place_a', 'service_pop'], 60.5)
+        assert almost_equal(results.loc['place_a', 'percap_spending'], 5 / 60.5)
+        assert results.loc['place_f', 'category'] == 'C'
+
+    def test_35(self):
+        """
+        Test AccessCount, AccessSum and Coverage for several
+        thresholds at once, reading a tmx.
+        """
+        from spatial_access.MatrixInterface import MatrixInterface
+        interface = MatrixInterface()
+        interface.secondary_ids_are_string = True
+        interface.prepare_matrix(False, False, 6, 6, 1)
+        unreachable = [65535] * 4
+        dataset = [[0, 350] + unreachable,
+                   [350, 0] + unreachable] + [[65535] * 6] * 4
+        interface._set_mock_data_frame(dataset, [3, 4, 5, 6, 7, 8],
+                                       ['place_a', 'place_b', 'place_c', 'place_d', 'place_e', 'place_f'])
+        filename = self.datapath + 'test_35.tmx'
+        interface.write_tmx(filename)
+        model_args = {'sources_filename': 'tests/test_data/sources_a.csv',
+                      'destinations_filename': 'tests/test_data/dests_b.csv',
+                      'source_column_names': {'idx': 'name', 'lat': 'y', 'lon': 'x', 'population': 'pop'},
+                      'dest_column_names': {'idx': 'name', 'lat': 'y', 'lon': 'x',
+                                            'capacity': 'capacity', 'category': 'cat'},
+                      'transit_matrix_filename': filename}
+
+        for model_type, column in [(AccessCount, 'count_in_range_all_categories'),
+                                   (AccessSum, 'sum_in_range_all_categories')]:
+            model = model_type('drive', **model_args)
+            results = model.calculate_for_thresholds([300, 700])
+            assert list(results.columns[:2]) == ['id', 'threshold']
+            for threshold in [300, 700]:
+                model.calculate(upper_threshold=threshold)
+                threshold_results = results[results['threshold'] == threshold].set_index('id')
+                assert threshold_results[column].to_dict() == model.model_results[column].to_dict()
+
+        coverage_model = Coverage('drive', **model_args)
+        results = coverage_model.calculate_for_thresholds([300, 700]).set_index(['id', 'threshold'])
+        assert results.loc[('place_a', 300), 'service_pop'] == 45
+        assert results.loc[('place_a', 700), 'service_pop'] == 76
+        assert almost_equal(results.loc[('place_b', 300), 'percap_spending'], 46 / 31)
+        assert results.loc[('place_c', 700), 'service_pop'] == 0
+        assert results.loc[('place_f', 300), 'category'] == 'C'
+
+    def _write_matrix_missing_source_and_dest(self, filename):
+        """
+        Write a tmx of sources 3 to 7 and dests place_a to place_e
+        of the test data, leaving out source 8 and dest place_f.
+        """
+        from spatial_access.MatrixInterface import MatrixInterface
+        interface = MatrixInterface()
+        interface.secondary_ids_are_string = True
+        interface.prepare_matrix(False, False, 5, 5, 1)
+        unreachable = [65535] * 3
+        dataset = [[0, 350] + unreachable,
+                   [350, 0] + unreachable] + [[65535] * 5] * 3
+        interface._set_mock_data_frame(dataset, [3, 4, 5, 6, 7],
+                                       ['place_a', 'place_b', 'place_c', 'place_d', 'place_e'])
+        interface.write_tmx(filename)
+
+    def test_36(self, caplog):
+        """
+        Test AccessSum scores sources missing from the transit
+        matrix 0 with a warning, and keeps all zero columns int.
+        """
+        import numpy as np
+        import pandas as pd
+        filename = self.datapath + 'test_36.tmx'
+        self._write_matrix_missing_source_and_dest(filename)
+        dests_filename = self.datapath + 'test_36_dests.csv'
+        dests = pd.read_csv('tests/test_data/dests_b.csv')
+        dests['capacity'] = dests['capacity'] + 0.5
+        dests.to_csv(dests_filename, index=False)
+        model = AccessSum('drive',
+                          sources_filename='tests/test_data/sources_a.csv',
+                          destinations_filename=dests_filename,
+                          source_column_names={'idx': 'name', 'lat': 'y', 'lon': 'x', 'population': 'pop'},
+                          dest_column_names={'idx': 'name', 'lat': 'y', 'lon': 'x',
+                                             'capacity': 'capacity', 'category': 'cat'},
+                          transit_matrix_filename=filename)
+        caplog.clear()
+        model.calculate(upper_threshold=700)
+        results = model.model_results
+        assert 'source' in caplog.text and '{8}' in caplog.text
+        assert results.loc[3, 'sum_in_range_C'] == 5.5
+        assert results.loc[3, 'sum_in_range_D'] == 46.5
+        assert (results.loc[8] == 0).all()
+        assert results['sum_in_range_A'].dtype == np.int64
+        assert results['sum_in_range_C'].dtype == np.float64
+
+    def test_37(self, caplog):
+        """
+        Test TSFCA and Coverage score sources and dests missing
+        from the transit matrix 0 with a warning, and keep all
+        zero columns int.
+        """
+        import numpy as np
+        filename = self.datapath + 'test_37.tmx'
+        self._write_matrix_missing_source_and_dest(filename)
+        source_column_names = {'idx': 'name', 'lat': 'y', 'lon': 'x', 'population': 'pop'}
+        dest_column_names = {'idx': 'name', 'lat': 'y', 'lon': 'x', 'capacity': 'capacity', 'category': 'cat'}
+        model = TSFCA('drive',
+                      sources_filename='tests/test_data/sources_a.csv',
+                      destinations_filename='tests/test_data/dests_b.csv',
+                      source_column_names=source_column_names,
+                      dest_column_names=dest_column_names,
+                      transit_matrix_filename=filename)
+        caplog.clear()
+        model.calculate(upper_threshold=700)
+        results = model.model_results
+        assert '{8}' in caplog.text and "{'place_f'}" in caplog.text
+        assert almost_equal(results.loc[3, 'tsfca_C'], 5 / 76)
+        assert almost_equal(results.loc[4, 'tsfca_D'], 46 / 76)
+        assert (results.loc[8] == 0).all()
+        assert results['tsfca_A'].dtype == np.int64
+        assert results['tsfca_C'].dtype == np.float64
+
+        model = Coverage('drive',
+                         sources_filename='tests/test_data/sources_a.csv',
+                         destinations_filename='tests/test_data/dests_b.csv',
+                         source_column_names=source_column_names,
+                         dest_column_names=dest_column_names,
+                         transit_matrix_filename=filename)
+        caplog.clear()
+        model.calculate(upper_threshold=700)
+        results = model.model_results
+        assert "{'place_f'}" in caplog.text
+        assert results.loc['place_a', 'service_pop'] == 76
+        assert almost_equal(results.loc['place_a', 'percap_spending'], 5 / 76)
+        assert results.loc['place_f', 'service_pop'] == 0
+        assert results.loc['place_f', 'percap_spending'] == 0
+
+        model.set_focus_categories(['A'])
+        model.calculate(upper_threshold=700)
+        results = model.model_results
+        assert (results['service_pop'] == 0).all()
+        assert results['service_pop'].dtype == np.int64
+        assert results['percap_spending'].dtype == np.int64
@@ -1,3 +1,4 @@
+import numpy as np
 from spatial_access.p2p import TransitMatrix
 from spatial_access.Configs import Configs
 
@@ -375,3 +376,18 @@ class TestClass:
             assert False
         except UnrecognizedFileTypeException:
             return
+
+    def test_30(self):
+        """
+        Test the vectorized snapping distance agrees with
+        the geodesic distance to within a fraction of a percent.
+        """
+        from geopy import distance
+        lon_a = np.array([-87.6298, -87.6298, 2.3522])
+        lat_a = np.array([41.8781, 41.8781, 48.8566])
+        lon_b = np.array([-87.6310, -87.6298, 2.3600])
+        lat_b = np.array([41.8790, 41.8781, 48.8500])
+        distances = TransitMatrix._haversine_distance(lon_a, lat_a, lon_b, lat_b)
+        for i in range(3):
+            expected = distance.distance((lat_a[i], lon_a[i]), (lat_b[i], lon_b[i])).m
+            assert abs(distances[i] - expected) <= 0.005 * expected
@@ -1,4 +1,5 @@
 import _p2pExtension
+import numpy as np
 
 
 class TestClass:
@@ -35,6 +36,7 @@ class TestClass:
                                 dest_is_string, is_extended=False):
         # prep input data
         edges = TestClass.symmetric_edges if use_symmetric_edges else TestClass.asymmetric_edges
+        edges = [list(column) for column in edges]
         source_data = TestClass.source_data_int
         dest_data = TestClass.source_data_int if is_symmetric else TestClass.dest_data_int
         if source_is_string:
@@ -472,3 +474,184 @@ class TestClass:
         matrix3.readCSV(filename_csv.encode('utf-8'))
         matrix3.printDataFrame()
 
+
+    def test_8(self):
+        """
+        Test computing with a maximum impedance.
+        """
+        matrix = self._prepare_transit_matrix(use_symmetric_edges=False,
+                                              is_compressible=False,
+                                              is_symmetric=False,
+                                              source_is_string=False,
+                                              dest_is_string=False)
+        matrix.compute(1, 10)
+        undefined = 65535
+
+        assert matrix.getValuesBySource(10, False) == [(21, 9), (20, undefined)]
+
+        assert matrix.getValuesBySource(12, False) == [(21, undefined), (20, 9)]
+
+        assert matrix.getDestsInRange(12)[10] == [21]
+
+    def test_9(self):
+        """
+        Test searches stop once all destination nodes are settled.
+        """
+        matrix = self._prepare_transit_matrix(use_symmetric_edges=False,
+                                              is_compressible=False,
+                                              is_symmetric=False,
+                                              source_is_string=False,
+                                              dest_is_string=False)
+        matrix.compute(1)
+
+        settled_vertex_counts = dict(zip(matrix.getRowIds(), matrix.getSettledVertexCounts()))
+
+        assert settled_vertex_counts[10] == 4
+        assert settled_vertex_counts[12] == 3
+        assert matrix.getValuesBySource(12, False) == [(21, 16), (20, 9)]
+
+    def test_10(self):
+        """
+        Test adding edges from numpy columns.
+        """
+        matrix = _p2pExtension.pyTransitMatrixIxIxUS(isCompressible=False,
+                                                     isSymmetric=False,
+                                                     rows=1,
+                                                     columns=2)
+        matrix.prepareGraphWithVertices(3)
+        matrix.addEdgesToGraph(np.array([1, 1], dtype=np.uint64),
+                               np.array([2, 0], dtype=np.uint64),
+                               np.array([4, 9], dtype=np.uint16),
+                               np.array([True, False]))
+        matrix.addToUserSourceDataContainer(2, 10, 1)
+        matrix.addToUserDestDataContainer(1, 20, 1)
+        matrix.addToUserDestDataContainer(0, 21, 1)
+        matrix.compute(1)
+        assert matrix.getValuesBySource(10, True) == [(20, 6), (21, 15)]
+
+        try:
+            matrix.addEdgesToGraph(np.array([0]), np.array([1, 2]), np.array([1]), np.array([True]))
+            assert False
+        except ValueError:
+            pass
+
+    def test_11(self):
+        """
+        Test batched searches give the same matrix as searching
+        one source at a time.
+        """
+        for max_impedance in [None, 10]:
+            single = self._prepare_transit_matrix(use_symmetric_edges=False,
+                                                  is_compressible=False,
+                                                  is_symmetric=False,
+                                                  source_is_string=False,
+                                                  dest_is_string=False)
+            single.compute(1, max_impedance)
+            batched = self._prepare_transit_matrix(use_symmetric_edges=False,
+                                                   is_compressible=False,
+                                                   is_symmetric=False,
+                                                   source_is_string=False,
+                                                   dest_is_string=False)
+            batched.setSearchBatchSize(4)
+            batched.compute(1, max_impedance)
+            for source_id in single.getRowIds():
+                assert batched.getValuesBySource(source_id, True) == single.getValuesBySource(source_id, True)
+
+        try:
+            batched.setSearchBatchSize(33)
+            assert False
+        except RuntimeError:
+            pass
+
+    def _prepare_random_transit_matrix(self, seed, vertices, num_edges, num_points, min_weight=1):
+        generator = np.random.RandomState(seed)
+        matrix = _p2pExtension.pyTransitMatrixIxIxUS(isCompressible=False,
+                                                     isSymmetric=False,
+                                                     rows=num_points,
+                                                     columns=num_points)
+        matrix.prepareGraphWithVertices(vertices)
+        matrix.addEdgesToGraph(generator.randint(0, vertices, num_edges).astype(np.uint64),
+                               generator.randint(0, vertices, num_edges).astype(np.uint64),
+                               generator.randint(min_weight, 50, num_edges).astype(np.uint16),
+                               generator.rand(num_edges) < 0.7)
+        for point in range(num_points):
+            matrix.addToUserSourceDataContainer(int(generator.randint(0, vertices)), point, 1)
+            matrix.addToUserDestDataContainer(int(generator.randint(0, vertices)), point, 1)
+        return matrix
+
+    def test_12(self):
+        """
+        Test queries on a contraction hierarchy give the same
+        matrix as searching the graph, and that hierarchies
+        round trip through a file.
+        """
+        filename = self.datapath + 'test_12.ch'
+        for max_impedance in [None, 40]:
+            expected = self._prepare_random_transit_matrix(1, 300, 900, 40)
+            expected.compute(1, max_impedance)
+            actual = self._prepare_random_transit_matrix(1, 300, 900, 40)
+            assert not actual.hasContractionHierarchy()
+            actual.buildContractionHierarchy()
+            assert actual.hasContractionHierarchy()
+            actual.compute(1, max_impedance)
+            assert np.array_equal(np.asarray(actual), np.asarray(expected))
+
+        actual.writeContractionHierarchy(filename.encode('utf-8'))
+        reread = self._prepare_random_transit_matrix(1, 300, 900, 40)
+        reread.readContractionHierarchy(filename.encode('utf-8'))
+        assert reread.getNumShortcuts() == actual.getNumShortcuts()
+        reread.compute(1)
+        expected.compute(1)
+        assert np.array_equal(np.asarray(reread), np.asarray(expected))
+
+        other_graph = self._prepare_random_transit_matrix(2, 300, 900, 40)
+        assert other_graph.getGraphChecksum() != reread.getGraphChecksum()
+        try:
+            other_graph.readContractionHierarchy(filename.encode('utf-8'))
+            assert False
+        except RuntimeError:
+            pass
+
+    def test_13(self):
+        """
+        Test queries on a contraction hierarchy of a graph
+        with zero weight edges give the same matrix as
+        searching the graph.
+        """
+        for build_hierarchy in [False, True]:
+            matrix = _p2pExtension.pyTransitMatrixIxIxUS(isCompressible=False,
+                                                         isSymmetric=False,
+                                                         rows=1,
+                                                         columns=1)
+            matrix.prepareGraphWithVertices(3)
+            matrix.addEdgesToGraph(np.array([0, 1], dtype=np.uint64), np.array([1, 2], dtype=np.uint64),
+                                   np.array([0, 0], dtype=np.uint16), np.array([False, False]))
+            matrix.addToUserSourceDataContainer(0, 10, 0)
+            matrix.addToUserDestDataContainer(2, 20, 2)
+            if build_hierarchy:
+                matrix.buildContractionHierarchy()
+            matrix.compute(1)
+            assert matrix.getValuesBySource(10, False) == [(20, 2)]
+
+        expected = self._prepare_random_transit_matrix(4, 300, 900, 40, min_weight=0)
+        expected.compute(1)
+        actual = self._prepare_random_transit_matrix(4, 300, 900, 40, min_weight=0)
+        actual.buildContractionHierarchy()
+        actual.compute(1)
+        assert np.array_equal(np.asarray(actual), np.asarray(expected))
+
+    def test_14(self):
+        """
+        Test many threads claiming chunks of sources give the same
+        matrix as one thread, and report their busy and idle time.
+        """
+        expected = self._prepare_random_transit_matrix(3, 300, 900, 200)
+        expected.compute(1)
+        for search_batch_size in [1, 4]:
+            actual = self._prepare_random_transit_matrix(3, 300, 900, 200)
+            actual.setSearchBatchSize(search_batch_size)
+            actual.compute(4)
+            assert np.array_equal(np.asarray(actual), np.asarray(expected))
+            assert len(actual.getThreadBusySeconds()) == 4
+            assert len(actual.getThreadIdleSeconds()) == 4
+            assert min(actual.getThreadIdleSeconds()) >= 0